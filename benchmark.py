@@ -0,0 +1,308 @@
+"""Time the lambda_function on mock events under different settings.
+Like tester.py, this script is meant to be run in the docker container created by
+build-and-debug.sh, where /var/task holds the built function.
+
+    python benchmark.py intermediates [--repeat N] [--events mock_events/...json ...]
+    python benchmark.py profiles [--repeat N] [--profiles NAME ...] [--events ...]
+    python benchmark.py encoding [--repeat N] [--events ...]
+    python benchmark.py sparse [--repeat N] [--cog populated_snowmelt.tif]
+    python benchmark.py tiles [--repeat N] [--workers 1 2 4 ...]
+    python benchmark.py reproject [--repeat N] [--cog snodas_swe.tif]
+
+intermediates: run each event with intermediates on disk and in /vsimem/; reports
+wall time and the high-water mark of scratch bytes held on disk and in memory.
+profiles: run each event under each GDAL profile (geoprocess.core.profiles); reports wall time.
+encoding: process each event once, then rewrite every product with each candidate encoding
+(geoprocess.core.encoding); reports size, encode and decode time against the current setting.
+CUMULUS_MOCK_S3_UPLOAD=TRUE is needed so the products are left in /tmp.
+sparse: write SNODAS-sized grids that are populated, all 0 and all nodata to COG, with and
+without sparse tiles; reports time and COG size for empty versus populated days.
+tiles: compute cold content and fill nodata on a synthetic 8192 x 4096 (unmasked SNODAS,
+CONUS) grid with each number of tile workers (geoprocess.core.tiles); reports time and
+speedup over the first worker count (default 1).
+reproject: warp a SNODAS grid to the SHG 1000 m zonal statistics grid with gdalwarp, then
+with a reprojection index (geoprocess.core.reproject) built once and applied again.
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(1, '/var/task/python/lambda')
+import lambda_function
+from cumulus.geoprocess.core import encoding as gdal_encoding
+from cumulus.geoprocess.core import profiles as gdal_profiles
+from cumulus.geoprocess.core import tiles as gdal_tiles
+from cumulus.handyutils.core import scratch
+
+EVENTS = [
+    'mock_events/nohrsc_snodas_unmasked.json',
+    'mock_events/ncep_mrms_gaugecorr_qpe_01h.json',
+    'mock_events/ncep_mrms_v12_MultiSensor_QPE_01H_Pass1.json',
+    'mock_events/ncep_mrms_v12_MultiSensor_QPE_01H_Pass2.json',
+]
+
+
+def load_event(path):
+
+    with open(path, 'r') as json_file:
+        message = json.load(json_file)
+    # Process every run; the ingest ledger would skip objects already seen
+    message['force'] = True
+
+    return message
+
+
+def run(message):
+    """Run the handler once; returns (seconds, disk high-water bytes, /vsimem/ high-water bytes)"""
+
+    scratch.VSIMEM_USAGE.reset()
+    start = time.perf_counter()
+    lambda_function.lambda_handler(message)
+    elapsed = time.perf_counter() - start
+
+    return elapsed, scratch.USAGE.high_water, scratch.VSIMEM_USAGE.high_water
+
+
+def intermediates(args):
+
+    print(f'{"event":<60} {"mode":<7} {"median s":>9} {"disk MB":>9} {"vsimem MB":>10}')
+    for path in args.events:
+        message = load_event(path)
+        for mode in ('disk', 'memory'):
+            scratch.set_intermediates(mode, args.budget)
+            results = [run(message) for _ in range(args.repeat)]
+            print(
+                f'{path:<60} {mode:<7} {statistics.median(r[0] for r in results):>9.2f} '
+                f'{max(r[1] for r in results) / 1024 ** 2:>9.1f} {max(r[2] for r in results) / 1024 ** 2:>10.1f}'
+            )
+
+
+def profiles(args):
+
+    print(f'{"event":<60} {"profile":<20} {"median s":>9} {"min s":>9}')
+    for path in args.events:
+        message = load_event(path)
+        for name in args.profiles:
+            gdal_profiles.set_override(name)
+            seconds = [run(message)[0] for _ in range(args.repeat)]
+            print(f'{path:<60} {name:<20} {statistics.median(seconds):>9.2f} {min(seconds):>9.2f}')
+    gdal_profiles.set_override(None)
+
+
+def encoding(args):
+
+    from osgeo import gdal
+
+    print(f'{"filetype":<45} {"encoding":<24} {"MB":>8} {"ratio":>6} {"encode s":>9} {"decode s":>9}')
+    for path in args.events:
+        result = lambda_function.lambda_handler(load_event(path))
+        for productfile in result['productfiles']:
+            filetype = productfile['file'].split('/')[1]
+            # Mock uploads are linked into /tmp
+            cog = os.path.join('/tmp', os.path.basename(productfile['file']))
+
+            ds = gdal.Open(cog)
+            is_float = gdal.GetDataTypeName(ds.GetRasterBand(1).DataType).startswith('Float')
+            ds = None
+
+            encodings = gdal_encoding.candidates(3 if is_float else 2)
+            if not is_float:
+                # LERC max error is meant for float grids
+                encodings = {k: v for k, v in encodings.items() if not k.startswith('lerc')}
+            encodings['current'] = gdal_encoding.encoding_for(filetype)
+
+            baseline = None
+            for name, _encoding in encodings.items():
+                m = gdal_encoding.measure(cog, _encoding, repeat=args.repeat)
+                baseline = baseline or m['bytes']
+                print(
+                    f'{filetype:<45} {name:<24} {m["bytes"] / 1024 ** 2:>8.2f} {m["bytes"] / baseline:>6.2f} '
+                    f'{m["encode_seconds"]:>9.3f} {m["decode_seconds"]:>9.3f}'
+                )
+
+
+def sparse(args):
+
+    import numpy as np
+    from osgeo import gdal
+    from cumulus.geoprocess.core.base import Grid, read_grid
+    from cumulus.snodas.core.process import SNODAS_NODATA, grid_to_cog, snodas_projection
+
+    if args.cog:
+        populated = read_grid(args.cog, 'float32')
+    else:
+        # Smooth field over part of the grid, like a winter snowmelt grid
+        y, x = np.mgrid[0:4096, 0:8192].astype('float32')
+        array = np.maximum(0, np.sin(x / 400) * np.cos(y / 300) * 50)
+        array[:, :1000] = SNODAS_NODATA
+        populated = Grid(array, (-124.73, 0.00833, 0, 52.87, 0, -0.00833), snodas_projection(), SNODAS_NODATA)
+
+    grids = {
+        'populated': populated,
+        'zero': populated._replace(array=np.where(populated.array == SNODAS_NODATA, SNODAS_NODATA, 0).astype('float32')),
+        'nodata': populated._replace(array=np.full(populated.array.shape, SNODAS_NODATA, dtype='float32')),
+    }
+    dense = gdal_encoding.encoding_for('nohrsc_snodas_snowmelt')._replace(sparse=False)
+    encodings = {'dense': dense, 'sparse': dense._replace(sparse=True)}
+
+    print(f'{"grid":<10} {"encoding":<8} {"median s":>9} {"MB":>8}')
+    for name, grid in grids.items():
+        for encoding_name, _encoding in encodings.items():
+            seconds = []
+            with tempfile.TemporaryDirectory() as td:
+                for i in range(args.repeat):
+                    cog = os.path.join(td, f'{name}_{i}.tif')
+                    with scratch.ScratchSpace(td) as _scratch:
+                        start = time.perf_counter()
+                        grid_to_cog(grid, cog, gdal.GDT_Float32, _scratch, encoding=_encoding)
+                        seconds.append(time.perf_counter() - start)
+                size = os.path.getsize(cog)
+            print(f'{name:<10} {encoding_name:<8} {statistics.median(seconds):>9.2f} {size / 1024 ** 2:>8.2f}')
+
+
+def tiles(args):
+
+    import numpy as np
+    from osgeo import gdal
+    from cumulus.geoprocess.core.base import Grid, write_grid
+    from cumulus.snodas.core.process import SNODAS_NODATA, snodas_coldcontent_array, snodas_projection
+
+    # Snowpack over the northern half, colder to the north; nodata along the west edge
+    y, x = np.mgrid[0:4096, 0:8192]
+    swe = np.where(y < 2048, (np.sin(x / 300) + 1) * 400, 0).astype('int16')
+    snowtemp = (273 - (2048 - y) / 100).astype('int16')
+    swe[:, :500] = snowtemp[:, :500] = SNODAS_NODATA
+
+    # Scattered holes to fill
+    holes = np.where(np.random.RandomState(0).random_sample(swe.shape) < 0.05, SNODAS_NODATA, swe)
+
+    with tempfile.TemporaryDirectory() as td:
+        infile = os.path.join(td, 'holes.tif')
+        grid = Grid(holes, (-130.52, 0.00833, 0, 58.23, 0, -0.00833), snodas_projection(), SNODAS_NODATA)
+        write_grid(grid, infile, gdal.GDT_Int16)
+
+        tasks = {
+            'coldcontent': lambda: snodas_coldcontent_array(snowtemp, swe, SNODAS_NODATA),
+            'fill_nodata': lambda: gdal_tiles.fill_nodata_tiled(infile, os.path.join(td, 'filled.tif')),
+        }
+
+        print(f'{"task":<12} {"workers":>7} {"median s":>9} {"speedup":>8}')
+        for name, task in tasks.items():
+            baseline = None
+            for workers in args.workers:
+                gdal_tiles.set_workers(workers)
+                seconds = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    task()
+                    seconds.append(time.perf_counter() - start)
+                median = statistics.median(seconds)
+                baseline = baseline or median
+                print(f'{name:<12} {workers:>7} {median:>9.2f} {baseline / median:>8.2f}')
+    gdal_tiles.set_workers(None)
+
+
+def reproject(args):
+
+    import numpy as np
+    from osgeo import gdal
+    from cumulus.geoprocess.core import reproject as gdal_reproject
+    from cumulus.geoprocess.core.base import Grid, write_grid
+    from cumulus.geoprocess.core.helpers import buffered_extent
+    from cumulus.snodas.core.process import SNODAS_NODATA, snodas_projection
+
+    # zstats_generic() target: SHG 1000 m over the Missouri River basin
+    extent = buffered_extent([-1394000, 1552000, 510000, 3044000], 2, 2000)
+    target = gdal_reproject.Target(extent, 1000)
+
+    def timed(fn):
+        seconds = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            fn()
+            seconds.append(time.perf_counter() - start)
+        return statistics.median(seconds)
+
+    with tempfile.TemporaryDirectory() as td:
+        infile = args.cog
+        if infile is None:
+            y, x = np.mgrid[0:4096, 0:8192].astype('float32')
+            infile = os.path.join(td, 'snodas.tif')
+            write_grid(
+                Grid(np.maximum(0, np.sin(x / 400) * np.cos(y / 300) * 500), (-130.52, 0.00833, 0, 58.23, 0, -0.00833),
+                     snodas_projection(), SNODAS_NODATA),
+                infile, gdal.GDT_Float32
+            )
+
+        warp_args = [
+            '-t_srs', target.srs, '-r', 'bilinear', '-te', *extent, '-te_srs', target.srs, '-tr', '1000', '1000',
+        ]
+        results = {
+            'gdalwarp': timed(lambda: gdal.Warp(os.path.join(td, 'warped.tif'), infile, options=[str(a) for a in warp_args])),
+        }
+
+        gdal_reproject._INDEXES.clear()
+        cache = os.path.join(td, 'cache')
+        start = time.perf_counter()
+        gdal_reproject.warp(infile, target, cache_dir=cache)
+        results['index build + apply'] = time.perf_counter() - start
+
+        gdal_reproject._INDEXES.clear()
+        results['index from disk + apply'] = timed(
+            lambda: (gdal_reproject._INDEXES.clear(), gdal_reproject.warp(infile, target, cache_dir=cache))
+        )
+        results['index in memory + apply'] = timed(lambda: gdal_reproject.warp(infile, target, cache_dir=cache))
+
+    print(f'{"method":<26} {"median s":>9}')
+    for name, seconds in results.items():
+        print(f'{name:<26} {seconds:>9.3f}')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the lambda_function on mock events')
+    parser.add_argument('--log-level', default='WARNING')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('intermediates', help='Intermediates on disk vs in /vsimem/')
+    p.add_argument('--events', nargs='+', default=EVENTS)
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--budget', type=int, default=None, help='/vsimem/ budget in bytes (default CUMULUS_VSIMEM_BUDGET)')
+    p.set_defaults(func=intermediates)
+
+    p = subparsers.add_parser('profiles', help='GDAL configuration profiles')
+    p.add_argument('--events', nargs='+', default=EVENTS)
+    p.add_argument('--profiles', nargs='+', default=list(gdal_profiles.PROFILES), choices=list(gdal_profiles.PROFILES))
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=profiles)
+
+    p = subparsers.add_parser('encoding', help='Compression codecs and predictors per product')
+    p.add_argument('--events', nargs='+', default=EVENTS)
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=encoding)
+
+    p = subparsers.add_parser('sparse', help='Empty versus populated grids, with and without sparse tiles')
+    p.add_argument('--cog', default=None, help='A populated float grid to use instead of a synthetic one')
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=sparse)
+
+    p = subparsers.add_parser('tiles', help='Scaling of tiled raster operations with worker threads')
+    p.add_argument('--workers', nargs='+', type=int, default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=tiles)
+
+    p = subparsers.add_parser('reproject', help='gdalwarp versus a cached reprojection index')
+    p.add_argument('--cog', default=None, help='A SNODAS grid to use instead of a synthetic one')
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=reproject)
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level)
+    args.func(args)
@@ -0,0 +1,164 @@
+"""NumPy helpers for grids; no GDAL
+
+Grids such as summer SNODAS snowmelt or a dry MRMS hour are nearly all zero or
+nodata. constant_value() detects a grid that is one value everywhere, and
+sparse_apply() runs arithmetic only in the BLOCKSIZE blocks that have any cell
+needing it.
+
+array_statistics() gives the band statistics GDAL's GetStatistics() would compute,
+from an array already in memory rather than by decoding the file just written.
+
+Quantization stores a float grid as 16-bit integer codes with a scale and offset
+
+    value = code * scale + offset
+
+which GDAL keeps as band metadata (GetScale/GetOffset) and readers such as
+gdal_translate -unscale or rasterio's scales/offsets apply. <step> is the declared
+precision of a product; every value is within step / 2 of the original.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+# Matches the GeoTIFF tile size, so skipped blocks line up with sparse tiles
+BLOCKSIZE = 256
+
+# Integer codes with scale/offset to apply, and the code written for nodata
+Quantized = namedtuple('Quantized', ['array', 'scale', 'offset', 'nodata'])
+
+
+def valid_mask(array, nodata):
+    """True where <array> holds data (not <nodata> and not NaN)"""
+
+    valid = ~np.isnan(array) if np.issubdtype(array.dtype, np.floating) else np.ones(array.shape, dtype=bool)
+    if nodata is not None:
+        valid &= array != nodata
+
+    return valid
+
+
+def constant_value(array):
+    """The value of every cell of <array> if they are all the same (NaN counts as a value), else None"""
+
+    if not array.size:
+        return None
+
+    first = array.flat[0]
+    if np.issubdtype(array.dtype, np.floating) and np.isnan(first):
+        return first if np.isnan(array).all() else None
+
+    lo, hi = array.min(), array.max()
+
+    return first if lo == hi == first else None
+
+
+def active_blocks(active, blocksize=BLOCKSIZE):
+    """(row slice, column slice) of each <blocksize> block of boolean <active> with any True cell"""
+
+    rows, cols = active.shape
+    if not rows or not cols:
+        return []
+
+    # Any True per block; reduceat over block starts along each axis
+    blocks = np.logical_or.reduceat(active, np.arange(0, rows, blocksize), axis=0)
+    blocks = np.logical_or.reduceat(blocks, np.arange(0, cols, blocksize), axis=1)
+
+    return [
+        (slice(by * blocksize, (by + 1) * blocksize), slice(bx * blocksize, (bx + 1) * blocksize))
+        for by, bx in zip(*np.nonzero(blocks))
+    ]
+
+
+def sparse_apply(fn, out, active, *arrays, blocksize=BLOCKSIZE):
+    """out[block] = fn(*(a[block] for a in arrays)) for each active_blocks() block; returns <out>
+
+    <out> is prefilled by the caller with the result for every cell that is not <active>
+    (e.g. nodata and 0), so blocks with no active cell are never computed.
+    """
+
+    for window in active_blocks(active, blocksize):
+        out[window] = fn(*(a[window] for a in arrays))
+
+    return out
+
+
+def array_statistics(array, nodata, bins=None):
+    """Statistics of the valid cells of <array>, as GDAL computes them (population stddev)
+
+    Returns {'count', 'min', 'max', 'mean', 'stddev'}; values are None if no cell is valid.
+    With <bins>, also 'histogram': {'min', 'max', 'counts'} of <bins> equal buckets over min..max
+    """
+
+    values = array[valid_mask(array, nodata)]
+
+    stats = {'count': int(values.size), 'min': None, 'max': None, 'mean': None, 'stddev': None}
+    if not values.size:
+        return stats
+
+    stats['min'], stats['max'] = float(values.min()), float(values.max())
+    stats['mean'] = float(values.mean(dtype=np.float64))
+    stats['stddev'] = float(values.std(dtype=np.float64))
+
+    if bins:
+        counts, _ = np.histogram(values, bins=bins, range=(stats['min'], stats['max']))
+        stats['histogram'] = {'min': stats['min'], 'max': stats['max'], 'counts': counts.tolist()}
+
+    return stats
+
+
+def unscale_statistics(stats, scale, offset):
+    """array_statistics() of integer codes, in the units of the values they stand for"""
+
+    stats = dict(stats)
+    if stats['count']:
+        for k in ('min', 'max', 'mean'):
+            stats[k] = stats[k] * scale + offset
+        stats['stddev'] = stats['stddev'] * abs(scale)
+    if 'histogram' in stats:
+        stats['histogram'] = dict(stats['histogram'], min=stats['min'], max=stats['max'])
+
+    return stats
+
+
+def quantize(array, nodata, step, dtype='int16'):
+    """Quantize float <array> to <dtype> (int16 or uint16) codes <step> apart
+
+    The nodata code is the lowest int16 or highest uint16 value. The offset is a
+    multiple of <step> near the middle of the data, so grids that are already
+    multiples of <step> (e.g. SNODAS raw integers * 0.01) are stored exactly.
+    Returns Quantized, or None if the data span more codes than <dtype> has.
+    """
+
+    dtype = np.dtype(dtype)
+    info = np.iinfo(dtype)
+    if info.min < 0:
+        code_nodata, code_min, code_max = info.min, info.min + 1, info.max
+    else:
+        code_nodata, code_min, code_max = info.max, info.min, info.max - 1
+
+    valid = valid_mask(array, nodata)
+    values = array[valid].astype(np.float64)
+    code_mid = (code_min + code_max) // 2
+
+    if values.size:
+        lo, hi = values.min(), values.max()
+        offset = (np.round((lo + hi) / 2 / step) - code_mid) * step
+        if np.round((lo - offset) / step) < code_min or np.round((hi - offset) / step) > code_max:
+            return None
+    else:
+        offset = 0.0
+
+    codes = np.full(array.shape, code_nodata, dtype=dtype)
+    codes[valid] = np.round((values - offset) / step).astype(dtype)
+
+    return Quantized(codes, float(step), float(offset), int(code_nodata))
+
+
+def dequantize(quantized, nodata, dtype='float32'):
+    """Float array from Quantized; nodata codes become <nodata>"""
+
+    values = quantized.array.astype(np.float64) * quantized.scale + quantized.offset
+    values[quantized.array == quantized.nodata] = nodata
+
+    return values.astype(dtype)
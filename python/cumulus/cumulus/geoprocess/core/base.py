@@ -1,3 +1,4 @@
+from collections import namedtuple
 import json
 import logging
 import numpy as np
@@ -8,12 +9,30 @@ from uuid import uuid4
 
 from osgeo import gdal
 
+from . import encoding as _encoding, profiles
+from .arrays import array_statistics, constant_value, quantize, unscale_statistics
+from .expressions import Expression
+from .tiles import fill_nodata_tiled, map_tiles
+from ...handyutils.core import HashingStream
+from ...handyutils.core.scratch import ScratchSpace, is_vsimem
+from ...handyutils.core.transfer import download
+
+
+def translate_args(encoding=None):
+    """gdal_translate arguments for a tiled, compressed GeoTIFF; see geoprocess.core.encoding"""
+
+    return ['-of', 'GTiff', '-co', 'COPY_SRC_OVERVIEWS=YES'] + _encoding.creation_args(encoding)
+
+
+# Basics of creating a tiled and compressed geotiff
+TRANSLATE_ARGS = translate_args()
+
 
 def info(file):
     """Standard way of calling gdalinfo and returning a python dictionary of metadata"""
 
     cmd = ['gdalinfo', '-json', str(file)]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE)
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, env=profiles.environ())
 
     try:
         return json.loads(result.stdout)
@@ -22,21 +41,109 @@ def info(file):
         return {}
 
 
-def write_array_to_raster(array, outfile, xsize, ysize, geotransform, projection, datatype, nodata_value):
+# A decoded raster held in memory, with the georeferencing needed to write it back out.
+# Lets one processing stage hand its array to the next without a round trip through disk.
+Grid = namedtuple('Grid', ['array', 'geotransform', 'projection', 'nodata'])
+
+# scale_array(); <factor> is a constant
+SCALE = Expression('a * factor')
+
+
+def read_grid(infile, dtype=None):
+    """Read band 1 of <infile> into a Grid; optionally cast the array to <dtype>"""
+
+    ds = gdal.Open(infile, gdal.GA_ReadOnly)
+    band = ds.GetRasterBand(1)
+    array = band.ReadAsArray()
+    if dtype is not None:
+        array = array.astype(np.dtype(dtype))
+
+    grid = Grid(array, ds.GetGeoTransform(), ds.GetProjection(), band.GetNoDataValue())
+
+    band = None
+    ds = None
+
+    return grid
+
+
+def write_grid(grid, outfile, datatype, encoding=None, histogram_bins=None, return_statistics=False):
+    """write_array_to_raster() for a Grid"""
+
+    ysize, xsize = grid.array.shape
+
+    return write_array_to_raster(
+        grid.array, outfile, xsize, ysize, grid.geotransform, grid.projection, datatype, grid.nodata,
+        encoding=encoding, histogram_bins=histogram_bins, return_statistics=return_statistics
+    )
+
+
+def write_quantized_grid(grid, outfile, step, encoding=None, histogram_bins=None, return_statistics=False):
+    """Write float <grid> as int16 codes <step> apart with scale/offset metadata; see arrays.quantize()
+
+    Returns <outfile>, or None (nothing written) if the data do not fit in int16 at <step>.
+    With <return_statistics>, returns (<outfile>, statistics in the units of <grid>).
+    Band statistics stored in the file are of the int16 codes, as GDAL would compute them.
+    """
+
+    q = quantize(grid.array, grid.nodata, step)
+    if q is None:
+        logging.warning(f'Data range too wide for int16 at step {step}; not quantized: {outfile}')
+        return None
+
+    ysize, xsize = q.array.shape
+
+    result = write_array_to_raster(
+        q.array, outfile, xsize, ysize, grid.geotransform, grid.projection, gdal.GDT_Int16, q.nodata,
+        encoding=_encoding.integer(encoding), scale=q.scale, offset=q.offset,
+        histogram_bins=histogram_bins, return_statistics=return_statistics
+    )
+    if return_statistics:
+        return result[0], unscale_statistics(result[1], q.scale, q.offset)
+
+    return result
+
+
+def set_band_statistics(band, stats):
+    """Store arrays.array_statistics() <stats> as the band's statistics (and default histogram)"""
+
+    if not stats['count']:
+        return
+
+    band.SetStatistics(stats['min'], stats['max'], stats['mean'], stats['stddev'])
+    if 'histogram' in stats:
+        h = stats['histogram']
+        band.SetDefaultHistogram(h['min'], h['max'], h['counts'])
+
+
+def write_array_to_raster(array, outfile, xsize, ysize, geotransform, projection, datatype, nodata_value, encoding=None,
+                          scale=None, offset=None, histogram_bins=None, return_statistics=False):
+    """Write <array> to GeoTIFF <outfile> with <encoding> (default: encoding.DEFAULT)
+    <scale>, <offset> are stored as band metadata for integer codes of float values
+
+    Band statistics (and a <histogram_bins> histogram) are computed from <array>, not
+    by reading back the compressed file. Returns <outfile>, or (<outfile>, statistics)
+    with <return_statistics>; see arrays.array_statistics()
+    """
+
+    stats = array_statistics(array, nodata_value, bins=histogram_bins)
 
     dsout = gdal.GetDriverByName('GTiff').Create(
         outfile, xsize, ysize, 1, datatype,
-        options=[
-            'COMPRESS=DEFLATE',
-            'TILED=YES'
-        ]
+        options=_encoding.creation_options(encoding)
     )
     dsout.SetGeoTransform(geotransform)
     dsout.SetProjection(projection)
     dsout.GetRasterBand(1).SetNoDataValue(nodata_value)
+    if scale is not None:
+        dsout.GetRasterBand(1).SetScale(scale)
+    if offset is not None:
+        dsout.GetRasterBand(1).SetOffset(offset)
     dsout.GetRasterBand(1).WriteArray(array)
+    set_band_statistics(dsout.GetRasterBand(1), stats)
     dsout.FlushCache()
-    dsout.GetRasterBand(1).GetStatistics(0, 1)
+
+    if return_statistics:
+        return outfile, stats
 
     return outfile
 
@@ -84,19 +191,10 @@ def fill_nodata_values(infile, outfile, max_distance=35):
     #     To remove all no-data in the 'us' raster, max_distance = 31+
     # Command example: gdal_fillnodata.py -md 16 20110215_nodata.tif 20110215_fill16.tif
 
-    # NOTE: The command "gdal_fillnodata.py" writes a temporary "Y index work file"
-    #       in the current directory it was called from.  This will cause the command to fail
-    #       if you do not have write permissions in "./"
-    #       Change the working directory to the directory the output file will be written to
-    os.chdir(os.path.abspath(os.path.dirname(outfile)))
-
-    cmd = ['gdal_fillnodata.py', '-md', str(max_distance), infile, outfile]
-    logging.debug(cmd)
-
-    result = subprocess.check_call(cmd)
-    logging.debug(result)
+    # Tiles with a halo of <max_distance>, filled in parallel in process (also for /vsimem/)
+    logging.debug(f'fill nodata; max_distance: {max_distance}; {infile} -> {outfile}')
 
-    return outfile
+    return fill_nodata_tiled(infile, outfile, max_distance=max_distance)
 
 
 def get_without_vsicurl(url, outfile):
@@ -105,72 +203,54 @@ def get_without_vsicurl(url, outfile):
     I ran into this issue trying to use gdal_translate /vsicurl/ from inside a container
     """
 
-    outfile = os.path.abspath(outfile)
+    logging.debug(f'download; url: {url}; outfile: {outfile}')
 
-    cmd = ['curl', '-o', outfile, url]
-    cmd = [str(c) for c in cmd]
-
-    logging.debug('run command: {}'.format(' '.join(cmd)))
-
-    p = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-    )
-
-    out, err = p.communicate()
-    logging.debug('SubprocessResults: {}'.format(out))
-
-    return outfile
+    return download(url, outfile)['file']
 
 
 def set_value_to_nodata(infile, outfile, value):
     '''Set pixels in <infile> with <value> to NoData. Save result to <outfile>'''
 
     # Command example: gdal_edit.py -a_nodata -9999 zz_ssmv11034tS__T0001TTNATS2011021505HP001.bil
-    cmd = ['gdal_translate', '-a_nodata', value, '-co', 'compress=lzw', infile, outfile]
+    if is_vsimem(infile) or is_vsimem(outfile):
+        gdal.Translate(outfile, infile, options=['-a_nodata', str(value)] + _encoding.creation_args(_encoding.INTERMEDIATE))
+        return outfile
+
+    cmd = ['gdal_translate', '-a_nodata', str(value)] + _encoding.creation_args(_encoding.INTERMEDIATE) + [infile, outfile]
     logging.debug(cmd)
 
-    result = subprocess.check_call(cmd)
+    result = subprocess.check_call(cmd, env=profiles.environ())
     logging.debug(result)
 
     return outfile
 
 
-def scale_raster_values(factor, infile, outfile):
-    """Developed as a versatile way to do conversions like millimeters to meters"""
+def scale_array(array, factor, nodata_value):
+    """Multiply <array> by <factor>, leaving <nodata_value> cells untouched; returns float32
 
-    # infile as a dataset
-    ds = gdal.Open(infile, gdal.GA_ReadOnly)
-    xsize = ds.RasterXSize
-    ysize = ds.RasterYSize
-    geotransform = ds.GetGeoTransform()
-    projection = ds.GetProjection()
+    Only blocks with a cell that is neither 0 nor nodata are multiplied.
+    """
 
-    # infile band
-    band = ds.GetRasterBand(1)
-    nodata_value = band.GetNoDataValue()
+    nodata = array == nodata_value
+    out = np.where(nodata, np.float32(nodata_value), np.float32(0))
 
-    # infile array
-    array = band.ReadAsArray(0, 0, xsize, ysize).astype(np.dtype('float32'))
+    def scale(a):
+        return SCALE.evaluate({'a': a}, nodata=nodata_value, constants={'factor': factor})
 
-    # scaled_array
-    scaled_array = np.where(array == nodata_value, nodata_value, array * factor)
+    return map_tiles(scale, out, array, active=~nodata & (array != 0))
+
+
+def scale_raster_values(factor, infile, outfile):
+    """Developed as a versatile way to do conversions like millimeters to meters"""
+
+    grid = read_grid(infile)
 
     # write scaled array to raster
-    scaled_raster = write_array_to_raster(
-        scaled_array, outfile, xsize, ysize, geotransform, projection, gdal.GDT_Float32, nodata_value
+    scaled_raster = write_grid(
+        grid._replace(array=scale_array(grid.array, factor, grid.nodata)), outfile, gdal.GDT_Float32
     )
 
-    ds = None
-    xsize = None
-    ysize = None
-    geotransform = None
-    projection = None
-    band = None
-    nodata_value = None
-    array = None
-    scaled_array = None
+    grid = None
 
     return scaled_raster
 
@@ -189,6 +269,7 @@ def translate_url_to_vrt(url, outfile, projwin_args):
         cmd,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
+        env=profiles.environ(),
     )
 
     out, err = p.communicate()
@@ -201,12 +282,20 @@ def create_overviews(infile, algorithm='average', levels=[2, 4, 8, 16, 32, 64, 1
 
     logging.info('gdaladdo; infile: {}'.format(infile))
 
+    if is_vsimem(infile):
+        # gdaladdo cannot open /vsimem/; build the same overviews in process
+        ds = gdal.Open(infile, gdal.GA_Update)
+        ds.BuildOverviews(algorithm.upper(), levels)
+        ds = None
+        return infile
+
     cmd = ['gdaladdo', '-r', algorithm, infile] + [str(e) for e in levels]
 
     p = subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT
+        stderr=subprocess.STDOUT,
+        env=profiles.environ(),
     )
 
     out, err = p.communicate()
@@ -216,39 +305,38 @@ def create_overviews(infile, algorithm='average', levels=[2, 4, 8, 16, 32, 64, 1
 
 def interpolate(infile, outfile, max_distance, nodata):
 
-    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td:
+    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td, ScratchSpace(td) as scratch:
 
-        # This file will be automatically deleted
+        # This file will be automatically deleted; in /vsimem/ in memory mode
         _nodata = set_value_to_nodata(
             infile,
-            os.path.join(td, f'_nodata.tif'),
+            scratch.path('_nodata.tif'),
             nodata
         )
 
         _filled = fill_nodata_values(
             _nodata,
-            os.path.abspath(outfile),
+            outfile if is_vsimem(outfile) else os.path.abspath(outfile),
             max_distance=max_distance
         )
 
     return _filled
 
 
-def translate(infile, outfile, extra_args=None):
+def translate(infile, outfile, extra_args=None, encoding=None):
     """
     Convert SNODAS file to geotiff format
+    <encoding> sets compression; see geoprocess.core.encoding (default: TRANSLATE_ARGS)
     """
 
     logging.info('gdal_translate; infile: {}; outfile: {}'.format(infile, outfile))
 
-    # Basics of creating a tiled and compressed geotiff
-    cmd = [
-        'gdal_translate',
-        '-of', 'GTiff',
-        '-co', 'TILED=YES',
-        '-co', 'COPY_SRC_OVERVIEWS=YES',
-        '-co', 'COMPRESS=DEFLATE'
-    ]
+    if is_vsimem(infile) or is_vsimem(outfile):
+        # gdal_translate cannot open /vsimem/
+        gdal.Translate(outfile, infile, options=translate_args(encoding) + profiles.creation_args() + [str(a) for a in (extra_args or [])])
+        return outfile
+
+    cmd = ['gdal_translate', ] + translate_args(encoding) + profiles.creation_args()
 
     if extra_args is not None:
         cmd += extra_args
@@ -261,6 +349,7 @@ def translate(infile, outfile, extra_args=None):
         cmd,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
+        env=profiles.environ(),
     )
 
     out, err = p.communicate()
@@ -268,13 +357,97 @@ def translate(infile, outfile, extra_args=None):
     return outfile
 
 
+def vsimem_to_file(vsipath, outfile, algorithm=None, size=1000000):
+    """Copy a GDAL /vsimem/ file to <outfile> on disk, hashing it on the way out.
+    Returns hexdigest, or None if no <algorithm>
+    """
+
+    f = gdal.VSIFOpenL(vsipath, 'rb')
+    if f is None:
+        raise FileNotFoundError(vsipath)
+
+    try:
+        with HashingStream(open(outfile, 'wb'), [algorithm] if algorithm else []) as out:
+            while True:
+                data = gdal.VSIFReadL(1, size, f)
+                if not data:
+                    break
+                out.write(data)
+    finally:
+        gdal.VSIFCloseL(f)
+
+    return out.hexdigest() if algorithm else None
+
+
+def translate_with_checksum(infile, outfile, algorithm='MD5', extra_args=None, encoding=None):
+    """Same output as translate(), plus the checksum of <outfile> without reading it back.
+
+    The GeoTIFF is built in /vsimem/ and hashed while it is copied to disk.
+    <infile> may also be an open gdal.Dataset, e.g. a MEM dataset over an array.
+    Returns (outfile, hexdigest)
+    """
+
+    logging.info('gdal.Translate; infile: {}; outfile: {}'.format(infile, outfile))
+    if not isinstance(infile, gdal.Dataset):
+        infile = str(infile)
+
+    args = translate_args(encoding) + profiles.creation_args() + [str(a) for a in (extra_args or [])]
+    vsipath = f'/vsimem/{uuid4()}/{os.path.basename(outfile)}'
+
+    try:
+        ds = gdal.Translate(vsipath, infile, options=args)
+        if ds is None:
+            raise RuntimeError(f'gdal.Translate failed: {infile}')
+        ds = None
+        digest = vsimem_to_file(vsipath, outfile, algorithm)
+    finally:
+        gdal.Unlink(vsipath)
+
+    return outfile, digest
+
+
+def grid_to_cog(grid, cog, datatype, scratch, encoding=None, precision=None, return_statistics=False):
+    """Write <grid> to an intermediate tif from ScratchSpace <scratch>, add overviews,
+    translate to Cloud Optimized GeoTIFF <cog> with <encoding>; returns <cog>
+    With <precision>, the float grid is written as int16 codes with scale/offset instead of <datatype>
+    With <return_statistics>, returns (<cog>, statistics of <grid>); see arrays.array_statistics()
+    """
+
+    tif = scratch.path('.tif', estimate=grid.array.nbytes)
+    written = None
+    if precision is not None:
+        written = write_quantized_grid(grid, tif, precision, encoding=_encoding.INTERMEDIATE, return_statistics=True)
+        if written:
+            encoding = _encoding.integer(encoding)
+    if not written:
+        written = write_grid(grid, tif, datatype, encoding=_encoding.INTERMEDIATE, return_statistics=True)
+    # Band statistics in the tif are copied into the COG by gdal_translate
+    _, stats = written
+    # Overviews of a grid that is one value everywhere are that value; skip averaging
+    create_overviews(tif, algorithm='nearest' if constant_value(grid.array) is not None else 'average')
+    scratch.written(tif)
+    translate(tif, cog, encoding=encoding)
+    # Delete tif after cloud optimized geotiff is created
+    scratch.release(tif)
+
+    if return_statistics:
+        return cog, stats
+
+    return cog
+
+
 def warp(infile, outfile, extra_args=[]):
     """Subprocess wrapper for calling gdalwarp"""
 
     logging.info('gdalwarp; infile: {}; outfile: {}'.format(infile, outfile))
 
+    if is_vsimem(infile) or is_vsimem(outfile):
+        # gdalwarp cannot open /vsimem/
+        gdal.Warp(outfile, infile, options=[str(a) for a in profiles.warp_args() + extra_args])
+        return outfile
+
     # Basics of creating a tiled and compressed geotiff
-    cmd = ['gdalwarp', ] + extra_args + [infile, outfile, ]
+    cmd = ['gdalwarp', ] + profiles.warp_args() + extra_args + [infile, outfile, ]
 
     # Convert everything to a string
     cmd = [str(_c) for _c in cmd]
@@ -285,6 +458,7 @@ def warp(infile, outfile, extra_args=[]):
         cmd,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
+        env=profiles.environ(),
     )
 
     out, err = p.communicate()
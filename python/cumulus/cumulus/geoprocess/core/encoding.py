@@ -0,0 +1,180 @@
+"""GeoTIFF compression settings per product
+
+An Encoding is the codec, level, predictor, tile size and (for LERC) maximum error
+used to write a product's Cloud Optimized GeoTIFF. Published products are written
+with PUBLISHED, the DEFLATE tiles this package has always produced with empty
+tiles left out. A filetype is only added to ENCODINGS once "benchmark.py encoding"
+numbers on its grids justify another candidate; record those numbers with the entry.
+
+    translate(tif, cog, encoding=encoding_for('ncep_mrms_v12_multisensor_qpe_01h_pass1'))
+
+With <sparse>, tiles that are entirely nodata are not written (SPARSE_OK=TRUE);
+GDAL reads them back as nodata. Mostly empty grids (summer SNODAS, dry MRMS hours)
+become a fraction of the size.
+
+Predictors must match the data: 2 (horizontal differencing) for integer grids,
+3 (floating point) for float grids. LERC is lossy; <max_z_error> is the largest
+allowed absolute error in data units. WebP only encodes 8-bit data, so it does not
+apply to any grid here.
+
+With CUMULUS_QUANTIZE=TRUE (or set_quantize(True)), float products listed in
+PRECISION are written as int16 codes with GDAL scale/offset; see
+geoprocess.core.arrays.quantize(). Readers must apply the scale and offset, so
+this is off by default.
+
+measure() and candidates() are used by "benchmark.py encoding" to compare size,
+encode time and decode time of each candidate on real outputs.
+"""
+
+from collections import namedtuple
+import os
+import time
+from uuid import uuid4
+
+Encoding = namedtuple(
+    'Encoding',
+    ['compress', 'level', 'predictor', 'blocksize', 'max_z_error', 'sparse'],
+    defaults=(None, None, None, None, False),
+)
+
+# Creation option for <level> with each codec
+LEVEL_OPTIONS = {
+    'DEFLATE': 'ZLEVEL',
+    'LERC_DEFLATE': 'ZLEVEL',
+    'ZSTD': 'ZSTD_LEVEL',
+    'LERC_ZSTD': 'ZSTD_LEVEL',
+    'WEBP': 'WEBP_LEVEL',
+}
+
+DEFAULT = Encoding('DEFLATE')
+
+# Intermediate GeoTIFFs are read once, inside the container; cheap to write beats small
+INTERMEDIATE = Encoding('ZSTD', level=1, sparse=True)
+
+# Grids published as COGs: DEFAULT, except tiles that are entirely nodata are not written
+PUBLISHED = DEFAULT._replace(sparse=True)
+
+# Benchmarked settings of filetypes that differ from PUBLISHED, by lower case filetype
+ENCODINGS = {}
+
+
+# Quantization step of float products (in product units); values are kept within step / 2
+PRECISION = {
+    # Raw SNODAS snowmelt is integer * 0.01 mm, so this step is lossless
+    'nohrsc_snodas_snowmelt': 0.01,
+    # Computed from integer SWE (mm) and snowpack temperature (K). Int16 SWE up to 32767 mm
+    # at 200 K is about -15200, so the full span needs a step over 15200 / 65534 = 0.23
+    'nohrsc_snodas_coldcontent': 0.25,
+}
+
+# Write products in PRECISION as scaled integers; see set_quantize()
+QUANTIZE = os.getenv('CUMULUS_QUANTIZE', default='False').upper() == 'TRUE'
+
+
+def set_quantize(enabled):
+    """Turn quantized output of products in PRECISION on or off"""
+
+    global QUANTIZE
+
+    QUANTIZE = bool(enabled)
+
+
+def precision_for(filetype):
+    """Quantization step for <filetype>, or None to write floats"""
+
+    if not QUANTIZE or not filetype:
+        return None
+
+    return PRECISION.get(filetype.lower())
+
+
+def integer(encoding):
+    """<encoding> for integer codes of a float product; the floating point predictor becomes 2"""
+
+    encoding = encoding or DEFAULT
+
+    return encoding._replace(predictor=2) if encoding.predictor == 3 else encoding
+
+
+def encoding_for(filetype):
+    """Encoding for published <filetype>; PUBLISHED unless ENCODINGS has settings for it"""
+
+    return ENCODINGS.get(filetype.lower() if filetype else filetype, PUBLISHED)
+
+
+def candidates(predictor):
+    """Encodings compared by "benchmark.py encoding"; <predictor> is 2 for integer grids, 3 for float.
+    LERC errors are in the product's units
+    """
+
+    return {
+        'deflate': DEFAULT,
+        'deflate-predictor': Encoding('DEFLATE', level=6, predictor=predictor),
+        'deflate-predictor-512': Encoding('DEFLATE', level=6, predictor=predictor, blocksize=512),
+        'zstd-1-predictor': Encoding('ZSTD', level=1, predictor=predictor),
+        'zstd-9-predictor': Encoding('ZSTD', level=9, predictor=predictor),
+        'lerc-zstd-0.01': Encoding('LERC_ZSTD', level=9, max_z_error=0.01),
+        'lerc-zstd-0.1': Encoding('LERC_ZSTD', level=9, max_z_error=0.1),
+    }
+
+
+def creation_options(encoding=None):
+    """GTiff creation options (KEY=VALUE) for <encoding>; tiled, DEFAULT if None"""
+
+    encoding = encoding or DEFAULT
+
+    options = ['TILED=YES', f'COMPRESS={encoding.compress}']
+    if encoding.level is not None and encoding.compress in LEVEL_OPTIONS:
+        options.append(f'{LEVEL_OPTIONS[encoding.compress]}={encoding.level}')
+    if encoding.predictor is not None:
+        options.append(f'PREDICTOR={encoding.predictor}')
+    if encoding.blocksize is not None:
+        options += [f'BLOCKXSIZE={encoding.blocksize}', f'BLOCKYSIZE={encoding.blocksize}']
+    if encoding.max_z_error is not None:
+        options.append(f'MAX_Z_ERROR={encoding.max_z_error}')
+    if encoding.sparse:
+        options.append('SPARSE_OK=TRUE')
+
+    return options
+
+
+def creation_args(encoding=None):
+    """creation_options() as gdal_translate arguments"""
+
+    args = []
+    for option in creation_options(encoding):
+        args += ['-co', option]
+
+    return args
+
+
+def measure(infile, encoding, repeat=3):
+    """Write band 1 of <infile> with <encoding> to /vsimem/ and read it back
+
+    Returns {'bytes': size, 'encode_seconds': best of <repeat>, 'decode_seconds': best of <repeat>}
+    """
+
+    from osgeo import gdal
+
+    vsipath = f'/vsimem/{uuid4()}/{os.path.basename(infile)}'
+    encode, decode = [], []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ds = gdal.Translate(vsipath, infile, options=['-of', 'GTiff', '-b', '1'] + creation_args(encoding))
+            if ds is None:
+                raise RuntimeError(f'gdal.Translate failed: {infile}; {creation_options(encoding)}')
+            ds = None
+            encode.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            ds = gdal.Open(vsipath, gdal.GA_ReadOnly)
+            ds.GetRasterBand(1).ReadAsArray()
+            ds = None
+            decode.append(time.perf_counter() - start)
+
+        size = gdal.VSIStatL(vsipath).size
+    finally:
+        gdal.Unlink(vsipath)
+
+    return {'bytes': size, 'encode_seconds': min(encode), 'decode_seconds': min(decode)}
@@ -0,0 +1,170 @@
+"""Derived grids declared as expressions over named input grids
+
+    COLDCONTENT = Expression(
+        'where(t_isnodata, NODATA, where(t >= 273.15, 0, where(swe_isnodata, NODATA, swe * 2114 * (t - 273.15) / 333000)))'
+    )
+    array = COLDCONTENT.evaluate({'t': snowtemp, 'swe': swe}, nodata=-9999)
+
+An expression is Python syntax limited to numbers, the names below, arithmetic,
+comparisons, & | ~ and the functions in FUNCTIONS. It is checked when the
+Expression is created.
+
+Names:
+  <input>            an input grid, as float32
+  <input>_isnodata   True where <input> is nodata (or NaN)
+  NODATA             the output nodata value
+  any key of <constants> passed to evaluate()
+
+Nodata: if the expression uses no _isnodata name, the result is NODATA wherever
+any input it uses is nodata (as gdal_calc.py does). An expression that uses an
+_isnodata name handles nodata itself.
+
+Evaluation runs over blocks of CHUNK_ROWS rows, so temporaries are the size of a
+block rather than the grid. numexpr, if installed, evaluates each block in one
+multithreaded pass; otherwise blocks are evaluated with NumPy ufuncs in a thread pool.
+"""
+
+import ast
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+
+import numpy as np
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# Rows per block; 256 rows of an 8192-column float32 grid is 8 MB per temporary
+CHUNK_ROWS = 256
+
+ISNODATA_SUFFIX = '_isnodata'
+
+# Functions an expression may call; every one is also available in numexpr
+FUNCTIONS = {
+    'where': np.where,
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'exp': np.exp,
+    'log': np.log,
+    'log10': np.log10,
+}
+
+_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod,
+    ast.USub, ast.UAdd, ast.Invert, ast.BitAnd, ast.BitOr,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+# Python < 3.8 parses numbers as ast.Num
+_NUMBER = ast.Constant if sys.version_info >= (3, 8) else ast.Num
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+class Expression:
+    """A derived grid as an expression over named inputs; see module docstring"""
+
+    def __init__(self, text, dtype='float32'):
+        self.text = text
+        self.dtype = np.dtype(dtype)
+
+        try:
+            tree = ast.parse(text, mode='eval')
+        except SyntaxError as e:
+            raise ExpressionError(f'Invalid expression: {text}; {e}')
+
+        functions, names = set(), set()
+        for node in ast.walk(tree):
+            if isinstance(node, _NUMBER):
+                value = node.value if sys.version_info >= (3, 8) else node.n
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ExpressionError(f'Only numbers may appear as constants: {text}')
+            elif not isinstance(node, _NODES):
+                raise ExpressionError(f'{type(node).__name__} is not allowed: {text}')
+            elif isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                    raise ExpressionError(f'Only {", ".join(FUNCTIONS)} may be called: {text}')
+                functions.add(id(node.func))
+            elif isinstance(node, ast.Name):
+                names.add(node)
+        names = {n.id for n in names if id(n) not in functions}
+
+        # Names other than NODATA, inputs and their _isnodata masks are constants given to evaluate()
+        self.masks = {n[:-len(ISNODATA_SUFFIX)] for n in names if n.endswith(ISNODATA_SUFFIX)}
+        self.names = names - {'NODATA'}
+        self._code = compile(tree, '<expression>', 'eval')
+
+    def inputs(self, constants=None):
+        """Input grid names used by the expression"""
+
+        constants = constants or {}
+        return sorted(
+            {n[:-len(ISNODATA_SUFFIX)] if n.endswith(ISNODATA_SUFFIX) else n for n in self.names} - set(constants)
+        )
+
+    def _evaluate_block(self, arrays, rows, nodata, out_nodata, constants, out):
+        local = dict(constants, NODATA=out_nodata)
+        missing = None
+        for name, array in arrays.items():
+            block = array[rows]
+            isnodata = np.isnan(block) if np.issubdtype(block.dtype, np.floating) else np.zeros(block.shape, bool)
+            if nodata.get(name) is not None:
+                isnodata |= block == nodata[name]
+            local[name] = block.astype(np.float32)
+            local[name + ISNODATA_SUFFIX] = isnodata
+            missing = isnodata if missing is None else missing | isnodata
+
+        if numexpr is not None:
+            numexpr.evaluate(self.text, local_dict=local, out=out[rows], casting='unsafe')
+        else:
+            out[rows] = eval(self._code, {'__builtins__': {}}, dict(local, **FUNCTIONS))
+
+        if not self.masks and missing is not None:
+            out[rows][missing] = out_nodata
+
+    def evaluate(self, arrays, nodata=None, out_nodata=None, constants=None, out=None, max_workers=None):
+        """Evaluate over <arrays> ({name: array}, all the same shape); returns array of self.dtype
+
+        <nodata>      input nodata value, or {name: value}
+        <out_nodata>  NODATA in the expression and the value written for nodata; default <nodata>
+        <constants>   {name: number} for names in the expression that are not inputs
+        <out>         array to write into, e.g. a block of a larger grid
+        """
+
+        constants = dict(constants or {})
+        names = self.inputs(constants)
+        missing = set(names) - set(arrays)
+        if missing:
+            raise ExpressionError(f'Missing inputs {sorted(missing)}: {self.text}')
+        arrays = {n: arrays[n] for n in names}
+
+        if not isinstance(nodata, dict):
+            nodata = {n: nodata for n in names}
+        if out_nodata is None:
+            values = {v for v in nodata.values() if v is not None}
+            out_nodata = values.pop() if len(values) == 1 else np.nan
+
+        if out is None:
+            out = np.empty(next(iter(arrays.values())).shape, dtype=self.dtype)
+        if np.isnan(out_nodata) and not np.issubdtype(out.dtype, np.floating):
+            raise ExpressionError(f'out_nodata is needed for {out.dtype} output: {self.text}')
+
+        def block(rows):
+            self._evaluate_block(arrays, rows, nodata, out_nodata, constants, out)
+
+        blocks = [slice(r, r + CHUNK_ROWS) for r in range(0, out.shape[0], CHUNK_ROWS)]
+        if numexpr is not None or len(blocks) == 1:
+            # numexpr already spreads each block over its own threads
+            for rows in blocks:
+                block(rows)
+        else:
+            # NumPy ufuncs release the GIL, so blocks run in parallel
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as executor:
+                list(executor.map(block, blocks))
+
+        return out
@@ -0,0 +1,151 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import os
+
+from osgeo import gdal
+
+from . import profiles
+from .base import create_overviews, read_grid, translate, translate_args
+from .encoding import INTERMEDIATE, encoding_for
+from .shg import companion_entry, companion_path, grid_to_shg_cog, is_companion_wanted
+from ...handyutils.core import mkdir_p
+from ...handyutils.core.scratch import ScratchSpace
+
+
+def grib_datetime(value):
+    """Get Datetime from GRIB metadata string like "1599008400 sec UTC" """
+
+    return datetime.fromtimestamp(int(value.split(" ")[0]))
+
+
+# Metadata keys matched by substring; every other key must match exactly
+SUBSTRING_KEYS = ('GRIB_COMMENT', )
+
+
+def matches(meta, key, value):
+    """True if band metadata <meta> has <value> for <key>; see SUBSTRING_KEYS"""
+
+    if key in SUBSTRING_KEYS:
+        return value in meta.get(key, '')
+
+    return meta.get(key, '').strip() == value
+
+
+def select_band(band_metadata, selector):
+    """Return 1-based band number matching <selector>, or None
+
+    <band_metadata>  list of metadata dictionaries, one per band, in band order
+    <selector>       int: band number
+                     dict: {metadata key: value}; first band where every value matches.
+                           GRIB_COMMENT matches a substring, other keys (e.g. GRIB_ELEMENT
+                           codes) the whole value.
+                           e.g. {"GRIB_ELEMENT": "TMP"}, {"GRIB_COMMENT": "Total precipitation"}
+    """
+
+    if isinstance(selector, int):
+        return selector if 1 <= selector <= len(band_metadata) else None
+
+    for idx, meta in enumerate(band_metadata):
+        if all(matches(meta, k, v) for k, v in selector.items()):
+            return idx + 1
+
+    return None
+
+
+def process_grib_bands(infile, outdir, bands, filename, wanted=None, version=False, max_workers=None, scratch=None):
+    """Convert several bands of one GRIB file to Cloud Optimized GeoTIFF in a single pass
+
+    The file is opened once. Each selected band is decoded once into its own GeoTIFF,
+    then overviews and COG conversion for all bands run concurrently.
+
+    <bands>     {filetype: selector}; see select_band()
+    <filename>  output filename, or function(datetime) -> filename. Each filetype
+                is written to <outdir>/<filetype>/<filename>
+    <wanted>    set of filetypes to produce; None produces every filetype in <bands>
+    <version>   if True, "version" is the band's GRIB_REF_TIME (forecast issue time)
+    <scratch>   ScratchSpace for the intermediate GeoTIFFs; default is one in <outdir>.
+                Each intermediate is deleted as soon as its COG is written
+    The SHG companion of a filetype (geoprocess.core.shg) is written from the same
+    decoded band if it is in <wanted>
+
+    Returns array of objects [{ "filetype": ..., "file": ..., "datetime": ..., "version": ... }, ]
+    """
+
+    todo = {k: v for k, v in bands.items() if wanted is None or k in wanted}
+    if not todo:
+        return []
+
+    own_scratch = scratch is None
+    if own_scratch:
+        scratch = ScratchSpace(outdir)
+
+    try:
+        return _process_grib_bands(infile, outdir, todo, filename, version, max_workers, scratch, wanted)
+    finally:
+        # Intermediates left behind by a failure
+        if own_scratch:
+            scratch.close()
+
+
+def _process_grib_bands(infile, outdir, todo, filename, version, max_workers, scratch, wanted):
+
+    ds = gdal.Open(infile, gdal.GA_ReadOnly)
+    if ds is None:
+        raise RuntimeError(f'Could not open GRIB: {infile}')
+
+    band_metadata = [ds.GetRasterBand(i).GetMetadata() for i in range(1, ds.RasterCount + 1)]
+
+    # Decode each selected band once. GDAL datasets are not thread-safe, so this part is serial
+    extracted = []
+    for filetype, selector in todo.items():
+        band_number = select_band(band_metadata, selector)
+        if band_number is None:
+            logging.warning(f'No band matches {selector} for {filetype}; {infile}')
+            continue
+
+        meta = band_metadata[band_number - 1]
+        dt = grib_datetime(meta['GRIB_VALID_TIME'])
+        vt = grib_datetime(meta['GRIB_REF_TIME']) if version else None
+
+        logging.info(f'{filetype}; band {band_number}; {meta.get("GRIB_COMMENT")}; {dt}')
+
+        # Estimate (float32) reserves room if the intermediate goes to /vsimem/
+        tif = scratch.path(prefix='temp-tif-', estimate=ds.RasterXSize * ds.RasterYSize * 4)
+        out = gdal.Translate(tif, ds, options=translate_args(INTERMEDIATE) + ['-b', str(band_number)])
+        if out is None:
+            raise RuntimeError(f'Could not extract band {band_number} of {infile}')
+        out = None
+        scratch.written(tif)
+
+        _filename = filename(dt) if callable(filename) else filename
+        extracted.append((filetype, tif, os.path.join(outdir, filetype, _filename), dt, vt))
+
+    ds = None
+
+    def to_cog(filetype, tif, cog, dt, vt):
+        mkdir_p(os.path.dirname(cog))
+        create_overviews(tif)
+        scratch.written(tif)
+        translate(tif, cog, encoding=encoding_for(filetype))
+        entry = {
+            "filetype": filetype,
+            "file": cog,
+            "datetime": dt.isoformat(),
+            "version": vt.isoformat() if vt is not None else None,
+        }
+        entries = [entry]
+        if is_companion_wanted(filetype, wanted):
+            # The decoded band, not the GRIB, is warped
+            entries.append(companion_entry(entry, *grid_to_shg_cog(read_grid(tif), companion_path(cog), scratch)))
+        scratch.release(tif)
+        return entries
+
+    if not extracted:
+        return []
+
+    # Overviews and compression run in gdaladdo/gdal_translate subprocesses, under the caller's GDAL profile
+    with ThreadPoolExecutor(max_workers=max_workers or min(len(extracted), os.cpu_count() or 1)) as executor:
+        futures = [executor.submit(profiles.wrap(to_cog), *e) for e in extracted]
+
+    return [entry for f in futures for entry in f.result()]
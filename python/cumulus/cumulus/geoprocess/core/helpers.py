@@ -18,3 +18,47 @@ def buffered_extent(extent, cells, cell_size):
 
     return (round_down(extent[0]), round_down(extent[1]), round_up(extent[2]), round_up(extent[3]))
 
+
+
+def extent_window(extent, geotransform, shape):
+    """Pixel window (row offset, column offset, rows, columns) of <extent> (xmin, ymin, xmax, ymax)
+    in a north-up grid of <shape> (rows, columns); clipped to the grid. None if they do not overlap
+    """
+
+    xmin, ymin, xmax, ymax = extent
+    # Tolerance so extents on cell edges are not widened by floating point error
+    eps = 1e-6
+
+    col0 = math.floor((xmin - geotransform[0]) / geotransform[1] + eps)
+    col1 = math.ceil((xmax - geotransform[0]) / geotransform[1] - eps)
+    row0 = math.floor((ymax - geotransform[3]) / geotransform[5] + eps)
+    row1 = math.ceil((ymin - geotransform[3]) / geotransform[5] - eps)
+
+    row0, row1 = max(row0, 0), min(row1, shape[0])
+    col0, col1 = max(col0, 0), min(col1, shape[1])
+    if row1 <= row0 or col1 <= col0:
+        return None
+
+    return (row0, col0, row1 - row0, col1 - col0)
+
+
+def union_window(windows):
+    """Smallest window containing every window in <windows>"""
+
+    row0 = min(w[0] for w in windows)
+    col0 = min(w[1] for w in windows)
+    row1 = max(w[0] + w[2] for w in windows)
+    col1 = max(w[1] + w[3] for w in windows)
+
+    return (row0, col0, row1 - row0, col1 - col0)
+
+
+def window_geotransform(geotransform, window):
+    """Geotransform of <window> of a north-up grid with <geotransform>"""
+
+    row_off, col_off = window[0], window[1]
+
+    return (
+        geotransform[0] + col_off * geotransform[1], geotransform[1], 0.0,
+        geotransform[3] + row_off * geotransform[5], 0.0, geotransform[5],
+    )
@@ -0,0 +1,93 @@
+import gzip
+import logging
+import os
+import tempfile
+from timeit import default_timer as timer
+from uuid import uuid4
+
+from osgeo import gdal
+
+# Bytes inflated per iteration
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class PreparedInput:
+    """Inflate a gzipped input once and hand GDAL a seekable, uncompressed copy
+
+    GDAL's GRIB driver seeks heavily, which /vsigzip/ handles by decompressing from
+    the start of the stream again. Instead the .gz is inflated once, either into a
+    /vsimem/ buffer (in_memory=True, for in-process GDAL) or into a temporary file
+    in <tmpdir> (for gdal command line utilities, which cannot see /vsimem/).
+    The copy is released when the context exits. Inputs that are not gzipped are
+    passed through untouched.
+
+        with PreparedInput(infile) as src:
+            ds = gdal.Open(src.path)
+
+    Attributes after entering: path, bytes_in, bytes_out, seconds
+    """
+
+    def __init__(self, infile, in_memory=True, tmpdir=None):
+        self.infile = infile
+        self.in_memory = in_memory
+        self.tmpdir = tmpdir
+        self.path = infile
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+        self._inflated = None
+
+    def __enter__(self):
+
+        if not self.infile.endswith('.gz'):
+            return self
+
+        name = os.path.basename(self.infile)[:-len('.gz')]
+        _start = timer()
+
+        if self.in_memory:
+            path = f'/vsimem/{uuid4()}/{name}'
+            fp = gdal.VSIFOpenL(path, 'wb')
+            try:
+                with gzip.open(self.infile, 'rb') as f:
+                    while True:
+                        data = f.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        gdal.VSIFWriteL(data, 1, len(data), fp)
+                        self.bytes_out += len(data)
+            finally:
+                gdal.VSIFCloseL(fp)
+        else:
+            fd, path = tempfile.mkstemp(suffix=f'_{name}', dir=self.tmpdir)
+            with gzip.open(self.infile, 'rb') as f, os.fdopen(fd, 'wb') as out:
+                while True:
+                    data = f.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    out.write(data)
+                    self.bytes_out += len(data)
+
+        self.seconds = timer() - _start
+        self.bytes_in = os.path.getsize(self.infile)
+        self.path = self._inflated = path
+
+        logging.info(
+            f'inflated {os.path.basename(self.infile)}; {self.bytes_in} -> {self.bytes_out} bytes; '
+            f'{self.seconds:.3f} seconds; {path}'
+        )
+
+        return self
+
+    def __exit__(self, *args):
+
+        if self._inflated is None:
+            return
+
+        if self._inflated.startswith('/vsimem/'):
+            gdal.Unlink(self._inflated)
+        elif os.path.isfile(self._inflated):
+            os.remove(self._inflated)
+
+        self.path = self.infile
+        self._inflated = None
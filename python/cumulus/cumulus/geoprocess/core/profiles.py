@@ -0,0 +1,185 @@
+"""Named sets of GDAL configuration options applied to every GDAL call
+
+GDAL's defaults are a small block cache, single threaded compression and overviews,
+and no caching of /vsi reads. A profile names the options that suit one kind of
+work; a processor selects one with a module attribute
+
+    GDAL_PROFILE = 'small-hourly-grib'
+
+and the handler runs the processor inside use_profile(). While a profile is in
+use, the command line wrappers in geoprocess.core.base pass its options to
+gdal_translate, gdalwarp, gdaladdo, etc. in the subprocess environment, and
+in-process GDAL calls see them as thread-local configuration options.
+
+CUMULUS_GDAL_PROFILE (or set_override()) forces one profile for every processor,
+e.g. to compare profiles with benchmark.py.
+
+GDAL_NUM_THREADS=ALL_CPUS is shared out between the records that run at once:
+the handler calls set_concurrency() with the scheduler's worker count, and each
+record's GDAL calls get CPU count / workers threads.
+"""
+
+from contextlib import contextmanager
+import contextvars
+import functools
+import os
+
+PROFILES = {
+    # GDAL defaults
+    'default': {},
+    # One CONUS grid per file (MRMS, RTMA, NDGD); decoded once, then overviews and DEFLATE
+    'small-hourly-grib': {
+        'GDAL_CACHEMAX': '256',
+        'GDAL_NUM_THREADS': 'ALL_CPUS',
+        'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+        'VSI_CACHE': 'FALSE',
+    },
+    # 8192 x 4096 SNODAS grids decoded in NumPy; large block cache for writing several COGs per date
+    'conus-snodas': {
+        'GDAL_CACHEMAX': '1024',
+        'GDAL_NUM_THREADS': 'ALL_CPUS',
+        'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+    },
+    # Windowed reads of COGs over /vsicurl/ or /vsis3/ (e.g. zonal statistics)
+    'remote-cog-read': {
+        'GDAL_CACHEMAX': '256',
+        'GDAL_NUM_THREADS': 'ALL_CPUS',
+        'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+        'CPL_VSIL_CURL_ALLOWED_EXTENSIONS': '.tif,.tiff,.vrt',
+        'CPL_VSIL_CURL_CACHE_SIZE': str(256 * 1024 ** 2),
+        'VSI_CACHE': 'TRUE',
+        'VSI_CACHE_SIZE': str(64 * 1024 ** 2),
+        'GDAL_HTTP_MULTIRANGE': 'YES',
+        'GDAL_HTTP_MERGE_CONSECUTIVE_RANGES': 'YES',
+        'GDAL_HTTP_VERSION': '2',
+    },
+}
+
+# Profile used for every processor if set; see set_override()
+OVERRIDE = os.getenv('CUMULUS_GDAL_PROFILE') or None
+
+_current = contextvars.ContextVar('gdal_profile', default='default')
+
+# Records processed at once; see set_concurrency()
+_concurrency = 1
+
+
+def set_concurrency(n):
+    """Share ALL_CPUS between <n> records running at once"""
+
+    global _concurrency
+
+    _concurrency = max(1, int(n))
+
+
+def num_threads():
+    """GDAL_NUM_THREADS for one of the records running at once; ALL_CPUS if only one runs"""
+
+    if _concurrency == 1:
+        return 'ALL_CPUS'
+
+    return str(max(1, (os.cpu_count() or 1) // _concurrency))
+
+
+def set_override(name):
+    """Use profile <name> for every processor; None goes back to each processor's GDAL_PROFILE"""
+
+    global OVERRIDE
+
+    if name is not None and name not in PROFILES:
+        raise ValueError(f'Unknown GDAL profile: {name}')
+    OVERRIDE = name
+
+
+def profile_for(processor):
+    """Name of the profile to use for <processor>"""
+
+    return OVERRIDE or getattr(processor, 'GDAL_PROFILE', None) or 'default'
+
+
+def current():
+    """Name of the profile in use in this context"""
+
+    return _current.get()
+
+
+def options(name=None):
+    """Configuration options of profile <name> (default: the current profile)"""
+
+    name = name or current()
+    if name not in PROFILES:
+        raise ValueError(f'Unknown GDAL profile: {name}')
+
+    opts = dict(PROFILES[name])
+    if opts.get('GDAL_NUM_THREADS') == 'ALL_CPUS':
+        opts['GDAL_NUM_THREADS'] = num_threads()
+
+    return opts
+
+
+def environ():
+    """os.environ plus the current profile's options, for GDAL command line utilities
+
+    Options already set in the environment win, so they can still be tuned per deployment.
+    """
+
+    env = dict(options())
+    env.update(os.environ)
+
+    return env
+
+
+def creation_args():
+    """GeoTIFF creation options that follow the current profile"""
+
+    threads = options().get('GDAL_NUM_THREADS')
+
+    return ['-co', f'NUM_THREADS={threads}'] if threads else []
+
+
+def warp_args():
+    """gdalwarp arguments that follow the current profile"""
+
+    threads = options().get('GDAL_NUM_THREADS')
+
+    return ['-multi', '-wo', f'NUM_THREADS={threads}'] if threads else []
+
+
+@contextmanager
+def use_profile(name):
+    """Run the block with profile <name> for command line utilities and in-process GDAL in this thread
+
+    GDAL reads GDAL_CACHEMAX once per process, so in process it only changes if it was not used yet.
+    """
+
+    name = name or 'default'
+    opts = options(name)
+    token = _current.set(name)
+
+    gdal = None
+    previous = {}
+    if opts:
+        from osgeo import gdal
+        for k, v in opts.items():
+            previous[k] = gdal.GetThreadLocalConfigOption(k, None)
+            gdal.SetThreadLocalConfigOption(k, v)
+
+    try:
+        yield name
+    finally:
+        for k, v in previous.items():
+            gdal.SetThreadLocalConfigOption(k, v)
+        _current.reset(token)
+
+
+def wrap(fn):
+    """<fn> running under the profile current now, e.g. for a function submitted to a thread pool"""
+
+    name = current()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with use_profile(name):
+            return fn(*args, **kwargs)
+
+    return wrapper
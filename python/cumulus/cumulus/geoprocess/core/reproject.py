@@ -0,0 +1,340 @@
+"""Reusable warps from a product's native grid to a fixed target grid
+
+Products arrive on the same grid every time (SNODAS lat/lon, MRMS, NDGD), and
+zonal statistics warp them to the same SHG (EPSG:5070) 1000 m grid every time.
+The coordinate transform only depends on the two grids, so it is computed once.
+
+A ReprojectionIndex holds, for every target cell, the first source cell of its
+kernel, the fractional position past it and the kernel half-width, relative to the
+window of the source the target covers. Applying it is a gather and a weighted
+sum per kernel tap:
+
+    index = cached_index(source_of(ds), Target((minx, miny, maxx, maxy), 1000))
+    array = apply(index, read_window(ds, index), nodata)
+
+Indexes are kept in memory and saved as .npz files in CUMULUS_REPROJECT_CACHE
+(default /tmp/cumulus_reproject), keyed by source grid, target grid and resampling.
+
+Results follow gdalwarp -r bilinear (or near). Where target cells are larger than
+source cells, as for 1 km SNODAS warped to the 2000 m SHG grid, the bilinear
+kernel is widened to the target cell size, as gdalwarp does, instead of sampling
+only the 2 x 2 source cells around each center. Cells with nodata neighbors use
+the remaining neighbors' weights, as GDAL does.
+"""
+
+from collections import namedtuple
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from .arrays import valid_mask
+
+CACHE_DIR = os.getenv('CUMULUS_REPROJECT_CACHE', default='/tmp/cumulus_reproject')
+
+# Target rows transformed at a time when building an index
+CHUNK_ROWS = 256
+
+RESAMPLING = ('bilinear', 'near')
+
+# Part of key(); changed with the ReprojectionIndex layout so older cache files are not loaded
+INDEX_VERSION = 2
+
+# Written where a target cell has no data, when the source declares no nodata value
+NODATA = -9999.0
+
+# Native grid of a product: GDAL geotransform (north up), (rows, columns) and WKT
+Source = namedtuple('Source', ['geotransform', 'shape', 'projection'])
+
+# Target grid: (xmin, ymin, xmax, ymax) in <srs>, square cells of <resolution>
+Target = namedtuple('Target', ['extent', 'resolution', 'srs'], defaults=('EPSG:5070', ))
+
+# <inside>:   target cells within the source
+# <row>/<col>: first source row/column of each target cell's kernel, relative to <window>
+# <fy>/<fx>:  position of the target cell center past <row>/<col>, in source cells
+# <sy>/<sx>:  kernel half-width in source cells; 1 unless downsampling
+# <taps>:     (rows, columns) of source cells in the widest kernel
+# <window>:   (row offset, column offset, rows, columns) of the source read
+# <shape>, <geotransform>: of the target grid
+ReprojectionIndex = namedtuple(
+    'ReprojectionIndex', ['inside', 'row', 'col', 'fy', 'fx', 'sy', 'sx', 'taps', 'window', 'shape', 'geotransform']
+)
+
+# Indexes built or loaded in this process, by key()
+_INDEXES = {}
+
+
+def target_grid(target):
+    """(rows, columns) and GDAL geotransform of <target>"""
+
+    xmin, ymin, xmax, ymax = (float(v) for v in target.extent)
+    res = float(target.resolution)
+    shape = (int(round((ymax - ymin) / res)), int(round((xmax - xmin) / res)))
+
+    return shape, (xmin, res, 0.0, ymax, 0.0, -res)
+
+
+def key(source, target, resampling='bilinear'):
+    """Cache key of an index; geotransforms are rounded so tiny float differences share an index"""
+
+    text = repr((
+        tuple(round(float(v), 9) for v in source.geotransform), tuple(source.shape), source.projection,
+        tuple(float(v) for v in target.extent), float(target.resolution), target.srs, resampling, INDEX_VERSION,
+    ))
+
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def source_cells(x, y, geotransform, shape, resampling='bilinear', scale=(1, 1)):
+    """First kernel (row, column), positions (fy, fx), half-widths (sy, sx) and inside mask
+    for points <x>, <y> given in the source's coordinate system
+
+    <scale>  (rows, columns) of source cells per target cell at each point; bilinear
+             kernels are widened to it where it is over 1
+    """
+
+    rows, cols = shape
+    # Fractional position from the center of the upper-left source cell
+    u = (np.asarray(x, dtype=np.float64) - geotransform[0]) / geotransform[1] - 0.5
+    v = (np.asarray(y, dtype=np.float64) - geotransform[3]) / geotransform[5] - 0.5
+
+    inside = (u >= -0.5) & (u <= cols - 0.5) & (v >= -0.5) & (v <= rows - 0.5)
+    u, v = np.where(inside, u, 0), np.where(inside, v, 0)
+
+    if resampling == 'near':
+        # One cell, the nearest; within half a cell of the edge, the edge cell is used
+        col0 = np.clip(np.floor(u + 0.5), 0, cols - 1)
+        row0 = np.clip(np.floor(v + 0.5), 0, rows - 1)
+        fy = fx = np.zeros(u.shape)
+        sy = sx = np.ones(u.shape)
+    else:
+        sy, sx = (np.broadcast_to(np.asarray(s, dtype=np.float64), u.shape) for s in scale)
+        sy, sx = (np.where(np.isfinite(s), np.maximum(s, 1), 1) for s in (sy, sx))
+        # Source cells closer to the center than the half-width have weight; the first is just past center - half-width
+        col0 = np.floor(u - sx) + 1
+        row0 = np.floor(v - sy) + 1
+        fy, fx = v - row0, u - col0
+
+    return (
+        row0.astype(np.int64), col0.astype(np.int64), fy.astype(np.float32), fx.astype(np.float32),
+        sy.astype(np.float32), sx.astype(np.float32), inside,
+    )
+
+
+def pack(row0, col0, fy, fx, sy, sx, inside, shape, geotransform, source_shape):
+    """ReprojectionIndex from source_cells() of every target cell; the window covers the
+    inside cells' kernels, within the <source_shape>
+    """
+
+    if inside.any():
+        # Tap k has weight while k < f + s
+        taps = tuple(max(1, int(np.ceil((f[inside] + s[inside]).max()))) for f, s in ((fy, sy), (fx, sx)))
+        r0, r1 = max(row0[inside].min(), 0), min(row0[inside].max() + taps[0], source_shape[0])
+        c0, c1 = max(col0[inside].min(), 0), min(col0[inside].max() + taps[1], source_shape[1])
+    else:
+        taps, r0, r1, c0, c1 = (1, 1), 0, 0, 0, 0
+    window = (int(r0), int(c0), int(r1 - r0), int(c1 - c0))
+
+    return ReprojectionIndex(
+        inside.reshape(shape),
+        np.where(inside, row0 - r0, 0).astype(np.int32).reshape(shape),
+        np.where(inside, col0 - c0, 0).astype(np.int32).reshape(shape),
+        fy.reshape(shape), fx.reshape(shape), sy.reshape(shape), sx.reshape(shape),
+        taps, window, tuple(shape), tuple(geotransform),
+    )
+
+
+def build_index(source, target, resampling='bilinear'):
+    """Transform the center of every <target> cell to <source> coordinates, CHUNK_ROWS rows at a time"""
+
+    from osgeo import osr
+
+    if resampling not in RESAMPLING:
+        raise ValueError(f'resampling must be one of {RESAMPLING}: {resampling}')
+
+    shape, geotransform = target_grid(target)
+
+    source_srs, target_srs = osr.SpatialReference(), osr.SpatialReference()
+    source_srs.ImportFromWkt(source.projection)
+    target_srs.SetFromUserInput(target.srs)
+    for srs in (source_srs, target_srs):
+        # GDAL 3 otherwise uses the authority axis order (lat, lon)
+        if hasattr(srs, 'SetAxisMappingStrategy'):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(target_srs, source_srs)
+
+    rows, cols = shape
+    x = geotransform[0] + (np.arange(cols) + 0.5) * geotransform[1]
+    parts = []
+    for r in range(0, rows, CHUNK_ROWS):
+        # One row past the chunk, for the source cells between target rows
+        y = geotransform[3] + (np.arange(r, min(r + CHUNK_ROWS, rows) + 1) + 0.5) * geotransform[5]
+        xx, yy = np.meshgrid(x, y)
+        points = np.array(transform.TransformPoints(np.column_stack([xx.ravel(), yy.ravel()]).tolist()))
+        px, py = points[:, 0].reshape(xx.shape), points[:, 1].reshape(xx.shape)
+
+        # Source cells per target cell; inf or NaN where the transform failed, which source_cells() ignores
+        with np.errstate(invalid='ignore'):
+            sx = np.abs(np.gradient(px, axis=1)) / abs(source.geotransform[1]) if cols > 1 else np.ones(px.shape)
+            sy = np.abs(np.diff(py, axis=0)) / abs(source.geotransform[5])
+        parts.append(source_cells(
+            px[:-1].ravel(), py[:-1].ravel(), source.geotransform, source.shape, resampling, (sy.ravel(), sx[:-1].ravel())
+        ))
+
+    return pack(*(np.concatenate(p) for p in zip(*parts)), shape, geotransform, source.shape)
+
+
+def save(index, path):
+
+    np.savez(
+        path, inside=index.inside, row=index.row, col=index.col, fy=index.fy, fx=index.fx, sy=index.sy, sx=index.sx,
+        taps=np.array(index.taps), window=np.array(index.window), shape=np.array(index.shape),
+        geotransform=np.array(index.geotransform),
+    )
+
+    return path
+
+
+def load(path):
+
+    with np.load(path) as f:
+        return ReprojectionIndex(
+            f['inside'], f['row'], f['col'], f['fy'], f['fx'], f['sy'], f['sx'],
+            tuple(int(v) for v in f['taps']), tuple(int(v) for v in f['window']), tuple(int(v) for v in f['shape']),
+            tuple(float(v) for v in f['geotransform']),
+        )
+
+
+def cached_index(source, target, resampling='bilinear', cache_dir=None):
+    """Index for warping <source> to <target>: from memory, then CACHE_DIR, else built and saved there"""
+
+    k = key(source, target, resampling)
+    if k in _INDEXES:
+        return _INDEXES[k]
+
+    path = os.path.join(cache_dir or CACHE_DIR, f'{k}.npz')
+    if os.path.isfile(path):
+        index = load(path)
+    else:
+        logging.info(f'Building reprojection index {k}; {target}')
+        index = build_index(source, target, resampling)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written then renamed, so concurrent readers never see a partial file
+            tmp = f'{path}.{os.getpid()}.npz'
+            save(index, tmp)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.warning(f'Could not save reprojection index {path}; {e}')
+
+    _INDEXES[k] = index
+
+    return index
+
+
+def apply(index, array, nodata=None, out_nodata=None):
+    """Warp <array>, the source window of <index>, to the target grid; returns float32
+
+    Target cells outside the source, or whose neighbors are all nodata, are <out_nodata>
+    (default <nodata>, or NaN).
+    """
+
+    out_nodata = (np.nan if nodata is None else nodata) if out_nodata is None else out_nodata
+    out = np.full(index.shape, out_nodata, dtype=np.float32)
+    if array.shape != index.window[2:]:
+        raise ValueError(f'Array shape {array.shape} is not the index window {index.window}')
+
+    inside = index.inside
+    if not inside.any():
+        return out
+    row, col = index.row[inside], index.col[inside]
+    fy, fx, sy, sx = index.fy[inside], index.fx[inside], index.sy[inside], index.sx[inside]
+    rows, cols = index.window[2:]
+
+    valid = valid_mask(array, nodata).ravel()
+    values = np.where(valid, array.ravel(), 0).astype(np.float32)
+    total = weight_sum = 0
+    for ky in range(index.taps[0]):
+        # Taps past the edge of the window have no weight; clip keeps the gather in bounds
+        wy = np.maximum(1 - np.abs(ky - fy) / sy, 0) * ((row + ky >= 0) & (row + ky < rows))
+        r = np.clip(row + ky, 0, rows - 1)
+        for kx in range(index.taps[1]):
+            wx = np.maximum(1 - np.abs(kx - fx) / sx, 0) * ((col + kx >= 0) & (col + kx < cols))
+            cells = r * cols + np.clip(col + kx, 0, cols - 1)
+            weight = wy * wx * valid[cells]
+            total = total + weight * values[cells]
+            weight_sum = weight_sum + weight
+
+    has_data = weight_sum > 0
+    out[inside] = np.where(has_data, total / np.where(has_data, weight_sum, 1), out_nodata)
+
+    return out
+
+
+def source_of(ds):
+    """Source of an open GDAL dataset"""
+
+    return Source(ds.GetGeoTransform(), (ds.RasterYSize, ds.RasterXSize), ds.GetProjection())
+
+
+def read_window(ds, index, band=1):
+    """Band <band> of open GDAL dataset <ds> over the source window of <index>"""
+
+    row_off, col_off, rows, cols = index.window
+    if not rows or not cols:
+        # The target does not overlap the source
+        return np.empty((rows, cols), dtype=np.float32)
+
+    return ds.GetRasterBand(band).ReadAsArray(col_off, row_off, cols, rows)
+
+
+def target_projection(target):
+    """WKT of the coordinate system of <target>"""
+
+    from osgeo import osr
+
+    srs = osr.SpatialReference()
+    srs.SetFromUserInput(target.srs)
+
+    return srs.ExportToWkt()
+
+
+def warp_grid(grid, target, resampling='bilinear', cache_dir=None):
+    """Warp base.Grid <grid>, already in memory, to <target> with a cached index; returns base.Grid (float32)
+
+    The result's nodata is the source's, or NODATA if the source declares none.
+    """
+
+    from .base import Grid
+
+    nodata = NODATA if grid.nodata is None else grid.nodata
+    index = cached_index(Source(grid.geotransform, grid.array.shape, grid.projection), target, resampling, cache_dir)
+    row_off, col_off, rows, cols = index.window
+    array = apply(index, grid.array[row_off:row_off + rows, col_off:col_off + cols], grid.nodata, nodata)
+
+    return Grid(array, index.geotransform, target_projection(target), nodata)
+
+
+def warp(infile, target, resampling='bilinear', cache_dir=None):
+    """Warp band 1 of <infile> to <target> with a cached index; returns base.Grid (float32)
+
+    Only the source window the target covers is read, so remote COGs are read in part.
+    The result's nodata is the source's, or NODATA if the source declares none.
+    """
+
+    from osgeo import gdal
+    from .base import Grid
+
+    ds = gdal.Open(infile, gdal.GA_ReadOnly)
+    if ds is None:
+        raise RuntimeError(f'Could not open {infile}')
+    nodata = ds.GetRasterBand(1).GetNoDataValue()
+
+    index = cached_index(source_of(ds), target, resampling, cache_dir)
+    array = read_window(ds, index)
+    ds = None
+
+    out_nodata = NODATA if nodata is None else nodata
+
+    return Grid(apply(index, array, nodata, out_nodata), index.geotransform, target_projection(target), out_nodata)
@@ -0,0 +1,154 @@
+"""SHG (EPSG:5070) companion COGs of products
+
+Zonal statistics, subgrids and the Red River scripts all read products on the
+Standard Hydrologic Grid. A product registered with the filetype
+
+    <filetype>_shg      e.g. nohrsc_snodas_swe_shg
+
+is published alongside <filetype> in the same invocation: the decoded grid is
+warped once, with a cached reprojection index (geoprocess.core.reproject), to
+SHG cells of CUMULUS_SHG_RESOLUTION meters (default 2000) aligned to multiples
+of the resolution and covering the native grid.
+
+Companions are only produced when their filetype is wanted. Processors that hold
+the decoded grid in memory (SNODAS, GRIB) write the companion from it; for any
+other product, add_companions() reads the native COG back.
+"""
+
+import os
+
+import numpy as np
+from osgeo import gdal, osr
+
+from . import reproject
+from .base import grid_to_cog, read_grid
+from .encoding import PUBLISHED
+
+SUFFIX = '_shg'
+
+SRS = 'EPSG:5070'
+
+RESOLUTION = int(os.getenv('CUMULUS_SHG_RESOLUTION', default=2000))
+
+# Points sampled along each edge of a native grid to find its SHG extent
+EDGE_POINTS = 101
+
+# SHG Target of each native grid, by reproject.key()
+_TARGETS = {}
+
+
+def companion_filetype(filetype):
+    """Filetype of the SHG companion of <filetype>"""
+
+    return f'{filetype}{SUFFIX}'
+
+
+def is_companion_wanted(filetype, wanted):
+    """True if the SHG companion of <filetype> is wanted; never when everything (None) is wanted"""
+
+    return wanted is not None and companion_filetype(filetype) in wanted
+
+
+def expand_wanted(wanted):
+    """<wanted> plus the native filetype of every wanted companion, which must be produced first"""
+
+    if wanted is None:
+        return None
+
+    return set(wanted) | {f[:-len(SUFFIX)] for f in wanted if f.endswith(SUFFIX)}
+
+
+def companion_path(cog):
+    """Companion file next to native COG <cog>"""
+
+    root, ext = os.path.splitext(cog)
+
+    return f'{root}{SUFFIX}{ext or ".tif"}'
+
+
+def is_shg(projection):
+    """True if WKT <projection> is the SHG coordinate system"""
+
+    if not projection:
+        return False
+    srs, shg = osr.SpatialReference(), osr.SpatialReference()
+    srs.ImportFromWkt(projection)
+    shg.SetFromUserInput(SRS)
+
+    return bool(srs.IsSame(shg))
+
+
+def shg_target(source, resolution=None):
+    """reproject.Target on the SHG grid covering reproject.Source <source>"""
+
+    resolution = resolution or RESOLUTION
+    k = reproject.key(source, reproject.Target((0, 0, 0, 0), resolution, SRS))
+    if k in _TARGETS:
+        return _TARGETS[k]
+
+    # Edges of the native grid, in native coordinates
+    rows, cols = source.shape
+    gt = source.geotransform
+    t = np.linspace(0, 1, EDGE_POINTS)
+    px = np.concatenate([t * cols, t * cols, np.zeros_like(t), np.full_like(t, cols)])
+    py = np.concatenate([np.zeros_like(t), np.full_like(t, rows), t * rows, t * rows])
+    points = np.column_stack([gt[0] + px * gt[1] + py * gt[2], gt[3] + px * gt[4] + py * gt[5]])
+
+    source_srs, target_srs = osr.SpatialReference(), osr.SpatialReference()
+    source_srs.ImportFromWkt(source.projection)
+    target_srs.SetFromUserInput(SRS)
+    for srs in (source_srs, target_srs):
+        if hasattr(srs, 'SetAxisMappingStrategy'):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    xy = np.array(osr.CoordinateTransformation(source_srs, target_srs).TransformPoints(points.tolist()))[:, :2]
+
+    # Outward to whole cells, so every grid of every product shares cell edges
+    (xmin, ymin), (xmax, ymax) = xy.min(axis=0), xy.max(axis=0)
+    extent = tuple(float(v) for v in (
+        np.floor(xmin / resolution) * resolution, np.floor(ymin / resolution) * resolution,
+        np.ceil(xmax / resolution) * resolution, np.ceil(ymax / resolution) * resolution,
+    ))
+    _TARGETS[k] = reproject.Target(extent, resolution, SRS)
+
+    return _TARGETS[k]
+
+
+def grid_to_shg_cog(grid, cog, scratch, resolution=None):
+    """Warp base.Grid <grid> to SHG and write Float32 COG <cog>; returns (<cog>, statistics)
+
+    The COG's nodata is <grid>'s, or reproject.NODATA if <grid> has none.
+    """
+
+    source = reproject.Source(grid.geotransform, grid.array.shape, grid.projection)
+    shg = reproject.warp_grid(grid, shg_target(source, resolution))
+
+    return grid_to_cog(shg, cog, gdal.GDT_Float32, scratch, encoding=PUBLISHED, return_statistics=True)
+
+
+def companion_entry(entry, cog, stats):
+    """Productfile entry of a companion, with the datetime and version of native <entry>"""
+
+    return dict(entry, filetype=companion_filetype(entry['filetype']), file=cog, statistics=stats)
+
+
+def add_companions(outfiles, wanted, scratch, resolution=None):
+    """Companion entries for <outfiles> whose companion is wanted and not already produced
+
+    Each native COG is read back, so processors that have the decoded grid should use
+    grid_to_shg_cog() instead.
+    """
+
+    produced = {(f['filetype'], f['datetime'], f.get('version')) for f in outfiles}
+    companions = []
+    for entry in outfiles:
+        if not is_companion_wanted(entry['filetype'], wanted):
+            continue
+        if (companion_filetype(entry['filetype']), entry['datetime'], entry.get('version')) in produced:
+            continue
+
+        cog = companion_path(entry['file'])
+        companions.append(companion_entry(
+            entry, *grid_to_shg_cog(read_grid(entry['file']), cog, scratch, resolution)
+        ))
+
+    return companions
@@ -4,65 +4,128 @@ import django; django.setup()
 
 import argparse
 import logging
-import math
 import os
-import subprocess
-from tempfile import NamedTemporaryFile
+from tempfile import TemporaryDirectory
 
-from django.conf import settings
 from django.core.files import File
+import numpy as np
+from osgeo import gdal, gdal_array
 
 from offices.models import Basin
 from products.models import ProductFile
-from cumulus.utils.core.utils import checksum
 
-from .base import translate, warp
-from .helpers import buffered_extent, checksum
-
-# WARNING: EPSG 5070 (SHG) Hard Coded Temporarily
-
-
-def subgrids(productfile_object, mode='all'):
-    
-    if mode == 'all':
-        # Get Envelope for Each Basin. Note: Basin.objects.all() is Django ORM
-        # b.mpoly.envelope returns tuple with these values (xmin, ymin, xmax, ymax) 
-        basin_envelopes = {b.id: {'envelope': b.mpoly.envelope, 'office_id': b.office_id}
-            for b in Basin.objects.all()
-        }
-
-    # Transform Envelopes From Lat/Lon (EPSG ???) to SHG (EPSG 5070)
-    [e['envelope'].transform(5070) for e in basin_envelopes.values()]
-
-    # SHG Clip Extents For Each Basin; With Buffer (2*2000M; 4KM Buffer *Minimum*)
-    buffered_basin_extents = {k: buffered_extent(v['envelope'].extent, 2, 2000) for k,v in basin_envelopes.items()}
-
-    for uuid, extent in buffered_basin_extents.items():
-
-        with open(NamedTemporaryFile(suffix='.tif').name, 'w+b') as f:
-            # Write to Temporary File
-            translate(productfile_object.file.path, f.name, extent)
-            # Create ProductFile
-            p = ProductFile()  # New ProductFile
-            p.product = productfile_object.product  # Set FK of new product to parent product
-            p.file = File(f)
-            p.file.name = '{}_{}'.format('MRMS', uuid)
-            p.md5 = checksum(f.name, algorithm='MD5')
-            p.save()
+from .base import translate_with_checksum
+from .helpers import buffered_extent, extent_window, union_window, window_geotransform
+from .shg import SRS, is_shg
+from .tiles import run
+
+# Basin extents are in SHG (EPSG 5070); sources on any other grid are refused.
+# Clip the <filetype>_shg companion of such products instead (geoprocess.core.shg)
+
+
+def basin_extents(mode='all'):
+    """{basin id: buffered SHG extent (xmin, ymin, xmax, ymax)} of the basins for <mode>"""
+
+    if mode != 'all':
+        raise ValueError(f'Unsupported subgrids mode: {mode}')
+
+    # b.mpoly.envelope returns tuple with these values (xmin, ymin, xmax, ymax); Basin.objects.all() is Django ORM
+    extents = {}
+    for b in Basin.objects.all():
+        # Transform Envelopes From Lat/Lon to SHG (EPSG 5070)
+        envelope = b.mpoly.envelope
+        envelope.transform(5070)
+        # SHG Clip Extents For Each Basin; With Buffer (2*2000M; 4KM Buffer *Minimum*)
+        extents[b.id] = buffered_extent(envelope.extent, 2, 2000)
+
+    return extents
+
+
+def clip_windows(infile, extents, outdir, algorithm='MD5', max_workers=None):
+    """Clip <infile> to every extent in <extents> ({key: (xmin, ymin, xmax, ymax)}) in one read
+
+    The source is opened once and only the window covering every extent is decoded.
+    Each clip is written as a COG to <outdir>/<key>.tif by a thread pool
+    (see geoprocess.core.tiles), and checksummed while it is written.
+    Extents that miss the source are skipped; a source not on SHG raises ValueError.
+    Returns {key: (outfile, hexdigest)}
+    """
+
+    ds = gdal.Open(infile, gdal.GA_ReadOnly)
+    if ds is None:
+        raise RuntimeError(f'Could not open {infile}')
+    band = ds.GetRasterBand(1)
+    geotransform, projection = ds.GetGeoTransform(), ds.GetProjection()
+    nodata = band.GetNoDataValue()
+    shape = (ds.RasterYSize, ds.RasterXSize)
+    if not is_shg(projection):
+        raise ValueError(f'{infile} is not on SHG ({SRS}); clip its SHG companion instead')
+
+    windows = {}
+    for k, extent in extents.items():
+        window = extent_window(extent, geotransform, shape)
+        if window is None:
+            logging.warning(f'Extent {extent} of {k} does not overlap {infile}; skipped')
+            continue
+        windows[k] = window
+    if not windows:
+        return {}
+
+    # Single read of the area every basin falls in
+    union = union_window(windows.values())
+    array = band.ReadAsArray(union[1], union[0], union[3], union[2])
+    band = ds = None
+
+    def clip(item):
+        k, (row_off, col_off, rows, cols) = item
+        r, c = row_off - union[0], col_off - union[1]
+        # Each thread wraps its own MEM dataset around a copy of its window
+        mem = gdal_array.OpenArray(np.ascontiguousarray(array[r:r + rows, c:c + cols]))
+        mem.SetGeoTransform(window_geotransform(geotransform, (row_off, col_off)))
+        mem.SetProjection(projection)
+        if nodata is not None:
+            mem.GetRasterBand(1).SetNoDataValue(nodata)
+        result = translate_with_checksum(mem, os.path.join(outdir, f'{k}.tif'), algorithm)
+        mem = None
+        return k, result
+
+    return dict(run(clip, list(windows.items()), max_workers))
+
+
+def subgrids(productfile_object, mode='all', max_workers=None):
+    """Clip <productfile_object> to the buffered envelope of every basin and save each clip as a ProductFile"""
+
+    extents = basin_extents(mode)
+
+    with TemporaryDirectory() as td:
+        clips = clip_windows(productfile_object.file.path, extents, td, 'MD5', max_workers)
+
+        # Database writes stay on this thread
+        for basin_id, (outfile, md5) in clips.items():
+            with open(outfile, 'rb') as f:
+                # Create ProductFile
+                p = ProductFile()  # New ProductFile
+                p.product = productfile_object.product  # Set FK of new product to parent product
+                p.file = File(f, name='{}_{}'.format('MRMS', basin_id))
+                p.md5 = md5
+                p.save()
+
+    return len(clips)
 
 
 def main():
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('--mode', type=str, choices=['all', 'subscribed'])
-    parser.add_argument('--product-id', type=str)
+    parser.add_argument('--mode', type=str, choices=['all'], default='all')
+    parser.add_argument('--productfile-id', '--product-id', dest='productfile_id', type=str, required=True)
+    parser.add_argument('--workers', type=int, default=None, help='Clips written at once (default CUMULUS_TILE_WORKERS)')
     args = parser.parse_args()
 
-    product = Products.objects.get(id=args.product_id)
-    
-    subgrids(product, mode)
+    productfile = ProductFile.objects.get(id=args.productfile_id)
+
+    count = subgrids(productfile, args.mode, args.workers)
+    logging.info(f'{count} subgrids of productfile {args.productfile_id}')
 
 
 if __name__ == '__main__':
     main()
-
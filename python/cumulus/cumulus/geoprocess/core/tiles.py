@@ -0,0 +1,180 @@
+"""Run per-tile functions over a grid on every core
+
+A grid is split into block-aligned windows. Each Tile is read with a halo of
+extra cells on every side (clipped at the grid edge) so neighborhood operations
+such as fill see the same cells they would over the whole grid; only the window
+itself is kept.
+
+    out = map_tiles(lambda a: a * 0.01, out, array)
+    fill_nodata_tiled(infile, outfile, max_distance=35)
+
+NumPy ufuncs and GDAL reads, writes and algorithms release the GIL, so tiles run
+in a thread pool of CUMULUS_TILE_WORKERS threads (default: CPU count). Each
+thread opens its own GDAL dataset handles; results are written by one thread.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+from .arrays import BLOCKSIZE, active_blocks
+
+# Windows read from and written to files; a multiple of the GeoTIFF tile size
+RASTER_BLOCKSIZE = 4 * BLOCKSIZE
+
+# Threads per map_tiles()/map_raster() call; 1 runs tiles in the calling thread
+WORKERS = int(os.getenv('CUMULUS_TILE_WORKERS', default=0)) or os.cpu_count() or 1
+
+# <window>: (row slice, column slice) of the grid this tile produces
+# <read>:   <window> grown by the halo and clipped to the grid
+# <inner>:  <window> within the array read
+Tile = namedtuple('Tile', ['window', 'read', 'inner'])
+
+
+def set_workers(workers):
+    """Threads used for tiles; None for the CPU count"""
+
+    global WORKERS
+
+    WORKERS = workers or os.cpu_count() or 1
+
+
+def tiles(shape, blocksize=BLOCKSIZE, halo=0, active=None):
+    """Tiles covering a grid of <shape>; only blocks with a True cell of boolean <active>, if given"""
+
+    rows, cols = shape
+    if active is None:
+        windows = [
+            (slice(r, r + blocksize), slice(c, c + blocksize))
+            for r in range(0, rows, blocksize) for c in range(0, cols, blocksize)
+        ]
+    else:
+        windows = active_blocks(active, blocksize)
+
+    result = []
+    for window in windows:
+        (r0, r1), (c0, c1) = ((w.start, min(w.stop, n)) for w, n in zip(window, (rows, cols)))
+        read_r0, read_c0 = max(0, r0 - halo), max(0, c0 - halo)
+        result.append(Tile(
+            (slice(r0, r1), slice(c0, c1)),
+            (slice(read_r0, min(rows, r1 + halo)), slice(read_c0, min(cols, c1 + halo))),
+            (slice(r0 - read_r0, r1 - read_r0), slice(c0 - read_c0, c1 - read_c0)),
+        ))
+
+    return result
+
+
+def run(fn, items, max_workers=None):
+    """[fn(item) for item in <items>], in a thread pool of <max_workers> (default WORKERS)"""
+
+    max_workers = min(max_workers or WORKERS, len(items))
+    if max_workers <= 1:
+        return [fn(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fn, items))
+
+
+def map_tiles(fn, out, *arrays, blocksize=BLOCKSIZE, halo=0, active=None, max_workers=None):
+    """out[tile] = fn(*(a[tile + halo] for a in arrays))[inner] for each tile; returns <out>
+
+    Tiles write disjoint windows of <out>, so they run in parallel. With boolean
+    <active>, only blocks with an active cell are computed, as with arrays.sparse_apply().
+    """
+
+    def apply(tile):
+        out[tile.window] = fn(*(a[tile.read] for a in arrays))[tile.inner]
+
+    run(apply, tiles(out.shape, blocksize, halo, active), max_workers)
+
+    return out
+
+
+def map_raster(fn, infiles, outfile, datatype=None, nodata=None, blocksize=RASTER_BLOCKSIZE, halo=0,
+               max_workers=None, encoding=None):
+    """Write fn(*(band 1 of each of <infiles>, tile + halo)) to GeoTIFF <outfile> one tile at a time
+
+    <fn> returns an array the shape of its inputs; only the tile's window is written.
+    Georeferencing, and <datatype> and <nodata> unless given, come from the first infile.
+    Intermediate encoding unless <encoding>; returns <outfile>.
+    """
+
+    from osgeo import gdal
+    from .encoding import INTERMEDIATE, creation_options
+
+    ds = gdal.Open(infiles[0], gdal.GA_ReadOnly)
+    band = ds.GetRasterBand(1)
+    datatype = datatype or band.DataType
+    nodata = band.GetNoDataValue() if nodata is None else nodata
+
+    out = gdal.GetDriverByName('GTiff').Create(
+        outfile, ds.RasterXSize, ds.RasterYSize, 1, datatype, options=creation_options(encoding or INTERMEDIATE)
+    )
+    out.SetGeoTransform(ds.GetGeoTransform())
+    out.SetProjection(ds.GetProjection())
+    if nodata is not None:
+        out.GetRasterBand(1).SetNoDataValue(nodata)
+    shape = (ds.RasterYSize, ds.RasterXSize)
+    band = ds = None
+
+    # GDAL datasets are not thread safe; one handle per infile per thread
+    local, opened = threading.local(), []
+
+    def compute(tile):
+        if not hasattr(local, 'bands'):
+            local.datasets = [gdal.Open(f, gdal.GA_ReadOnly) for f in infiles]
+            local.bands = [d.GetRasterBand(1) for d in local.datasets]
+            opened.append(local)
+        rows, cols = tile.read
+        arrays = [
+            b.ReadAsArray(cols.start, rows.start, cols.stop - cols.start, rows.stop - rows.start) for b in local.bands
+        ]
+        return fn(*arrays)[tile.inner]
+
+    def write(tile):
+        out.GetRasterBand(1).WriteArray(compute(tile), xoff=tile.window[1].start, yoff=tile.window[0].start)
+
+    _tiles = tiles(shape, blocksize, halo)
+    max_workers = min(max_workers or WORKERS, len(_tiles))
+    try:
+        if max_workers <= 1:
+            for tile in _tiles:
+                write(tile)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # Results are written here, by one thread, in tile order
+                for tile, array in zip(_tiles, executor.map(compute, _tiles)):
+                    out.GetRasterBand(1).WriteArray(array, xoff=tile.window[1].start, yoff=tile.window[0].start)
+    finally:
+        for _local in opened:
+            _local.bands = _local.datasets = None
+        out = None
+
+    return outfile
+
+
+def fill_nodata_tiled(infile, outfile, max_distance=35, blocksize=RASTER_BLOCKSIZE, max_workers=None):
+    """gdal.FillNodata() over tiles with a halo of <max_distance>, in parallel
+
+    FillNodata only looks <max_distance> cells away, so each cell gets the value it
+    would get from filling the whole grid. Smoothing iterations are 0, as in
+    base.fill_nodata_values().
+    """
+
+    from osgeo import gdal, gdal_array
+
+    ds = gdal.Open(infile, gdal.GA_ReadOnly)
+    nodata = ds.GetRasterBand(1).GetNoDataValue()
+    ds = None
+
+    def fill(array):
+        mem = gdal_array.OpenArray(array)
+        if nodata is not None:
+            mem.GetRasterBand(1).SetNoDataValue(nodata)
+        gdal.FillNodata(mem.GetRasterBand(1), None, max_distance, 0)
+        filled = mem.GetRasterBand(1).ReadAsArray()
+        mem = None
+        return filled
+
+    return map_raster(fill, [infile], outfile, blocksize=blocksize, halo=max_distance, max_workers=max_workers)
@@ -1,49 +1,21 @@
+from affine import Affine
 import argparse
 from datetime import datetime, timedelta
 import json
 import logging
 import os
 from rasterstats import zonal_stats
-import subprocess
-import tempfile
 from timeit import default_timer as timer
-from uuid import uuid4
+
+from cumulus.geoprocess.core import reproject
 
 
 # THIS SCRIPT IS DEVELOPED AS A QUICK ONE-OFF
 # IT SHOULD BE GENERALIZED IN THE FUTURE WHEN POSSIBLE
 # BEWARE OF HARD-CODING LIKE "/var/www/html"
 
-def warp_to_vrt(infile, outfile, extra_args=None):
-    """
-    Convert SNODAS file to geotiff format
-    """
-
-    logging.info('  gdalwarp; infile: {}; outfile: {}'.format(infile, outfile))
-
-    # Basics of creating a tiled and compressed geotiff
-    cmd = [
-        'gdalwarp',
-        '-t_srs', 'EPSG:5070',
-        '-r', 'bilinear',
-    ]
-
-    if extra_args is not None:
-        cmd += extra_args
-
-    cmd += [infile, outfile]
-
-    logging.debug('run command: {}'.format(' '.join(cmd)))
-
-    p = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-    )
-
-    out, err = p.communicate()
-
-    return outfile
+# SHG 1000 m grid over the Red River basin; same extent the gdalwarp step used
+REDRIVER_TARGET = reproject.Target((-356000, 2494000, 150000, 2950000), 1000)
 
 
 # Iterate over the list with this
@@ -111,21 +83,19 @@ if __name__ == "__main__":
             raster = f'{base_url}/{product}/{get_productname(product, dt)}'
             logging.info(f'processing raster: {raster}')
 
-            with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td:
-
-                # Warp file to EPSG:5070 (Equal Area Projection)
-                _tstart_download_warp = timer()
-                out_filename = f'{product}_{dt.strftime("%Y_%m_%d")}_EPSG5070.vrt'
-                # outfile_shg = warp_to_vrt(f'/vsicurl/{raster}', os.path.join(td, out_filename))
-                outfile_shg = warp_to_vrt(f'/vsicurl/{raster}', os.path.join(td, out_filename), extra_args=[
-                                          '-te', '-356000', '2494000', '150000', '2950000', '-te_srs', 'EPSG:5070', '-tr', '1000', '1000'])
-                _tend_download_warp = timer()
-
-                # Area Statistics
-                _tstart_stats = timer()
-                shapefile = os.path.join("./", "misc", "REDRIVER_HUC10_EPSG5070.shp")
-                zs = zonal_stats(shapefile, outfile_shg, stats=["min", "max", "mean", "count", ], geojson_out=True)
-                _tend_stats = timer()
+            # Warp file to EPSG:5070 (Equal Area Projection); the transform is computed on the first day only
+            _tstart_download_warp = timer()
+            grid = reproject.warp(f'/vsicurl/{raster}', REDRIVER_TARGET)
+            _tend_download_warp = timer()
+
+            # Area Statistics
+            _tstart_stats = timer()
+            shapefile = os.path.join("./", "misc", "REDRIVER_HUC10_EPSG5070.shp")
+            zs = zonal_stats(
+                shapefile, grid.array, affine=Affine.from_gdal(*grid.geotransform), nodata=grid.nodata,
+                stats=["min", "max", "mean", "count", ], geojson_out=True
+            )
+            _tend_stats = timer()
 
             # Save Area Statistics to JSON
             datetime_string = dt.strftime("%Y_%m_%d")
@@ -3,6 +3,8 @@ import json
 import logging
 import shutil
 
+SUPPORTED_ALGORITHMS = ('SHA256', 'MD5')
+
 
 def checksum(file, algorithm='SHA256', size=1000000):
     """Generate a checksum/hash for a given file.
@@ -11,30 +13,100 @@ def checksum(file, algorithm='SHA256', size=1000000):
     block_size
         Number of bytes to read at a time. Default: 1000000 (1MB)
 
+    Reads into one reusable buffer (readinto) rather than allocating a new
+    bytes object per block. Prefer getting the digest from HashingStream
+    while a file is written or uploaded; this is for files that already exist.
+
     https://stackoverflow.com/questions/2229298/python-md5-not-matching-md5-in-terminal
     https://stackoverflow.com/questions/22058048/hashing-a-file-in-python
     """
-    supported_algorithms = {
-        'SHA256': hashlib.sha256(),
-        'MD5': hashlib.md5()
-    }
 
-    try:
-        checksum = supported_algorithms[algorithm.upper()]
-    except:
+    if algorithm.upper() not in SUPPORTED_ALGORITHMS:
         logging.error('Checksum algorithm not supported: {}'.format(algorithm))
         return None
 
-    with open(file, 'rb') as f:
+    checksum = hashlib.new(algorithm.lower())
+
+    buf = bytearray(size)
+    view = memoryview(buf)
+    with open(file, 'rb', buffering=0) as f:
         while True:
-            data = f.read(size)
-            if len(data) == 0:
+            n = f.readinto(buf)
+            if not n:
                 break
-            checksum.update(data)
+            checksum.update(view[:n])
 
     return checksum.hexdigest()
 
 
+class HashingStream:
+    """Wrap a binary file object and hash every byte that passes through it
+
+    Works in both directions: bytes written with write() and bytes read with
+    read()/readinto() update the digests, so a checksum can be produced in the
+    same pass that writes or uploads a file.
+
+        with HashingStream(open(outfile, 'wb'), ['MD5']) as f:
+            f.write(data)
+        f.hexdigest('MD5')
+    """
+
+    def __init__(self, fileobj, algorithms=('MD5',)):
+        for a in algorithms:
+            if a.upper() not in SUPPORTED_ALGORITHMS:
+                raise ValueError('Checksum algorithm not supported: {}'.format(a))
+
+        self._fileobj = fileobj
+        self._hashes = {a.upper(): hashlib.new(a.lower()) for a in algorithms}
+        self.bytes = 0
+
+    def _update(self, data):
+        for h in self._hashes.values():
+            h.update(data)
+        self.bytes += len(data)
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._update(data)
+        return data
+
+    def readinto(self, b):
+        n = self._fileobj.readinto(b)
+        if n:
+            self._update(memoryview(b)[:n])
+        return n
+
+    def write(self, b):
+        n = self._fileobj.write(b)
+        self._update(memoryview(b)[:n] if n is not None else b)
+        return n
+
+    def hexdigest(self, algorithm=None):
+        """Digest for <algorithm>; the only algorithm if just one was requested"""
+
+        if algorithm is None:
+            if len(self._hashes) != 1:
+                raise ValueError('algorithm required when hashing with more than one algorithm')
+            return next(iter(self._hashes.values())).hexdigest()
+
+        return self._hashes[algorithm.upper()].hexdigest()
+
+    def hexdigests(self):
+        return {k: v.hexdigest() for k, v in self._hashes.items()}
+
+    def close(self):
+        self._fileobj.close()
+
+    def __getattr__(self, name):
+        return getattr(self._fileobj, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 import errno
 import gzip
 import os
@@ -0,0 +1,223 @@
+"""Intermediate files that are deleted as soon as their last consumer is done
+
+Lambda has one /tmp (512 MB by default) shared by every record running in a
+container. Rather than leaving intermediates until a TemporaryDirectory exits,
+stages ask a ScratchSpace for a path, say how many consumers will read it, and
+release it after each use; the file is removed on the last release. Bytes held
+by every ScratchSpace in the process are totalled in USAGE, which keeps the
+high-water mark for an invocation.
+
+    with ScratchSpace(outdir) as scratch:
+        tif = scratch.path('.tif')
+        gdal.Translate(tif, ds)
+        scratch.written(tif)
+        translate(tif, cog)
+        scratch.release(tif)
+
+With CUMULUS_INTERMEDIATES=memory (or set_intermediates('memory')) new paths are in
+GDAL's /vsimem/ in-memory filesystem while /vsimem/ intermediates fit in
+VSIMEM_BUDGET bytes, and on disk in <root> after that. Consumers that are not GDAL
+(command line utilities) cannot open /vsimem/ paths; the wrappers in
+geoprocess.core.base switch to in-process GDAL for them.
+"""
+
+import logging
+import os
+import threading
+from uuid import uuid4
+
+# Files GDAL may leave beside an intermediate
+SIDECAR_EXTENSIONS = ('.aux.xml', '.ovr', '.msk')
+
+# Where new intermediates go: 'disk' or 'memory' (GDAL /vsimem/)
+INTERMEDIATES = os.getenv('CUMULUS_INTERMEDIATES', default='disk').lower()
+
+# Bytes of /vsimem/ intermediates held at once before new ones fall back to disk
+VSIMEM_BUDGET = int(os.getenv('CUMULUS_VSIMEM_BUDGET', default=512 * 1024 ** 2))
+
+
+class ScratchUsage:
+    """Bytes currently held in scratch files and the high-water mark since reset()"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.high_water = 0
+
+    def add(self, nbytes):
+        with self._lock:
+            self.current += nbytes
+            self.high_water = max(self.high_water, self.current)
+
+    def remove(self, nbytes):
+        with self._lock:
+            self.current -= nbytes
+
+    def reset(self):
+        """Start a new high-water mark from what is held now (e.g. at the start of an invocation)"""
+
+        with self._lock:
+            self.high_water = self.current
+
+    def log(self, label='scratch'):
+        logging.info(f'{label}; high-water {self.high_water} bytes; held {self.current} bytes')
+
+
+# Process-wide totals; files on disk and in /vsimem/
+USAGE = ScratchUsage()
+VSIMEM_USAGE = ScratchUsage()
+
+
+def set_intermediates(mode, budget=None):
+    """Switch where new intermediates go: 'disk' or 'memory'; optionally change VSIMEM_BUDGET"""
+
+    global INTERMEDIATES, VSIMEM_BUDGET
+
+    if mode not in ('disk', 'memory'):
+        raise ValueError(f'Unknown intermediates mode: {mode}')
+
+    INTERMEDIATES = mode
+    if budget is not None:
+        VSIMEM_BUDGET = int(budget)
+
+
+def is_vsimem(path):
+    return str(path).startswith('/vsimem/')
+
+
+def _with_sidecars(path):
+    return (path, ) + tuple(f'{path}{ext}' for ext in SIDECAR_EXTENSIONS)
+
+
+def file_size(path):
+    """Size of <path> plus GDAL sidecars; 0 if it does not exist"""
+
+    total = 0
+    if is_vsimem(path):
+        from osgeo import gdal
+        for p in _with_sidecars(path):
+            stat = gdal.VSIStatL(p)
+            if stat is not None:
+                total += stat.size
+        return total
+
+    for p in _with_sidecars(path):
+        try:
+            total += os.path.getsize(p)
+        except OSError:
+            pass
+
+    return total
+
+
+def remove_with_sidecars(path):
+    if is_vsimem(path):
+        from osgeo import gdal
+        for p in _with_sidecars(path):
+            if gdal.VSIStatL(p) is not None:
+                gdal.Unlink(p)
+        return
+
+    for p in _with_sidecars(path):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+
+class ScratchSpace:
+    """Reference-counted intermediate files in directory <root>"""
+
+    def __init__(self, root, usage=USAGE):
+        self.root = root
+        self.usage = usage
+        self._lock = threading.Lock()
+        self._refs = {}
+        self._sizes = {}
+
+    def _usage(self, path):
+        return VSIMEM_USAGE if is_vsimem(path) else self.usage
+
+    def path(self, suffix='', consumers=1, prefix='temp-', estimate=0, in_memory=None):
+        """New unique path that will be deleted after <consumers> calls to release()
+
+        The path is in /vsimem/ if <in_memory> (default: INTERMEDIATES == 'memory') and
+        <estimate> more bytes fit in VSIMEM_BUDGET; otherwise it is in <root>.
+        <estimate> is held against the budget until written() measures the file.
+        """
+
+        if in_memory is None:
+            in_memory = INTERMEDIATES == 'memory'
+
+        name = f'{prefix}{uuid4()}{suffix}'
+        if in_memory and VSIMEM_USAGE.current + estimate <= VSIMEM_BUDGET:
+            path = f'/vsimem/{uuid4()}/{name}'
+        else:
+            if in_memory:
+                logging.debug(f'/vsimem/ budget of {VSIMEM_BUDGET} bytes reached; {name} goes to disk')
+            path = os.path.join(self.root, name)
+
+        with self._lock:
+            self._refs[path] = consumers
+            self._sizes[path] = estimate
+        self._usage(path).add(estimate)
+
+        return path
+
+    def adopt(self, path, consumers=1):
+        """Manage an existing file (e.g. a download); it is measured now and deleted after <consumers> releases"""
+
+        with self._lock:
+            self._refs[path] = consumers
+        self.written(path)
+
+        return path
+
+    def written(self, path):
+        """Record the size of <path> once a stage has finished writing it; returns the size"""
+
+        size = file_size(path)
+        with self._lock:
+            previous = self._sizes.get(path, 0)
+            self._sizes[path] = size
+        self._usage(path).add(size - previous)
+
+        return size
+
+    def release(self, path):
+        """One consumer of <path> is finished; the file is deleted after the last"""
+
+        with self._lock:
+            refs = self._refs.get(path, 0) - 1
+            if refs > 0:
+                self._refs[path] = refs
+                return False
+            self._refs.pop(path, None)
+            size = self._sizes.pop(path, 0)
+
+        remove_with_sidecars(path)
+        self._usage(path).remove(size)
+
+        return True
+
+    def held(self):
+        """Bytes currently held by this ScratchSpace"""
+
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def close(self):
+        """Delete every file still managed"""
+
+        with self._lock:
+            paths = list(self._refs)
+        for path in paths:
+            with self._lock:
+                self._refs[path] = 1
+            self.release(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
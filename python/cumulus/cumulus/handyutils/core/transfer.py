@@ -0,0 +1,290 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import HashingStream
+
+# Bytes written to disk per iteration when streaming a response
+CHUNK_SIZE = 1024 * 1024
+
+# Connections kept alive per host; also the default number of concurrent downloads
+POOL_SIZE = 16
+
+# Status codes that are worth another attempt
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Shared requests.Session with a keep-alive connection pool
+
+    The pool is sized so every worker in download_many() can hold its own
+    connection. The adapter does not retry; download() is the only retry layer,
+    so attempts and backoff are not compounded.
+    """
+
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(
+                pool_connections=POOL_SIZE,
+                pool_maxsize=POOL_SIZE,
+            )
+            s = requests.Session()
+            s.mount('http://', adapter)
+            s.mount('https://', adapter)
+            _session = s
+
+    return _session
+
+
+def _partial_file(outfile):
+    return f'{outfile}.part'
+
+
+def _validator_file(partfile):
+    return f'{partfile}.json'
+
+
+def _validator(url, r):
+    """What identifies the object behind <r>: url and ETag, else Last-Modified; None if neither is sent"""
+
+    tag = r.headers.get('ETag') or r.headers.get('Last-Modified')
+    if tag is None or tag.startswith('W/'):
+        # Weak ETags cannot be used with If-Range
+        return None
+
+    return {'url': url, 'if_range': tag}
+
+
+def _resumable(url, partfile):
+    """Validator of <partfile> if it can be resumed for <url>; otherwise the partial file is removed"""
+
+    validator = None
+    try:
+        with open(_validator_file(partfile)) as f:
+            validator = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    if validator is not None and validator.get('url') == url and os.path.isfile(partfile):
+        return validator
+
+    # Left by another url, or by a response without a validator; its bytes cannot be trusted
+    for f in (partfile, _validator_file(partfile)):
+        if os.path.isfile(f):
+            os.remove(f)
+
+    return None
+
+
+def _hash_existing(path, algorithm, size=CHUNK_SIZE):
+    """Seed a hash with bytes already on disk from an earlier, interrupted attempt"""
+
+    h = hashlib.new(algorithm)
+    if os.path.isfile(path):
+        buf = bytearray(size)
+        view = memoryview(buf)
+        with open(path, 'rb') as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(view[:n])
+
+    return h
+
+
+def download(url, outfile, chunk_size=CHUNK_SIZE, retries=5, backoff=0.5, algorithm=None, session=None, timeout=60, verify=True):
+    """Stream <url> to <outfile> in <chunk_size> pieces
+
+    Bytes land in <outfile>.part first, with the url and ETag (or Last-Modified)
+    of the object in <outfile>.part.json. When a transfer breaks mid-stream the
+    next attempt asks for the remaining bytes with Range and If-Range headers and
+    appends to the partial file. A partial file without a matching validator is
+    deleted, and a 200 answer (Range ignored, or the object changed) restarts from
+    zero. Bodies are requested without Content-Encoding, so offsets are in the
+    bytes stored on disk. <outfile> only appears once the download is complete.
+
+    If <algorithm> is given (e.g. 'md5', 'sha256') the digest is computed while
+    streaming, so the file does not need to be read again afterwards.
+
+    Returns dictionary { "url": ..., "file": ..., "size": ..., "checksum": ..., "attempts": ... }
+    """
+
+    session = session if session is not None else get_session()
+
+    outfile = os.path.abspath(outfile)
+    partfile = _partial_file(outfile)
+
+    attempt = 0
+    while True:
+        attempt += 1
+        validator = _resumable(url, partfile)
+        offset = os.path.getsize(partfile) if validator is not None else 0
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers.update({'Range': f'bytes={offset}-', 'If-Range': validator['if_range']})
+
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout, verify=verify) as r:
+
+                if r.status_code == 416:
+                    # Range not satisfiable; partial file is unusable, start over
+                    logging.warning(f'Range request rejected; restarting download: {url}')
+                    os.remove(partfile)
+                    raise requests.exceptions.ContentDecodingError('range not satisfiable')
+
+                r.raise_for_status()
+
+                if offset and (r.status_code != 206 or 'Content-Encoding' in r.headers):
+                    # Server ignored the Range header, the object changed, or the body is encoded
+                    logging.debug(f'Partial download cannot be resumed; restarting: {url}')
+                    offset = 0
+
+                if not offset:
+                    validator = _validator(url, r)
+                    if validator is None:
+                        if os.path.isfile(_validator_file(partfile)):
+                            os.remove(_validator_file(partfile))
+                    else:
+                        with open(_validator_file(partfile), 'w') as f:
+                            json.dump(validator, f)
+
+                h = None
+                if algorithm is not None:
+                    h = _hash_existing(partfile, algorithm) if offset else hashlib.new(algorithm)
+
+                with open(partfile, 'ab' if offset else 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        if h is not None:
+                            h.update(chunk)
+
+                # Truncated body; urllib3 does not always raise for this on its own
+                # Content-Length is the encoded size, so only compare when the body is not encoded
+                expected = r.headers.get('Content-Length')
+                if expected is not None and 'Content-Encoding' not in r.headers and os.path.getsize(partfile) != offset + int(expected):
+                    raise requests.exceptions.ChunkedEncodingError(
+                        f'expected {offset + int(expected)} bytes; received {os.path.getsize(partfile)}'
+                    )
+
+            break
+
+        except requests.exceptions.HTTPError as e:
+            # 4xx other than 416 will not get better with another attempt
+            if e.response is not None and e.response.status_code not in RETRY_STATUS:
+                raise
+            if attempt >= retries:
+                raise
+
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ContentDecodingError,
+                requests.exceptions.Timeout) as e:
+            if attempt >= retries:
+                raise
+            logging.warning(f'Download attempt {attempt} of {retries} failed; {url}; {e}')
+
+        time.sleep(backoff * 2 ** (attempt - 1))
+
+    os.replace(partfile, outfile)
+    if os.path.isfile(_validator_file(partfile)):
+        os.remove(_validator_file(partfile))
+
+    return {
+        "url": url,
+        "file": outfile,
+        "size": os.path.getsize(outfile),
+        "checksum": h.hexdigest() if h is not None else None,
+        "attempts": attempt,
+    }
+
+
+def download_many(items, max_workers=POOL_SIZE, **kwargs):
+    """Download many (url, outfile) pairs concurrently over the shared session
+
+    Keyword arguments are passed through to download(). Results are returned
+    in the same order as <items>. The first failure is raised after all
+    other downloads have finished.
+    """
+
+    items = list(items)
+    if not items:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [executor.submit(download, url, outfile, **kwargs) for url, outfile in items]
+
+    return [f.result() for f in futures]
+
+
+class MultipartUpload:
+    """multipart/form-data body that streams a file and hashes it on the way out
+
+    <fields> are sent first, then the file as form field <name>, then
+    <checksum_field> holding the <algorithm> hexdigest of the bytes just sent.
+    The length is known up front, so the body goes out with a Content-Length and
+    the file is never held in memory:
+
+        body = MultipartUpload(path, 'file', {'product': ...}, 'md5')
+        session.post(url, data=body, headers={'Content-Type': body.content_type})
+        body.hexdigest()
+    """
+
+    def __init__(self, path, name, fields, checksum_field, algorithm='MD5', chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+
+        self._head = b''.join(self._field(k, v) for k, v in fields.items()) + (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"; filename="{os.path.basename(path)}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8')
+        self._checksum_field = checksum_field
+        self._digest_size = hashlib.new(algorithm.lower()).digest_size * 2
+        self._stream = None
+
+    def _field(self, name, value):
+        return (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        ).encode('utf-8')
+
+    def _tail(self, digest):
+        return b'\r\n' + self._field(self._checksum_field, digest) + f'--{self.boundary}--\r\n'.encode('utf-8')
+
+    def __len__(self):
+        return len(self._head) + os.path.getsize(self.path) + len(self._tail('0' * self._digest_size))
+
+    def __iter__(self):
+        yield self._head
+        with HashingStream(open(self.path, 'rb'), [self.algorithm]) as f:
+            self._stream = f
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        yield self._tail(self.hexdigest())
+
+    def hexdigest(self):
+        """Digest of the file bytes sent; only available once the body has been sent"""
+
+        if self._stream is None:
+            raise RuntimeError('upload has not been sent')
+
+        return self._stream.hexdigest()
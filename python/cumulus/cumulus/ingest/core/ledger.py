@@ -0,0 +1,192 @@
+"""Record of S3 objects that have already been processed
+
+S3 event delivery is at-least-once and upstream acquisition re-puts objects,
+so the same (bucket, key, etag, size) can arrive more than once. The ledger
+maps that identity to the productfiles it produced so a duplicate can be
+answered without downloading or processing anything.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus
+
+# Where the local ledger lives. /tmp survives between warm Lambda invocations
+LOCAL_LEDGER_PATH = '/tmp/cumulus_ingest_ledger.sqlite3'
+
+# Table used by DatabaseLedger; created with sql/ingest_ledger.sql, not by the Lambda
+DATABASE_LEDGER_TABLE = 'ingest_ledger'
+
+# PostgreSQL SQLSTATE of a query on a table that does not exist
+UNDEFINED_TABLE = '42P01'
+
+
+def object_identity(record):
+    """(bucket, key, etag, size) for an S3 event record
+    etag is None if the event does not carry one
+    """
+
+    s3 = record['s3']
+    etag = s3['object'].get('eTag')
+
+    return (
+        s3['bucket']['name'],
+        unquote_plus(s3['object']['key']),
+        etag.strip('"') if etag else None,
+        s3['object'].get('size'),
+    )
+
+
+def coalesce_records(records):
+    """Drop duplicate (bucket, key) records from one event batch
+
+    The record with the highest S3 sequencer is kept, since it describes the
+    latest version of the object. Order of first appearance is preserved.
+    """
+
+    def sequencer(record):
+        # Sequencers are hex strings of varying length; compare as numbers
+        s = record['s3']['object'].get('sequencer')
+        return int(s, 16) if s else -1
+
+    keep = {}
+    for record in records:
+        bucket, key, _, _ = object_identity(record)
+        if (bucket, key) in keep:
+            logging.info(f'Duplicate record in batch; Bucket {bucket}; Key {key}')
+            if sequencer(record) < sequencer(keep[(bucket, key)]):
+                continue
+        keep[(bucket, key)] = record
+
+    # dict keeps insertion order of first appearance
+    return list(keep.values())
+
+
+class LocalLedger:
+    """Ledger in a SQLite file on local disk"""
+
+    def __init__(self, path=LOCAL_LEDGER_PATH):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ingested ('
+                'bucket TEXT NOT NULL, key TEXT NOT NULL, etag TEXT NOT NULL, size INTEGER, '
+                'productfiles TEXT NOT NULL, ingested_at TEXT NOT NULL, '
+                'PRIMARY KEY (bucket, key, etag, size))'
+            )
+
+    def _connect(self):
+        # New connection per call; safe to share a ledger between worker threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, bucket, key, etag, size):
+        """List of productfiles recorded for this object, or None if never processed"""
+
+        if etag is None:
+            return None
+
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT productfiles FROM ingested WHERE bucket=? AND key=? AND etag=? AND size IS ?',
+                (bucket, key, etag, size)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        return json.loads(row[0]) if row is not None else None
+
+    def record(self, bucket, key, etag, size, productfiles):
+
+        if etag is None:
+            return
+
+        # closing() closes the connection; the inner "with conn" commits
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO ingested VALUES (?, ?, ?, ?, ?, ?)',
+                (bucket, key, etag, size, json.dumps(productfiles), datetime.now(timezone.utc).isoformat())
+            )
+
+
+class DatabaseLedger:
+    """Ledger in the Cumulus database, shared by every Lambda container
+
+    <connect> is a zero-argument function returning a DB-API connection
+    The table is not created here; see sql/ingest_ledger.sql
+    """
+
+    def __init__(self, connect, table=DATABASE_LEDGER_TABLE):
+        self.connect = connect
+        self.table = table
+
+    def _execute(self, sql, params=None, fetch=False):
+        conn = self.connect()
+        try:
+            c = conn.cursor()
+            c.execute(sql, params)
+            rows = c.fetchall() if fetch else None
+            conn.commit()
+            c.close()
+        except Exception as e:
+            if getattr(e, 'pgcode', None) == UNDEFINED_TABLE:
+                raise RuntimeError(
+                    f'Ingest ledger table {self.table} does not exist; create it with sql/ingest_ledger.sql '
+                    'or set CUMULUS_INGEST_LEDGER=local'
+                ) from e
+            raise
+        finally:
+            conn.close()
+
+        return rows
+
+    def get(self, bucket, key, etag, size):
+
+        if etag is None:
+            return None
+
+        rows = self._execute(
+            f'SELECT productfiles, size FROM {self.table} WHERE bucket=%s AND key=%s AND etag=%s',
+            (bucket, key, etag), fetch=True
+        )
+        if not rows or (size is not None and rows[0][1] is not None and rows[0][1] != size):
+            return None
+
+        return json.loads(rows[0][0])
+
+    def record(self, bucket, key, etag, size, productfiles):
+
+        if etag is None:
+            return
+
+        self._execute(
+            f'INSERT INTO {self.table} (bucket, key, etag, size, productfiles) VALUES (%s, %s, %s, %s, %s) '
+            'ON CONFLICT (bucket, key, etag) DO UPDATE SET '
+            'size=EXCLUDED.size, productfiles=EXCLUDED.productfiles, ingested_at=now()',
+            (bucket, key, etag, size, json.dumps(productfiles))
+        )
+
+
+def ledger_from_env(connect=None):
+    """Ledger selected by environment variable CUMULUS_INGEST_LEDGER
+
+        local (default)  LocalLedger at CUMULUS_INGEST_LEDGER_PATH (default LOCAL_LEDGER_PATH)
+        database         DatabaseLedger using <connect>
+        none             no ledger; every record is processed
+    """
+
+    kind = os.getenv('CUMULUS_INGEST_LEDGER', default='local').lower()
+
+    if kind == 'none':
+        return None
+    if kind == 'database':
+        if connect is None:
+            raise ValueError('CUMULUS_INGEST_LEDGER=database requires a database connection')
+        return DatabaseLedger(connect)
+    if kind == 'local':
+        return LocalLedger(os.getenv('CUMULUS_INGEST_LEDGER_PATH', default=LOCAL_LEDGER_PATH))
+
+    raise ValueError(f'Unknown CUMULUS_INGEST_LEDGER: {kind}')
@@ -0,0 +1,178 @@
+"""Bulk load of productfile rows with COPY
+
+One INSERT ... VALUES per batch is fine for the handful of productfiles a
+single S3 object produces. A backfill registers hundreds of thousands, so
+here rows are streamed with COPY FROM STDIN into a temporary staging table
+and merged into productfile with one set-based INSERT ... SELECT that
+ignores conflicts.
+
+    stats = load_productfiles(db_connection, entries)
+    # {"rows": 250000, "inserted": 249120, "seconds": 6.1, "rows_per_second": 40983.6}
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+from timeit import default_timer as timer
+
+# Columns of productfile written by processors, in COPY order
+PRODUCTFILE_COLUMNS = ('datetime', 'file', 'product_id', 'version')
+
+# Conflict target for productfile
+PRODUCTFILE_CONSTRAINT = 'unique_product_version_datetime'
+
+# Below this many rows a plain INSERT ... VALUES is as fast and simpler
+COPY_THRESHOLD = 1000
+
+# Characters with a meaning in COPY text format
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def copy_value(value):
+    """A Python value as a COPY text format field"""
+
+    if value is None:
+        return '\\N'
+
+    return str(value).translate(_ESCAPES)
+
+
+class RowStream(io.TextIOBase):
+    """File-like object producing COPY text format lines from dictionaries, on demand
+
+    Rows are formatted only as the database reads, so a large load never
+    exists in memory as one string. <count> is the number of rows read so far.
+    """
+
+    def __init__(self, rows, columns=PRODUCTFILE_COLUMNS):
+        self._rows = iter(rows)
+        self._columns = columns
+        self._buffer = ''
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def _next_line(self):
+        row = next(self._rows, None)
+        if row is None:
+            return None
+        self.count += 1
+        return '\t'.join(copy_value(row[c]) for c in self._columns) + '\n'
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            lines = [self._buffer]
+            for line in iter(self._next_line, None):
+                lines.append(line)
+            self._buffer = ''
+            return ''.join(lines)
+
+        lines, n = [self._buffer], len(self._buffer)
+        while n < size:
+            line = self._next_line()
+            if line is None:
+                break
+            lines.append(line)
+            n += len(line)
+        data = ''.join(lines)
+        self._buffer = data[size:]
+
+        return data[:size]
+
+    def readline(self, size=-1):
+        if not self._buffer:
+            self._buffer = self._next_line() or ''
+        line, self._buffer = self._buffer, ''
+        return line
+
+
+def load_productfiles(connect, entries, table='productfile', constraint=PRODUCTFILE_CONSTRAINT):
+    """COPY <entries> into a staging table and merge into <table>, ignoring conflicts
+
+    <connect>  zero-argument function returning a DB-API connection with a
+               psycopg2-style cursor.copy_expert()
+    <entries>  iterable of dictionaries with keys PRODUCTFILE_COLUMNS; may be a generator
+
+    Everything happens in one transaction. Returns dictionary
+    { "rows": ..., "inserted": ..., "seconds": ..., "rows_per_second": ... }
+    """
+
+    columns = ', '.join(PRODUCTFILE_COLUMNS)
+    staging = f'{table}_staging'
+    stream = RowStream(entries)
+
+    start = timer()
+
+    conn = connect()
+    try:
+        c = conn.cursor()
+        # Same column types as <table>, none of its constraints; dropped at commit
+        c.execute(
+            f'CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA'
+        )
+        c.copy_expert(f'COPY {staging} ({columns}) FROM STDIN', stream)
+        c.execute(
+            f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} '
+            f'ON CONFLICT ON CONSTRAINT {constraint} DO NOTHING'
+        )
+        inserted = c.rowcount
+        conn.commit()
+        c.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    seconds = timer() - start
+    stats = {
+        "rows": stream.count,
+        "inserted": inserted,
+        "seconds": seconds,
+        "rows_per_second": stream.count / seconds if seconds > 0 else 0.0,
+    }
+    logging.info(
+        f'loaded {stats["rows"]} productfiles ({stats["inserted"]} new) in {seconds:.2f} seconds; '
+        f'{stats["rows_per_second"]:.0f} rows/second'
+    )
+
+    return stats
+
+
+def read_entries(infile):
+    """Productfile entries from a file of JSON lines, e.g. "productfiles" saved from lambda_handler() results"""
+
+    with open(infile, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Bulk load productfile entries (JSON lines) into the Cumulus database. '
+                    'Connection settings are read from CUMULUS_DBUSER, CUMULUS_DBHOST, CUMULUS_DBNAME, CUMULUS_DBPASS'
+    )
+    parser.add_argument('infile', nargs='+', help='Files of JSON lines with keys {}'.format(', '.join(PRODUCTFILE_COLUMNS)))
+    parser.add_argument('--loglevel', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.loglevel, format='%(asctime)s; %(levelname)s; %(message)s')
+
+    import psycopg2
+
+    def connect():
+        return psycopg2.connect(
+            user=os.getenv('CUMULUS_DBUSER'),
+            host=os.getenv('CUMULUS_DBHOST'),
+            dbname=os.getenv('CUMULUS_DBNAME'),
+            password=os.getenv('CUMULUS_DBPASS'),
+        )
+
+    for infile in args.infile:
+        stats = load_productfiles(connect, read_entries(infile))
+        print(f'{infile}; {json.dumps(stats)}')
@@ -0,0 +1,289 @@
+"""Run records concurrently within memory and /tmp budgets
+
+Each processor may declare its footprint as a module attribute
+
+    FOOTPRINT = {'memory': (base_bytes, bytes_per_input_byte), 'tmp': (base_bytes, bytes_per_input_byte)}
+
+and a record's estimate is base + factor * size of its S3 object, scaled by a
+calibration ratio learned from earlier runs. A record is admitted into the worker
+pool only while the estimates of everything running fit under the budgets.
+Smaller records may overtake a large one that does not fit yet, so a batch of
+MRMS files keeps running beside a SNODAS tar. A record too large for the budget on
+its own runs alone.
+
+While records run, a sampler thread watches process RSS and the size of each
+record's work directory. The peaks are compared with the estimates and folded into
+the calibration, which is saved in /tmp so warm Lambda containers keep it.
+"""
+
+from collections import namedtuple
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Used for processors that do not declare FOOTPRINT
+DEFAULT_FOOTPRINT = {
+    'memory': (256 * 1024 ** 2, 8.0),
+    'tmp': (128 * 1024 ** 2, 4.0),
+}
+
+# Fraction of memory / free /tmp space the scheduler may hand out
+BUDGET_FRACTION = 0.8
+
+# Where calibration ratios are kept between invocations
+CALIBRATION_PATH = '/tmp/cumulus_footprint_calibration.json'
+
+# Weight of the newest observation in the calibration ratio
+CALIBRATION_ALPHA = 0.3
+
+# Calibration ratios are kept within these bounds
+CALIBRATION_BOUNDS = (0.25, 4.0)
+
+# Seconds between samples of RSS and work directory size
+SAMPLE_INTERVAL = 0.1
+
+Estimate = namedtuple('Estimate', ['memory', 'tmp'])
+
+
+def rss():
+    """Resident set size of this process in bytes"""
+
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        # ru_maxrss is the peak rather than current, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def directory_size(path):
+    """Bytes in all files below <path>; files removed while walking are ignored"""
+
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+
+    return total
+
+
+def memory_budget():
+    """Bytes of memory records may use; CUMULUS_MEMORY_BUDGET, else a fraction of the Lambda or system memory"""
+
+    if os.getenv('CUMULUS_MEMORY_BUDGET'):
+        return int(os.getenv('CUMULUS_MEMORY_BUDGET'))
+
+    if os.getenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE'):
+        total = int(os.getenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')) * 1024 ** 2
+    else:
+        total = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+    # Memory already held by the interpreter and imported libraries is not available to records
+    return max(0, int(total * BUDGET_FRACTION) - rss())
+
+
+def tmp_budget(tmpdir=None):
+    """Bytes of scratch space records may use; CUMULUS_TMP_BUDGET, else a fraction of free space in <tmpdir>"""
+
+    if os.getenv('CUMULUS_TMP_BUDGET'):
+        return int(os.getenv('CUMULUS_TMP_BUDGET'))
+
+    return int(shutil.disk_usage(tmpdir or tempfile.gettempdir()).free * BUDGET_FRACTION)
+
+
+class Calibration:
+    """Per-processor ratios of observed to modeled footprint, persisted as JSON at <path>"""
+
+    def __init__(self, path=CALIBRATION_PATH):
+        self.path = path
+        self.ratios = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    self.ratios = json.load(f)
+            except ValueError:
+                logging.warning(f'Ignoring unreadable footprint calibration: {path}')
+
+    def ratio(self, name, kind):
+        return self.ratios.get(name, {}).get(kind, 1.0)
+
+    def observe(self, name, kind, modeled, observed):
+        """Fold one observation into the ratio for <name>/<kind>"""
+
+        if modeled <= 0:
+            return
+        lo, hi = CALIBRATION_BOUNDS
+        with self._lock:
+            current = self.ratio(name, kind)
+            ratio = (1 - CALIBRATION_ALPHA) * current + CALIBRATION_ALPHA * (observed / modeled)
+            self.ratios.setdefault(name, {})[kind] = min(hi, max(lo, ratio))
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            tmp = f'{self.path}.{os.getpid()}'
+            with open(tmp, 'w') as f:
+                json.dump(self.ratios, f)
+            os.replace(tmp, self.path)
+
+
+def modeled_footprint(processor, size):
+    """Estimate from processor.FOOTPRINT (or DEFAULT_FOOTPRINT) for an input of <size> bytes"""
+
+    footprint = getattr(processor, 'FOOTPRINT', DEFAULT_FOOTPRINT)
+    size = size or 0
+
+    return Estimate(*(
+        int(footprint.get(kind, DEFAULT_FOOTPRINT[kind])[0] + footprint.get(kind, DEFAULT_FOOTPRINT[kind])[1] * size)
+        for kind in Estimate._fields
+    ))
+
+
+class _Task:
+
+    def __init__(self, name, modeled, estimate, fn, args):
+        self.name = name
+        self.modeled = modeled
+        self.estimate = estimate
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+        self.workdir = None
+        self.rss_start = 0
+        self.peak = Estimate(0, 0)
+
+
+class Scheduler:
+    """Admit tasks into a thread pool while their estimated footprints fit under budgets
+
+    <memory>, <tmp>  budgets in bytes; defaults from memory_budget() and tmp_budget()
+    <max_workers>    upper bound on concurrent tasks; default CUMULUS_MAX_WORKERS or CPU count
+    <calibration>    Calibration; None keeps ratios in memory only
+
+        scheduler = Scheduler()
+        futures = scheduler.map([(name, processor, size, fn, args), ...])
+
+    Every task function is called with keyword argument workdir, a fresh directory
+    in <tmpdir> that is measured while the task runs and removed afterwards.
+    """
+
+    def __init__(self, memory=None, tmp=None, max_workers=None, calibration=None, tmpdir=None):
+        self.tmpdir = tmpdir or tempfile.gettempdir()
+        self.memory = memory if memory is not None else memory_budget()
+        self.tmp = tmp if tmp is not None else tmp_budget(self.tmpdir)
+        self.max_workers = max_workers or int(os.getenv('CUMULUS_MAX_WORKERS', default=0)) or os.cpu_count() or 1
+        self.calibration = calibration if calibration is not None else Calibration(None)
+
+        self._cond = threading.Condition()
+        self._running = []
+        self._in_use = Estimate(0, 0)
+
+    def estimate(self, name, processor, size):
+        """(modeled, calibrated) Estimate for one input of <size> bytes"""
+
+        modeled = modeled_footprint(processor, size)
+        calibrated = Estimate(*(
+            int(v * self.calibration.ratio(name, kind)) for kind, v in zip(Estimate._fields, modeled)
+        ))
+
+        return modeled, calibrated
+
+    def _fits(self, estimate):
+        if not self._running:
+            # Always let one task run, even if it is larger than the budget
+            return True
+        return (
+            len(self._running) < self.max_workers
+            and self._in_use.memory + estimate.memory <= self.memory
+            and self._in_use.tmp + estimate.tmp <= self.tmp
+        )
+
+    def _sample(self, stop):
+        while not stop.wait(SAMPLE_INTERVAL):
+            with self._cond:
+                running = list(self._running)
+            current = rss()
+            for task in running:
+                if task.workdir is None:
+                    continue
+                task.peak = Estimate(
+                    max(task.peak.memory, current - task.rss_start),
+                    max(task.peak.tmp, directory_size(task.workdir)),
+                )
+
+    def _run(self, task):
+        try:
+            task.rss_start = rss()
+            with tempfile.TemporaryDirectory(prefix='cumulus_', dir=self.tmpdir) as workdir:
+                task.workdir = workdir
+                try:
+                    result = task.fn(*task.args, workdir=workdir)
+                finally:
+                    task.peak = Estimate(
+                        max(task.peak.memory, rss() - task.rss_start),
+                        max(task.peak.tmp, directory_size(workdir)),
+                    )
+                    task.workdir = None
+            task.future.set_result(result)
+        except BaseException as e:
+            task.future.set_exception(e)
+        finally:
+            with self._cond:
+                self._running.remove(task)
+                self._in_use = Estimate(*(a - b for a, b in zip(self._in_use, task.estimate)))
+                self._cond.notify_all()
+
+        # RSS is process-wide, so concurrent tasks inflate each other's observations;
+        # that errs on the side of larger estimates
+        for kind, modeled, observed in zip(Estimate._fields, task.modeled, task.peak):
+            self.calibration.observe(task.name, kind, modeled, observed)
+
+        logging.info(
+            f'{task.name}; estimated memory {task.estimate.memory} tmp {task.estimate.tmp}; '
+            f'observed memory {task.peak.memory} tmp {task.peak.tmp}'
+        )
+
+    def map(self, tasks):
+        """Run (name, processor, size, fn, args) tasks; returns list of Futures in task order
+
+        <name> keys the calibration (e.g. the acquirable name). Blocks until every task is finished.
+        """
+
+        pending = []
+        for name, processor, size, fn, args in tasks:
+            modeled, estimate = self.estimate(name, processor, size)
+            pending.append(_Task(name, modeled, estimate, fn, args))
+        futures = [t.future for t in pending]
+
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(stop, ), daemon=True)
+        sampler.start()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while pending:
+                    with self._cond:
+                        task = next((t for t in pending if self._fits(t.estimate)), None)
+                        if task is None:
+                            self._cond.wait()
+                            continue
+                        pending.remove(task)
+                        self._running.append(task)
+                        self._in_use = Estimate(*(a + b for a, b in zip(self._in_use, task.estimate)))
+                    executor.submit(self._run, task)
+        finally:
+            stop.set()
+            sampler.join()
+            self.calibration.save()
+
+        return futures
@@ -4,6 +4,7 @@ import re
 
 
 from ..geoprocess.core.base import info, translate, create_overviews
+from ..geoprocess.core.encoding import INTERMEDIATE, encoding_for
 
 
 def prism_datetime_from_filename(infile):
@@ -20,8 +21,9 @@ def prism_datetime_from_filename(infile):
     return None
 
 
-def prism_convert_to_cog(infile, outdir):
+def prism_convert_to_cog(infile, outdir, filetype=None):
     """Function to create the COG file
+    <filetype> selects the COG's compression settings; see geoprocess.core.encoding
     """
 
     filename_no_extension = os.path.splitext(os.path.basename(infile))[0]
@@ -32,7 +34,8 @@ def prism_convert_to_cog(infile, outdir):
     # Create GeoTIFF
     translated = translate(
         bilfile,
-        os.path.join(outdir, "translated.tif")
+        os.path.join(outdir, "translated.tif"),
+        encoding=INTERMEDIATE,
     )
     # Create Overviews
     create_overviews(translated)
@@ -40,6 +43,7 @@ def prism_convert_to_cog(infile, outdir):
     outfile_cog = translate(
         translated,
         os.path.join(outdir, f"{filename_no_extension}_cloud_optimized.tif"),
+        encoding=encoding_for(filetype),
     )
 
     return outfile_cog
\ No newline at end of file
@@ -0,0 +1,8 @@
+def is_wanted(filetype, wanted):
+    """True if <filetype> should be produced
+
+    <wanted> is the set of filetypes the caller will keep (e.g. products registered
+    in the database). None means everything is wanted.
+    """
+
+    return wanted is None or filetype in wanted
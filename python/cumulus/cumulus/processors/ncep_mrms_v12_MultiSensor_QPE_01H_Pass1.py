@@ -1,34 +1,41 @@
-from datetime import datetime
 import os
-from uuid import uuid4
-from ..geoprocess.core.base import info, translate, create_overviews
+from ..geoprocess.core.grib import process_grib_bands
+from ..geoprocess.core.inputs import PreparedInput
+from . import is_wanted
 
-def process(infile, outdir):
+# Peak (memory, /tmp) as (base bytes, bytes per input byte); see ingest.core.scheduler
+# The .grib2.gz is inflated into /vsimem/; compression ratios of 50x are common
+FOOTPRINT = {
+    'memory': (150 * 1024 ** 2, 60.0),
+    'tmp': (100 * 1024 ** 2, 2.0),
+}
+
+# GDAL configuration options; see geoprocess.core.profiles
+GDAL_PROFILE = 'small-hourly-grib'
+
+# Filetypes produced from each file and the band each is read from
+BANDS = {
+    "ncep_mrms_v12_MultiSensor_QPE_01H_Pass1": 1,
+}
+
+
+def process(infile, outdir, wanted=None):
     """Takes an infile to process and path to a directory where output files should be saved
     Returns array of objects [{ "filetype": "nohrsc_snodas_swe", "file": "file.tif", ... }, {}, ]
+    Only filetypes in <wanted> are produced; None produces everything
     """
 
-    # Only Get Air Temperature to Start; Band 3 (i.e. array position 2 because zero-based indexing)
-    dtStr = info(f'/vsigzip/{infile}')['bands'][0]["metadata"][""]['GRIB_VALID_TIME']
+    # Skip decompression entirely when nothing is wanted
+    if not any(is_wanted(filetype, wanted) for filetype in BANDS):
+        return []
 
-    # Get Datetime from String Like "1599008400 sec UTC"
-    dt = datetime.fromtimestamp(int(dtStr.split(" ")[0]))
-
-    # Extract Band 0 (QPE); Convert to COG
-    tif = translate(f'/vsigzip/{infile}', os.path.join(outdir, f"temp-tif-{uuid4()}"))
-    tif_with_overviews = create_overviews(tif)
-    cog = translate(
-        tif_with_overviews,
-        os.path.join(
+    # Band 1 (QPE)
+    # Inflate the .grib2.gz once into memory; every read below uses that buffer
+    with PreparedInput(infile) as src:
+        return process_grib_bands(
+            src.path,
             outdir,
-            "{}.tif".format(
-                os.path.basename(infile).split(".grib2.gz")[0]
-            )
+            BANDS,
+            "{}.tif".format(os.path.basename(infile).split(".grib2.gz")[0]),
+            wanted=wanted,
         )
-    )
-
-    outfile_list = [
-        { "filetype": "ncep_mrms_v12_MultiSensor_QPE_01H_Pass1", "file": cog, "datetime": dt.isoformat(), "version": None },
-    ]
-
-    return outfile_list
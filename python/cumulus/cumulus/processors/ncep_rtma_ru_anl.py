@@ -1,40 +1,38 @@
-from datetime import datetime
 import os
-from uuid import uuid4
-from ..geoprocess.core.base import info, translate, create_overviews
+from ..geoprocess.core.grib import process_grib_bands
 
+# Peak (memory, /tmp) as (base bytes, bytes per input byte); see ingest.core.scheduler
+FOOTPRINT = {
+    'memory': (200 * 1024 ** 2, 4.0),
+    'tmp': (150 * 1024 ** 2, 2.0),
+}
 
-def process(infile, outdir):
+# GDAL configuration options; see geoprocess.core.profiles
+GDAL_PROFILE = 'small-hourly-grib'
+
+# Filetypes produced from each RTMA Rapid Update analysis and the band each is read from
+# Air Temperature is Band 3; the others are selected by GRIB element so band order does not matter
+BANDS = {
+    "ncep_rtma_ru_anl_airtemp": 3,
+    "ncep_rtma_ru_anl_dewpoint": {"GRIB_ELEMENT": "DPT"},
+    "ncep_rtma_ru_anl_specifichumidity": {"GRIB_ELEMENT": "SPFH"},
+    "ncep_rtma_ru_anl_windspeed": {"GRIB_ELEMENT": "WIND"},
+    "ncep_rtma_ru_anl_winddirection": {"GRIB_ELEMENT": "WDIR"},
+    "ncep_rtma_ru_anl_windgust": {"GRIB_ELEMENT": "GUST"},
+    "ncep_rtma_ru_anl_pressure": {"GRIB_ELEMENT": "PRES"},
+}
+
+
+def process(infile, outdir, wanted=None):
     """Takes an infile to process and path to a directory where output files should be saved
     Returns array of objects [{ "filetype": "nohrsc_snodas_swe", "file": "file.tif", ... }, {}, ]
+    Only filetypes in <wanted> are produced; None produces everything
     """
 
-    # Only Get Air Temperature to Start; Band 3 (i.e. array position 2 because zero-based indexing)
-    dtStr = info(infile)['bands'][2]["metadata"][""]['GRIB_VALID_TIME']
-    print(dtStr)
-    # Get Datetime from String Like "1599008400 sec UTC"
-    dt = datetime.fromtimestamp(int(dtStr.split(" ")[0]))
-
-    # Extract Band 3 (Temperature); Convert to COG
-    tif = translate(
+    return process_grib_bands(
         infile,
-        os.path.join(outdir, f"temp-tif-{uuid4()}"),
-        extra_args=["-b", "3"]
+        outdir,
+        BANDS,
+        lambda dt: "{}_{}".format(dt.strftime("%Y%m%d"), os.path.basename(infile)),
+        wanted=wanted,
     )
-    tif_with_overviews = create_overviews(tif)
-    cog = translate(
-        tif_with_overviews,
-        os.path.join(
-            outdir,
-            "{}_{}".format(
-                dt.strftime("%Y%m%d"),
-                os.path.basename(infile)
-            )
-        )
-    )
-
-    outfile_list = [
-        { "filetype": "ncep_rtma_ru_anl_airtemp", "file": cog, "datetime": dt.isoformat(), "version": None },
-    ]
-
-    return outfile_list
@@ -1,42 +1,25 @@
-from datetime import datetime
 import os
-from uuid import uuid4
-from ..geoprocess.core.base import info, translate, create_overviews
+from ..geoprocess.core.grib import process_grib_bands
 
-def process(infile, outdir):
-    """Takes an infile to process and path to a directory where output files should be saved
-    Returns array of objects [{ "filetype": "nohrsc_snodas_swe", "file": "file.tif", ... }, {}, ]
-    """
+# GDAL configuration options; see geoprocess.core.profiles
+GDAL_PROFILE = 'small-hourly-grib'
 
-    fileinfo = info(infile)
-    for band in fileinfo["bands"]:
-        band_number = str(band["band"])
-        band_meta = band["metadata"][""]
-        dtStr = band_meta["GRIB_VALID_TIME"]
-        if "Total precipitation" in band_meta["GRIB_COMMENT"]: break
+# Filetypes produced from each file and the band each is read from
+BANDS = {
+    "ndgd_leia98_precip": {"GRIB_COMMENT": "Total precipitation"},
+}
 
-    # dtStr = info(infile)['bands'][1]["metadata"][""]['GRIB_VALID_TIME']
 
-    # Get Datetime from String Like "1599008400 sec UTC"
-    dt = datetime.fromtimestamp(int(dtStr.split(" ")[0]))
-
-    print(f"Band number is {band_number}, date string is {dtStr}, and date is {dt}")
+def process(infile, outdir, wanted=None):
+    """Takes an infile to process and path to a directory where output files should be saved
+    Returns array of objects [{ "filetype": "nohrsc_snodas_swe", "file": "file.tif", ... }, {}, ]
+    Only filetypes in <wanted> are produced; None produces everything
+    """
 
-    # # Extract Band 0 (QPE); Convert to COG
-    tif = translate(infile, os.path.join(outdir, f"temp-tif-{uuid4()}"), extra_args=["-b", band_number])
-    tif_with_overviews = create_overviews(tif)
-    cog = translate(
-        tif_with_overviews,
-        os.path.join(
-            outdir,
-            "{}.tif".format(
-                os.path.basename(infile)
-            )
-        )
+    return process_grib_bands(
+        infile,
+        outdir,
+        BANDS,
+        "{}.tif".format(os.path.basename(infile)),
+        wanted=wanted,
     )
-
-    outfile_list = [
-        { "filetype": "ndgd_leia98_precip", "file": cog, "datetime": dt.isoformat(), "version": None },
-    ]
-
-    return outfile_list
@@ -4,10 +4,21 @@ import re
 
 from ..snodas.core.process import process_snodas_for_date
 
+# Peak (memory, /tmp) as (base bytes, bytes per input byte); see ingest.core.scheduler
+# Four 8192 x 4096 grids decoded in memory plus float32 derived grids; tifs and COGs on disk
+FOOTPRINT = {
+    'memory': (1200 * 1024 ** 2, 0),
+    'tmp': (400 * 1024 ** 2, 1.0),
+}
 
-def process(infile, outdir):
+# GDAL configuration options; see geoprocess.core.profiles
+GDAL_PROFILE = 'conus-snodas'
+
+
+def process(infile, outdir, wanted=None):
     """Takes an infile to process and path to a directory where output files should be saved
     Returns array of objects [{ "filetype": "nohrsc_snodas_swe", "file": "file.tif", ... }, {}, ]
+    Only filetypes in <wanted> are produced; None produces everything
     """
 
     def get_file_date():
@@ -24,6 +35,6 @@ def process(infile, outdir):
     if dt is None:
         return []
 
-    outfile_list = process_snodas_for_date(dt, infile, 'UNMASKED', outdir)
+    outfile_list = process_snodas_for_date(dt, infile, 'UNMASKED', outdir, wanted=wanted)
 
     return outfile_list
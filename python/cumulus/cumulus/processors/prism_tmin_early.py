@@ -1,16 +1,22 @@
 from datetime import datetime
 from ..prism.core import prism_datetime_from_filename
 from ..prism.core import prism_convert_to_cog
+from . import is_wanted
 
 
-def process(infile, outdir):
+def process(infile, outdir, wanted=None):
     """Takes an infile to process and path to a directory where output files should be saved
     Returns array of objects [{ "filetype": "nohrsc_snodas_swe", "file": "file.tif", ... }, {}, ]
+    Only filetypes in <wanted> are produced; None produces everything
     """
 
+    # Skip decoding entirely when the product is not wanted
+    if not is_wanted("prism_tmin_early", wanted):
+        return []
+
     dt = prism_datetime_from_filename(infile)
 
-    outfile_cog = prism_convert_to_cog(infile, outdir)
+    outfile_cog = prism_convert_to_cog(infile, outdir, "prism_tmin_early")
 
     outfile_list = [
         { "filetype": "prism_tmin_early", "file": outfile_cog, "datetime": dt.isoformat(), "version": None },
@@ -1,38 +1,27 @@
-from datetime import datetime
 import os
-from uuid import uuid4
-from ..geoprocess.core.base import info, translate, create_overviews
+from ..geoprocess.core.grib import process_grib_bands
 
-def process(infile, outdir):
+# GDAL configuration options; see geoprocess.core.profiles
+GDAL_PROFILE = 'small-hourly-grib'
+
+# Filetypes produced from each file and the band each is read from
+BANDS = {
+    "wpc_qpf_2p5km": 1,
+}
+
+
+def process(infile, outdir, wanted=None):
     """Takes an infile to process and path to a directory where output files should be saved
     Returns array of objects [{ "filetype": "wpc_qpf_2p5km", "file": "file.tif", ... }, {}, ]
+    Only filetypes in <wanted> are produced; None produces everything
     """
 
-    # Date String
-    dtStr = info(infile)['bands'][0]["metadata"][""]['GRIB_VALID_TIME']
-    # Get Datetime from String Like "1599008400 sec UTC"
-    dt = datetime.fromtimestamp(int(dtStr.split(" ")[0]))
-
-    # Version (Forecast Issue Time)
-    verStr = info(infile)['bands'][0]["metadata"][""]['GRIB_REF_TIME']
-    # Get Datetime from String Like "1599008400 sec UTC"
-    vt = datetime.fromtimestamp(int(verStr.split(" ")[0]))
-
-    # Extract Band
-    tif = translate(infile, os.path.join(outdir, f"temp-tif-{uuid4()}"))
-    tif_with_overviews = create_overviews(tif)
-    cog = translate(
-        tif_with_overviews,
-        os.path.join(
-            outdir,
-            "{}.tif".format(
-                os.path.basename(infile).split(".grb")[0]
-            )
-        )
+    # Version is the forecast issue time (GRIB_REF_TIME)
+    return process_grib_bands(
+        infile,
+        outdir,
+        BANDS,
+        "{}.tif".format(os.path.basename(infile).split(".grb")[0]),
+        wanted=wanted,
+        version=True,
     )
-
-    outfile_list = [
-        { "filetype": "wpc_qpf_2p5km", "file": cog, "datetime": dt.isoformat(), "version": vt.isoformat() },
-    ]
-
-    return outfile_list
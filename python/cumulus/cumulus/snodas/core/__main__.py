@@ -3,12 +3,14 @@ import datetime
 import logging
 import os
 import sys
-import tempfile
 from timeit import default_timer as timer
 
-from .process import process_snodas_for_date
+from .backfill import process_date
+from .helpers import snodas_get_raw_infile
 
-if __name__ == '__main__':
+
+def main():
+    """Process one SNODAS date from the local raw archive"""
 
     start = timer()
 
@@ -36,29 +38,22 @@ if __name__ == '__main__':
         sys.exit(1)
 
     # If Output Directory is not explictly provided, work in a temporary directory with automatic file cleanup
-    # Otherwise, write output files in the explicitly provided directory.
-    if args.outdir == None:
-        # Process files in a temporary directory
-        outdir = tempfile.TemporaryDirectory(prefix='snodas_', ).name
-    else:
-        # Process files in directory supplied on commandline
-        outdir = os.path.abspath(args.outdir)
-        # ... Ensure directory exists
-        mkdir_p(outdir)
-
-    # Process SNODAS files and return directory to processed files
-    processed_files = process_snodas_for_date(dt, args.infile_type, outdir)
-
-    # Post to Cumulus API
-    if args.post_to_cumulus:
-        # All datetimes for daily SNODAS files are at 0600.
-        productfile_datetime = dt + datetime.timedelta(hours=6)
-
-        logging.info('Post files to cumulus')
-        for productname, productfile in processed_files['cog'].items():
-            logging.debug('POST: {}; {}'.format(productname, productfile))
-            post_to_cumulus(productname, productfile, productfile_datetime)
+    # Otherwise, write output files in <outdir>/<YYYYMMDD>/
+    # The raw .tar is read from the local archive and left in place
+    result = process_date(
+        dt,
+        args.infile_type,
+        snodas_get_raw_infile(dt, args.infile_type),
+        outdir=os.path.abspath(args.outdir) if args.outdir else None,
+        post_to_cumulus=args.post_to_cumulus
+    )
+    for f in result['files']:
+        logging.info(f)
 
     finish = timer()
 
     logging.info('Done in: {} seconds'.format(finish - start))
+
+
+if __name__ == '__main__':
+    main()
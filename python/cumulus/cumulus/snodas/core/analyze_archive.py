@@ -1,32 +1,53 @@
 import argparse
+import csv
 import datetime
+from concurrent.futures import ProcessPoolExecutor
 import gzip
+import json
 import logging
 import os
 import re
+import sqlite3
 import tarfile
-import tempfile
 from timeit import default_timer as timer
 # https://stackoverflow.com/questions/7370801/measure-time-elapsed-in-python
 
-import config
+from .archive import ArchiveIndex, INDEX_PATH, shared_index
 from .helpers import (
-    snodas_get_raw_infile
+    snodas_get_raw_infile,
+    snodas_get_raw_infile_name
 )
 
+# Columns of the analysis output, in order
+HEADER_VALUES = ('cols', 'rows', 'nodata', 'xmin', 'xmax', 'ymin', 'ymax')
+COLUMNS = ('date', 'infile_type', 'archive', 'status') + HEADER_VALUES
 
-def headerfile_content_from_raw_archive(infile, headerfile_name):
+# Dates handed to a worker process at a time
+CHUNKSIZE = 16
+
+# Statuses that will not change on a rerun; only these rows are checkpointed.
+# missing_archive and unreadable dates are analyzed again once the archive is fixed
+FINAL_STATUS = ('ok', 'missing_header')
+
+
+def headerfile_content_from_raw_archive(infile, headerfile_name, index=None):
     """Extract headerfile for Snow Water Equivalent (SWE) based on
 
     <input file>        Path to the raw .tar SNODAS archive for a given day
     <headerfile_name>   Name of file to extract from raw archive
-    """  
+    <index>             Optional archive.ArchiveIndex; the member is read by offset
+                        instead of scanning the tar
+    """
+
+    if index is not None:
+        index.update([infile])
+        return index.read_text(infile, headerfile_name)
 
     with tarfile.open(infile) as tar:
         with tar.extractfile(headerfile_name) as gz_headerfile:
             with gzip.open(gz_headerfile, 'rt') as headerfile:
                 content = headerfile.read()
-    
+
     return content
 
 
@@ -69,11 +90,11 @@ def snodas_get_headerfile_values(headerfile_content):
     for k,v in keywords.items():
         # Why use re.compile()?
         # https://docs.python.org/3/library/re.html#re.compile
-        pattern = re.compile('{}:\s+(\S*)\s+'.format(v['keyword']))
-        result = pattern.search(content)
+        pattern = re.compile(r'{}:\s+(\S*)\s+'.format(v['keyword']))
+        result = pattern.search(headerfile_content)
         if result is not None:
             keywords[k]['value'] = result.group(1)
-    
+
     return {k: v['value'] for k, v in keywords.items()}
 
 
@@ -88,20 +109,170 @@ def swe_headerfile_name(dt, infile_type):
         return 'us_ssmv11034tS__T0001TTNATS{}05HP001.txt.gz'.format(dtstr)
 
 
-def get_raw_infile_dict(dt_start, dt_end, infile_type):
-    """List of RAW SNODAS files between dates dt_start and dt_end
+def get_raw_infile_dict(dt_start, dt_end, infile_type, indir=None):
+    """Dictionary of {datetime: RAW SNODAS file} for dates dt_start (inclusive) to dt_end (exclusive)
+    Files are looked for in <indir> if provided; otherwise in the configured raw archive
     NOTE: List of infiles will eventually be retrieved from the database.
     """
 
     infiles = {}
-    
+
     while dt_start < dt_end:
-        infiles[dt_start] = get_raw_infile(dt_start, infile_type)
+        if indir is not None:
+            infiles[dt_start] = os.path.join(indir, snodas_get_raw_infile_name(dt_start, infile_type))
+        else:
+            infiles[dt_start] = snodas_get_raw_infile(dt_start, infile_type)
         dt_start += datetime.timedelta(days=1)
-    
+
     return infiles
 
 
+def analyze_date(dt, infile_type, raw_infile, index_path):
+    """Header metadata for one day's archive as a row dictionary (see COLUMNS)
+
+    status is one of: ok, missing_archive, missing_header, unreadable
+    """
+
+    row = dict.fromkeys(COLUMNS)
+    row.update({'date': dt.strftime('%Y%m%d'), 'infile_type': infile_type, 'archive': raw_infile})
+
+    if not os.path.isfile(raw_infile):
+        row['status'] = 'missing_archive'
+        return row
+
+    headerfile_name = swe_headerfile_name(dt, infile_type)
+    try:
+        try:
+            # One index per worker process
+            content = headerfile_content_from_raw_archive(raw_infile, headerfile_name, index=shared_index(index_path))
+        except sqlite3.OperationalError as e:
+            # Index still locked after retries; this date is read by scanning the tar
+            logging.warning(f'Archive index unavailable for date: {dt}; {e}')
+            content = headerfile_content_from_raw_archive(raw_infile, headerfile_name)
+    except KeyError:
+        row['status'] = 'missing_header'
+        return row
+    except (OSError, EOFError, tarfile.TarError) as e:
+        logging.critical(f'Could not extract headerfile for date: {dt}; {e}')
+        row['status'] = 'unreadable'
+        return row
+
+    row.update(snodas_get_headerfile_values(content))
+    row['status'] = 'ok'
+
+    return row
+
+
+def _analyze_date(args):
+    # ProcessPoolExecutor.map() passes one argument
+    return analyze_date(*args)
+
+
+def checkpoint_file(outfile):
+    return f'{outfile}.checkpoint.jsonl'
+
+
+def read_checkpoint(path):
+    """{(date, infile_type): row} of rows already analyzed with a FINAL_STATUS"""
+
+    done = {}
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # Partial line from an interrupted run
+                    continue
+                if row.get('status') not in FINAL_STATUS:
+                    continue
+                done[(row['date'], row['infile_type'])] = row
+
+    return done
+
+
+def analyze(raw_infiles, outfile, index_path=INDEX_PATH, workers=None):
+    """Analyze header metadata of raw archives with a process pool
+
+    <raw_infiles>  {(datetime, infile_type): raw archive path}
+
+    Each row with a FINAL_STATUS is appended to a checkpoint next to <outfile>, so a
+    rerun only analyzes dates that are not finished or whose archive was missing or
+    unreadable. Returns list of rows sorted by infile_type and date.
+    """
+
+    checkpoint = checkpoint_file(outfile)
+    done = read_checkpoint(checkpoint)
+
+    todo = [
+        (dt, infile_type, raw_infile, index_path)
+        for (dt, infile_type), raw_infile in sorted(raw_infiles.items())
+        if (dt.strftime('%Y%m%d'), infile_type) not in done
+    ]
+    logging.info(f'{len(done)} dates from checkpoint; {len(todo)} dates to analyze')
+
+    # Create the index before workers race to do it
+    ArchiveIndex(index_path)
+
+    with open(checkpoint, 'a') as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        for row in executor.map(_analyze_date, todo, chunksize=CHUNKSIZE):
+            if row['status'] in FINAL_STATUS:
+                f.write(json.dumps(row) + '\n')
+                f.flush()
+            done[(row['date'], row['infile_type'])] = row
+
+    return [done[k] for k in sorted(done, key=lambda k: (k[1], k[0]))]
+
+
+def write_table(rows, outfile):
+    """Write rows as one columnar file; Parquet if <outfile> ends with .parquet (requires pyarrow), else CSV"""
+
+    if outfile.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table({c: [r[c] for r in rows] for c in COLUMNS}), outfile)
+        return outfile
+
+    with open(outfile, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return outfile
+
+
+def regime_changes(rows):
+    """Rows where header values (ULLR, nodata, shape) differ from the previous readable day of the same infile_type"""
+
+    changes, previous = [], {}
+    for row in rows:
+        if row['status'] != 'ok':
+            continue
+        values = tuple(row[k] for k in HEADER_VALUES)
+        last = previous.get(row['infile_type'])
+        if last is not None and last[1] != values:
+            changes.append({
+                'infile_type': row['infile_type'],
+                'date': row['date'],
+                'previous_date': last[0],
+                'changed': {k: (a, b) for k, a, b in zip(HEADER_VALUES, last[1], values) if a != b},
+            })
+        previous[row['infile_type']] = (row['date'], values)
+
+    return changes
+
+
+def missing_days(rows):
+    """{infile_type: [(date, status), ]} for every day without a readable header"""
+
+    missing = {}
+    for row in rows:
+        if row['status'] != 'ok':
+            missing.setdefault(row['infile_type'], []).append((row['date'], row['status']))
+
+    return missing
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(
@@ -110,46 +281,43 @@ if __name__ == '__main__':
         in a downloaded archive of SNODAS files
         """
     )
-    parser.add_argument('--infile-type', required=True, choices=['masked', 'unmasked', ])
+    parser.add_argument('--infile-type', required=True, nargs='+', choices=['masked', 'unmasked', ])
     parser.add_argument('--start', required=True, help="Date to start file checks in YYYYMMDD")
-    parser.add_argument('--end', required=True, help="Date to end file checks in YYYYMMDD")
-    parser.add_argument('--outfile', required=True, help="Path to output log")
+    parser.add_argument('--end', required=True, help="Date to end file checks in YYYYMMDD (exclusive)")
+    parser.add_argument('--outfile', required=True, help="Path to output .csv or .parquet")
+    parser.add_argument('--indir', default=None, help="Directory of raw .tar files; default is the configured archive")
+    parser.add_argument('--index', default=INDEX_PATH, help="Path to archive member index (SQLite)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes; default is the number of CPUs")
+    parser.add_argument('--loglevel', default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], help="Logging level")
     args = parser.parse_args()
 
     start = timer()
 
     # Configure logger
-    logging.basicConfig(level=config.LOGLEVEL, format='%(asctime)s; %(levelname)s; %(message)s')
-
-    raw_infiles = get_raw_infile_dict(
-        datetime.datetime.strptime(args.start, '%Y%m%d'),
-        datetime.datetime.strptime(args.end, '%Y%m%d'),
-        args.infile_type
-    )
+    logging.basicConfig(level=args.loglevel, format='%(asctime)s; %(levelname)s; %(message)s')
 
-    for dt, raw_infile in raw_infiles.items():
+    raw_infiles = {}
+    for infile_type in args.infile_type:
+        for dt, raw_infile in get_raw_infile_dict(
+            datetime.datetime.strptime(args.start, '%Y%m%d'),
+            datetime.datetime.strptime(args.end, '%Y%m%d'),
+            infile_type,
+            args.indir
+        ).items():
+            raw_infiles[(dt, infile_type)] = raw_infile
 
-        if os.path.isfile(raw_infile):
-            logging.debug('Working on file: {}'.format(raw_infile))
+    rows = analyze(raw_infiles, args.outfile, args.index, args.workers)
+    write_table(rows, args.outfile)
 
-            try:
-                content = headerfile_content_from_raw_archive(raw_infile, swe_headerfile_name(dt, args.infile_type))
-            except:
-                logging.critical('Could not extract headerfile for date: {}'.format(dt))
-                continue
+    for change in regime_changes(rows):
+        print('{infile_type}; {previous_date} -> {date}; {changed}'.format(**change))
 
-            values = snodas_get_headerfile_values(content)
+    for infile_type, days in missing_days(rows).items():
+        print(f'{infile_type}; {len(days)} days missing')
+        for date, status in days:
+            print(f'  {date}; {status}')
 
-            values_as_csv = ','.join(
-                [dt.strftime('%Y%m%d'), ] + list(values.values())
-            )
-
-            with open(args.outfile, 'a') as f:
-                f.write('{}\n'.format(values_as_csv))
-        
-        else:
-            logging.warning('Missing File: {}'.format(raw_infile))
-    
     finish = timer()
-    
+
     print('Done in {}'.format(finish - start))
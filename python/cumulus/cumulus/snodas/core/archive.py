@@ -0,0 +1,282 @@
+"""Random-access index of members in raw SNODAS .tar archives
+
+tarfile has to walk every header in an archive to find one member. The index
+records each member's name, data offset and size once, in a SQLite file, so
+later reads seek straight to the bytes they need. Archives are re-scanned only
+when their size or modification time changes.
+
+    index = ArchiveIndex('/tmp/snodas_archive_index.sqlite3')
+    index.update(glob.glob('/app/data/snodas/raw_unmasked/*.tar'))
+    with index.open_member(tar, 'zz_ssmv11034tS__T0001TTNATS2020010105HP001.dat.gz') as f:
+        ...
+    gdal.Open(index.vsi_path(tar, 'zz_ssmv11034tS__T0001TTNATS2020010105HP001.dat.gz'))
+"""
+
+import argparse
+import glob
+import gzip
+import io
+import logging
+import os
+import sqlite3
+import tarfile
+import time
+from contextlib import closing
+from timeit import default_timer as timer
+
+# Default location of the index
+INDEX_PATH = '/tmp/snodas_archive_index.sqlite3'
+
+# ArchiveIndex of this process, by path
+_INDEXES = {}
+
+# Attempts at a write while another process holds the database lock
+LOCK_RETRIES = 5
+
+
+def retry_locked(fn, *args, retries=LOCK_RETRIES, backoff=0.5):
+    """Call fn(*args), trying again with backoff while SQLite reports the database is locked"""
+
+    for attempt in range(retries):
+        try:
+            return fn(*args)
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or attempt == retries - 1:
+                raise
+            logging.debug(f'Archive index locked; attempt {attempt + 1} of {retries}')
+            time.sleep(backoff * 2 ** attempt)
+
+
+def scan_tar(infile):
+    """List of (name, offset, size) for every regular file in tar <infile>; offset is to the member's data"""
+
+    with tarfile.open(infile) as tar:
+        return [(m.name, m.offset_data, m.size) for m in tar if m.isfile()]
+
+
+def vsisubfile_path(infile, offset, size, name=None):
+    """GDAL virtual path to <size> bytes at <offset> in <infile>
+    /vsigzip/ is prepended when <name> ends with .gz
+    """
+
+    path = f'/vsisubfile/{offset}_{size},{os.path.abspath(infile)}'
+    if name is not None and name.endswith('.gz'):
+        return f'/vsigzip/{path}'
+
+    return path
+
+
+class MemberReader(io.RawIOBase):
+    """Read-only file object limited to <size> bytes at <offset> in <infile>"""
+
+    def __init__(self, infile, offset, size):
+        self._f = open(infile, 'rb', buffering=0)
+        self._f.seek(offset)
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._size
+        self._pos = max(0, min(pos, self._size))
+        self._f.seek(self._offset + self._pos)
+        return self._pos
+
+    def readinto(self, b):
+        n = min(len(b), self._size - self._pos)
+        if n <= 0:
+            return 0
+        n = self._f.readinto(memoryview(b)[:n])
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+class ArchiveIndex:
+    """Member index for many tar archives, kept in a SQLite file at <path>"""
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        retry_locked(self._create)
+
+    def _create(self):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS archives ('
+                'archive TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, indexed_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS members ('
+                'archive TEXT NOT NULL, name TEXT NOT NULL, offset INTEGER NOT NULL, size INTEGER NOT NULL, '
+                'PRIMARY KEY (archive, name))'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def is_current(self, infile):
+        """True if <infile> is indexed and has not changed since"""
+
+        st = os.stat(infile)
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT size, mtime_ns FROM archives WHERE archive=?', (os.path.abspath(infile), )
+            ).fetchone()
+
+        return row is not None and tuple(row) == (st.st_size, st.st_mtime_ns)
+
+    def add(self, infile):
+        """(Re)index one archive; returns number of members"""
+
+        infile = os.path.abspath(infile)
+        st = os.stat(infile)
+        members = scan_tar(infile)
+
+        return retry_locked(self._add, infile, st, members)
+
+    def _add(self, infile, st, members):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM members WHERE archive=?', (infile, ))
+            conn.executemany(
+                'INSERT INTO members VALUES (?, ?, ?, ?)', [(infile, ) + m for m in members]
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?)',
+                (infile, st.st_size, st.st_mtime_ns, st.st_mtime)
+            )
+
+        return len(members)
+
+    def update(self, infiles):
+        """Index every archive in <infiles> that is new or changed; returns number of archives scanned"""
+
+        scanned = 0
+        for infile in infiles:
+            if self.is_current(infile):
+                continue
+            try:
+                n = self.add(infile)
+            except (tarfile.TarError, OSError) as e:
+                logging.warning(f'Could not index {infile}; {e}')
+                continue
+            logging.debug(f'indexed {infile}; {n} members')
+            scanned += 1
+
+        return scanned
+
+    def archives(self):
+        """List of indexed archive paths"""
+
+        with closing(self._connect()) as conn:
+            return [r[0] for r in conn.execute('SELECT archive FROM archives ORDER BY archive')]
+
+    def members(self, infile):
+        """{name: (offset, size)} for every member of <infile>; empty if not indexed"""
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                'SELECT name, offset, size FROM members WHERE archive=? ORDER BY offset', (os.path.abspath(infile), )
+            ).fetchall()
+
+        return {name: (offset, size) for name, offset, size in rows}
+
+    def member(self, infile, name):
+        """(offset, size) of member <name> in <infile>; KeyError if not present"""
+
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT offset, size FROM members WHERE archive=? AND name=?', (os.path.abspath(infile), name)
+            ).fetchone()
+
+        if row is None:
+            raise KeyError(f'{name} not in {infile}')
+
+        return tuple(row)
+
+    def open_member(self, infile, name):
+        """Buffered, seekable file object over member <name> of <infile>"""
+
+        offset, size = self.member(infile, name)
+
+        return io.BufferedReader(MemberReader(infile, offset, size))
+
+    def read_text(self, infile, name):
+        """Content of a gzipped text member (e.g. a SNODAS .txt.gz headerfile)"""
+
+        with self.open_member(infile, name) as f, gzip.open(f, 'rt') as txt:
+            return txt.read()
+
+    def vsi_path(self, infile, name):
+        """GDAL virtual path to member <name> of <infile>"""
+
+        offset, size = self.member(infile, name)
+
+        return vsisubfile_path(infile, offset, size, name)
+
+
+def shared_index(path=INDEX_PATH):
+    """ArchiveIndex at <path>, created once per process (e.g. once per pool worker)"""
+
+    if path not in _INDEXES:
+        _INDEXES[path] = ArchiveIndex(path)
+
+    return _INDEXES[path]
+
+
+def completeness(index, archives, expected):
+    """Which expected members are present in each archive
+
+    <archives>  {key: archive path}, e.g. keyed by date
+    <expected>  function(key) -> list of member names that should exist
+
+    Returns {key: {"archive": ..., "exists": bool, "members": int, "missing": [...]}}
+    Missing archives are reported with every expected member missing.
+    """
+
+    report = {}
+    for key, infile in archives.items():
+        names = expected(key)
+        if not os.path.isfile(infile):
+            report[key] = {"archive": infile, "exists": False, "members": 0, "missing": list(names)}
+            continue
+        members = index.members(infile)
+        report[key] = {
+            "archive": infile,
+            "exists": True,
+            "members": len(members),
+            "missing": [n for n in names if n not in members],
+        }
+
+    return report
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Index members of every .tar in a directory of raw SNODAS archives')
+    parser.add_argument('indir', help='Directory of raw SNODAS .tar files')
+    parser.add_argument('--index', default=INDEX_PATH, help='Path to index (SQLite)')
+    parser.add_argument('--loglevel', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.loglevel, format='%(asctime)s; %(levelname)s; %(message)s')
+
+    start = timer()
+    scanned = ArchiveIndex(args.index).update(sorted(glob.glob(os.path.join(args.indir, '*.tar'))))
+
+    print(f'Indexed {scanned} archives in {timer() - start}')
@@ -0,0 +1,250 @@
+"""Reprocess historical SNODAS dates from the local raw archive
+
+Dates run in a process pool. The number of workers is bounded by CPUs, available
+memory and free space in the scratch directory, using the per-date footprint in
+FOOTPRINT. Each finished date is appended to a checkpoint file, so a backfill
+that crashes or is interrupted picks up where it stopped.
+
+    python -m cumulus.snodas.core.backfill --infile-type unmasked --start 20131001 --end 20140930 --outdir /data/cog
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import datetime
+import logging
+import os
+import shutil
+import tempfile
+from timeit import default_timer as timer
+
+from .archive import INDEX_PATH, shared_index
+from .cumulus_integration import save_to_cumulus_api
+from .helpers import snodas_get_raw_infile
+from .process import process_snodas_for_date
+from ...handyutils.core import mkdir_p
+
+# Approximate peak (memory, scratch space) in bytes to process one date.
+# Unmasked grids are 8192 x 4096; masked grids are 6935 x 3351
+FOOTPRINT = {
+    'UNMASKED': (1200 * 1024 ** 2, 600 * 1024 ** 2),
+    'MASKED': (800 * 1024 ** 2, 400 * 1024 ** 2),
+}
+
+# Fraction of available memory / free scratch space a backfill may use
+BUDGET_FRACTION = 0.8
+
+# Log throughput after this many dates
+REPORT_EVERY = 25
+
+
+def available_memory():
+    """Bytes of memory available to new processes"""
+
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def max_workers(infile_type, tmpdir, memory=None, scratch=None):
+    """Number of dates that fit in CPUs, <memory> and <scratch> bytes at once
+
+    <memory>   bytes of memory to use; default BUDGET_FRACTION of available memory
+    <scratch>  bytes of scratch space to use; default BUDGET_FRACTION of free space in <tmpdir>
+    """
+
+    if memory is None:
+        memory = available_memory() * BUDGET_FRACTION
+    if scratch is None:
+        scratch = shutil.disk_usage(tmpdir).free * BUDGET_FRACTION
+
+    per_date_memory, per_date_scratch = FOOTPRINT[infile_type.upper()]
+
+    return max(1, min(os.cpu_count() or 1, int(memory // per_date_memory), int(scratch // per_date_scratch)))
+
+
+def date_range(dt_start, dt_end):
+    """Dates dt_start through dt_end, inclusive"""
+
+    dates = []
+    while dt_start <= dt_end:
+        dates.append(dt_start)
+        dt_start += datetime.timedelta(days=1)
+
+    return dates
+
+
+def cumulus_productname(filetype):
+    """Product name used by cumulus_integration for a processor filetype"""
+
+    return filetype.replace('nohrsc_snodas_', '')
+
+
+def process_date(dt, infile_type, raw_infile, outdir=None, tmpdir=None, post_to_cumulus=False, index_path=INDEX_PATH):
+    """Process one date from the raw archive; the archive file is left in place
+
+    Output is written to <outdir>/<YYYYMMDD>/ when <outdir> is given; otherwise a
+    temporary directory in <tmpdir> is used and removed afterwards.
+    Grids are read by offset using the archive index at <index_path> (archive.ArchiveIndex);
+    None scans the tar instead.
+
+    Returns dictionary { "date": ..., "files": [...], "seconds": ... }
+    """
+
+    start = timer()
+
+    if not os.path.isfile(raw_infile):
+        raise FileNotFoundError(raw_infile)
+
+    if outdir is None:
+        td = tempfile.TemporaryDirectory(prefix='snodas_', dir=tmpdir)
+        workdir = td.name
+    else:
+        td = None
+        workdir = os.path.join(outdir, dt.strftime('%Y%m%d'))
+        mkdir_p(workdir)
+
+    try:
+        processed_files = process_snodas_for_date(
+            dt, raw_infile, infile_type, workdir, keep_infile=True,
+            index=shared_index(index_path) if index_path else None,
+        )
+
+        if post_to_cumulus:
+            # All datetimes for daily SNODAS files are at 0600.
+            productfile_datetime = dt + datetime.timedelta(hours=6)
+            for p in processed_files:
+                logging.debug('POST: {}; {}'.format(p['filetype'], p['file']))
+                save_to_cumulus_api(cumulus_productname(p['filetype']), p['file'], productfile_datetime)
+    finally:
+        if td is not None:
+            td.cleanup()
+
+    return {
+        "date": dt.strftime('%Y%m%d'),
+        "files": [p['file'] for p in processed_files] if td is None else [],
+        "seconds": timer() - start,
+    }
+
+
+def read_checkpoint(path):
+    """Set of YYYYMMDD dates already completed"""
+
+    if not os.path.isfile(path):
+        return set()
+
+    with open(path, 'r') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def backfill(dates, infile_type, checkpoint, outdir=None, tmpdir=None, post_to_cumulus=False, workers=None,
+             raw_infile=snodas_get_raw_infile, index_path=INDEX_PATH):
+    """Run process_date() for every date in <dates> not already in <checkpoint>
+
+    <workers>     process pool size; default from max_workers()
+    <raw_infile>  function(dt, infile_type) -> path of the raw .tar for a date
+    <index_path>  archive index; archives of every date are indexed here first, so
+                  workers only read it. None scans each tar instead
+
+    Returns dictionary { "completed": [...], "failed": [...], "skipped": int, "dates_per_hour": float }
+    """
+
+    done = read_checkpoint(checkpoint)
+    todo = [dt for dt in dates if dt.strftime('%Y%m%d') not in done]
+
+    tmpdir = tmpdir or tempfile.gettempdir()
+    if workers is None:
+        workers = max_workers(infile_type, tmpdir)
+
+    logging.info(f'{len(dates) - len(todo)} dates already complete; {len(todo)} dates to process; {workers} workers')
+
+    if index_path:
+        scanned = shared_index(index_path).update(
+            [raw_infile(dt, infile_type) for dt in todo if os.path.isfile(raw_infile(dt, infile_type))]
+        )
+        logging.info(f'{scanned} archives indexed')
+
+    completed, failed = [], []
+    start = timer()
+
+    with open(checkpoint, 'a') as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                process_date, dt, infile_type, raw_infile(dt, infile_type), outdir, tmpdir, post_to_cumulus, index_path
+            ): dt
+            for dt in todo
+        }
+        for future in as_completed(futures):
+            dt = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f'Failed: {dt:%Y%m%d}; {e}')
+                failed.append(dt.strftime('%Y%m%d'))
+                continue
+
+            f.write(result['date'] + '\n')
+            f.flush()
+            completed.append(result['date'])
+
+            if len(completed) % REPORT_EVERY == 0:
+                logging.info(f'{len(completed)} of {len(todo)} dates; {dates_per_hour(len(completed), timer() - start):.1f} dates/hour')
+
+    return {
+        "completed": sorted(completed),
+        "failed": sorted(failed),
+        "skipped": len(dates) - len(todo),
+        "dates_per_hour": dates_per_hour(len(completed), timer() - start),
+    }
+
+
+def dates_per_hour(n, seconds):
+    return n * 3600 / seconds if seconds > 0 else 0.0
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Reprocess a range of SNODAS dates from the local raw archive')
+    parser.add_argument('--infile-type', required=True, choices=['masked', 'unmasked', ])
+    parser.add_argument('--start', required=True, help='First date in YYYYMMDD')
+    parser.add_argument('--end', required=True, help='Last date in YYYYMMDD (inclusive)')
+    parser.add_argument('--outdir', default=None,
+                        help='Directory to keep output files in; omit to process in temporary directories')
+    parser.add_argument('--tmpdir', default=None, help='Scratch directory; default is the system temporary directory')
+    parser.add_argument('--checkpoint', default=None,
+                        help='File of completed dates; default is snodas_backfill_<infile-type>.checkpoint in the scratch directory')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes; default is bounded by CPUs, memory and scratch space')
+    parser.add_argument('--post-to-cumulus', action='store_true',
+                        help='Flag to post files to Cumulus database after processing')
+    parser.add_argument('--index', default=INDEX_PATH, help='Archive member index (SQLite); see snodas.core.archive')
+    parser.add_argument('--loglevel', default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], help="Logging level")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.loglevel, format='%(asctime)s; %(levelname)s; %(message)s')
+
+    tmpdir = args.tmpdir or tempfile.gettempdir()
+
+    result = backfill(
+        date_range(datetime.datetime.strptime(args.start, '%Y%m%d'), datetime.datetime.strptime(args.end, '%Y%m%d')),
+        args.infile_type,
+        args.checkpoint or os.path.join(tmpdir, f'snodas_backfill_{args.infile_type}.checkpoint'),
+        outdir=os.path.abspath(args.outdir) if args.outdir else None,
+        tmpdir=tmpdir,
+        post_to_cumulus=args.post_to_cumulus,
+        workers=args.workers,
+        index_path=args.index,
+    )
+
+    logging.info(
+        f'{len(result["completed"])} completed; {len(result["failed"])} failed; {result["skipped"]} skipped; '
+        f'{result["dates_per_hour"]:.1f} dates/hour'
+    )
+    if result['failed']:
+        logging.error('Failed dates: {}'.format(' '.join(result['failed'])))
@@ -0,0 +1,71 @@
+"""Decode SNODAS flat binary grids straight into NumPy
+
+SNODAS .dat files are headerless 16-bit signed integer grids, big-endian,
+row major. Shape and byte order are described by the ENVI headers in data/.
+"""
+
+import gzip
+
+import numpy as np
+
+
+def read_envi_header(hdrfile):
+    """Dictionary of key=value pairs in an ENVI .hdr file; integer values are converted"""
+
+    header = {}
+    with open(hdrfile, 'r') as f:
+        for line in f:
+            if '=' not in line:
+                continue
+            k, v = (s.strip() for s in line.split('=', 1))
+            header[k] = int(v) if v.lstrip('-').isdigit() else v
+
+    return header
+
+
+def snodas_dtype(header):
+    """NumPy dtype for an ENVI header; SNODAS grids are data type 2 (int16)"""
+
+    if header.get('data type', 2) != 2:
+        raise ValueError(f'Unsupported ENVI data type: {header.get("data type")}')
+
+    # ENVI byte order 1 is big-endian (network order)
+    return np.dtype('>i2' if header.get('byte order', 1) == 1 else '<i2')
+
+
+def read_snodas_gzip(fileobj, lines, samples, dtype=np.dtype('>i2')):
+    """Inflate a gzipped SNODAS grid from <fileobj> into a (lines, samples) array
+
+    Bytes are inflated directly into a preallocated buffer and byte-swapped in
+    place, so the grid is never held twice. The returned array has native byte order.
+    """
+
+    array = np.empty((lines, samples), dtype=dtype)
+    view = memoryview(array.view(np.uint8).reshape(-1))
+
+    with gzip.GzipFile(fileobj=fileobj, mode='rb') as gz:
+        n = 0
+        while n < len(view):
+            k = gz.readinto(view[n:])
+            if not k:
+                raise ValueError(f'SNODAS grid is {n} bytes; expected {len(view)}')
+            n += k
+        if gz.read(1):
+            raise ValueError(f'SNODAS grid is larger than expected {len(view)} bytes')
+
+    if not dtype.isnative:
+        array.byteswap(inplace=True)
+        array = array.view(dtype.newbyteorder('='))
+
+    return array
+
+
+def read_snodas_member(open_member, filename, header):
+    """Decode <filename>.dat.gz using ENVI <header>
+
+    <open_member>  function(member name) -> file object, e.g. tarfile.TarFile.extractfile
+                   or archive.ArchiveIndex.open_member bound to an archive
+    """
+
+    with open_member(f'{filename}.dat.gz') as f:
+        return read_snodas_gzip(f, header['lines'], header['samples'], snodas_dtype(header))
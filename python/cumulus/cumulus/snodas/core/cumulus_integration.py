@@ -3,9 +3,8 @@
 import json
 import logging
 import os
-import requests
 
-from ...handyutils.core import checksum
+from ...handyutils.core.transfer import get_session, MultipartUpload
 
 def cumulus_product_from_productname(productname):
 
@@ -27,28 +26,37 @@ def cumulus_product_from_productname(productname):
 
 
 def save_to_cumulus_api(productname, productfile, productfile_datetime, verify=False, api_token=None):
-            # If api_token is None, pull token from environment variables
+    """POST <productfile> to the Cumulus API
+
+    The file is streamed from disk and its MD5 is computed from the bytes being
+    posted; the md5 form field follows the file in the request body.
+    """
+    # If api_token is None, pull token from environment variables
     if api_token is None:
         api_token = os.environ['API_TOKEN']
 
     # Get API_URL and API_TOKEN from Environment Variables
     url = os.environ['API_URL'] + 'product/{}/files/'.format(cumulus_product_from_productname(productname))
 
-    with open(productfile, 'rb') as f:
-
-        r = requests.post(
-            url,
-            headers={
-                'Authorization': 'Token {}'.format(api_token),
-            },
-            files={'file': f},
-            data={
-                'md5': checksum(productfile, algorithm='md5'),
-                'product': cumulus_product_from_productname(productname),
-                'datetime': productfile_datetime,
-            },
-            verify=verify
-        )
+    body = MultipartUpload(
+        productfile,
+        'file',
+        {
+            'product': cumulus_product_from_productname(productname),
+            'datetime': productfile_datetime,
+        },
+        'md5',
+    )
+
+    r = get_session().post(
+        url,
+        headers={
+            'Authorization': 'Token {}'.format(api_token),
+            'Content-Type': body.content_type,
+        },
+        data=body,
+        verify=verify
+    )
 
     if not r.ok:
         msg = f'POST failed for: {url}; {productfile} with status: {r.status_code}'
@@ -22,6 +22,8 @@ from .process import snodas_write_coldcontent
 
 from .helpers import snodas_get_nodata_value
 
+from ...handyutils.core.scratch import ScratchSpace
+
 MASKRASTER = os.path.abspath(
     os.path.join(
         "/app/cumulus/snodas/core",
@@ -32,13 +34,13 @@ MASKRASTER = os.path.abspath(
 
 def create_interpolated_swe(swe, datetime, outfile, max_distance):
 
-    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td:
+    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td, ScratchSpace(td) as scratch:
 
         # Fix the zero values around lakes, a bug in SNODAS files from ~2014 to present (2019)
         if file_needs_lakefix(datetime, 1034):
             swe = lakefix_zero_values_to_nodata(
                 swe,
-                os.path.join(td, f'_lakefix.tif'),
+                scratch.path('_lakefix.tif'),
                 snodas_get_nodata_value(datetime),
                 MASKRASTER
             )
@@ -47,7 +49,7 @@ def create_interpolated_swe(swe, datetime, outfile, max_distance):
 
         _interpolated = interpolate(
             swe,
-            os.path.join(td, '_interpolated.tif'),
+            scratch.path('_interpolated.tif'),
             max_distance,
             snodas_get_nodata_value(datetime)
         )
@@ -66,13 +68,13 @@ def create_interpolated_swe(swe, datetime, outfile, max_distance):
 
 def create_interpolated_snowdepth(snowdepth, datetime, outfile, max_distance):
 
-    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td:
+    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td, ScratchSpace(td) as scratch:
 
         # Fix the zero values around lakes, a bug in SNODAS files from ~2014 to present (2019)
         if file_needs_lakefix(datetime, 1034):
             snowdepth = lakefix_zero_values_to_nodata(
                 snowdepth,
-                os.path.join(td, f'_lakefix.tif'),
+                scratch.path('_lakefix.tif'),
                 snodas_get_nodata_value(datetime),
                 MASKRASTER
             )
@@ -81,7 +83,7 @@ def create_interpolated_snowdepth(snowdepth, datetime, outfile, max_distance):
 
         _interpolated = interpolate(
             snowdepth,
-            os.path.join(td, '_interpolated.tif'),
+            scratch.path('_interpolated.tif'),
             max_distance,
             snodas_get_nodata_value(datetime)
         )
@@ -100,11 +102,11 @@ def create_interpolated_snowdepth(snowdepth, datetime, outfile, max_distance):
 
 def create_interpolated_snowtemp(snowtemp, swe_interpolated, datetime, max_distance, outfile):
 
-    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td:
+    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td, ScratchSpace(td) as scratch:
     
         _interpolated = interpolate(
             snowtemp,
-            os.path.join(td, '_interpolated.tif'),
+            scratch.path('_interpolated.tif'),
             max_distance,
             snodas_get_nodata_value(datetime)
         )
@@ -126,11 +128,11 @@ def create_interpolated_snowtemp(snowtemp, swe_interpolated, datetime, max_dista
 
 def create_interpolated_snowmelt(snowmelt, swe_interpolated, datetime, max_distance, outfile):
 
-    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td:
+    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td, ScratchSpace(td) as scratch:
     
         _interpolated = interpolate(
             snowmelt,
-            os.path.join(td, '_interpolated.tif'),
+            scratch.path('_interpolated.tif'),
             max_distance,
             snodas_get_nodata_value(datetime)
         )
@@ -152,7 +154,7 @@ def create_interpolated_snowmelt(snowmelt, swe_interpolated, datetime, max_dista
 
 def create_interpolated_coldcontent(snowpack_average_temperature_interpolated, swe_interpolated, outfile):
 
-    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td:
+    with tempfile.TemporaryDirectory(prefix=uuid4().__str__()) as td, ScratchSpace(td) as scratch:
     
         _coldcontent = snodas_write_coldcontent(
             snowpack_average_temperature_interpolated,
@@ -25,7 +25,13 @@ import os
 import numpy as np
 from osgeo import gdal, gdal_array
 from pytz import utc
-import subprocess
+
+from ...geoprocess.core.arrays import array_statistics
+from ...geoprocess.core.base import read_grid, set_band_statistics, write_grid
+from ...geoprocess.core.encoding import INTERMEDIATE, creation_options
+from ...geoprocess.core.expressions import Expression
+
+LAKEFIX = Expression('where((A == 0) & (B == -9999), -9999, A)')
 
 
 def file_needs_lakefix(process_date, varcode):
@@ -54,13 +60,23 @@ def lakefix_zero_values_to_nodata(infile, outfile, nodata_val, mask_raster):
                      -B no_data_areas_swe_20140201.tif
                      --calc="numpy.where((A == 0) & (B == -9999), -9999, A)"
                      --NoDataValue=-9999 --outfile gc3.tif
+    Evaluated in process with LAKEFIX, so either file may be in /vsimem/.
     '''
 
-    # Subprocess command
-    cmd = ['gdal_calc.py', '-A', infile, '-B', mask_raster, '--calc', 'numpy.where((A == 0) & (B == -9999), -9999, A)', '--NoDataValue', nodata_val, '--outfile', outfile]
-    logging.debug(' '.join(cmd))
-    result = subprocess.check_call(cmd)
-    logging.debug(result)
+    A = read_grid(infile)
+    B = read_grid(mask_raster)
+
+    # Any cell that is nodata in A or B becomes nodata, as with gdal_calc.py
+    array = LAKEFIX.evaluate(
+        {'A': A.array, 'B': B.array},
+        nodata={'A': A.nodata, 'B': B.nodata},
+        out_nodata=float(nodata_val),
+        out=np.empty(A.array.shape, dtype=A.array.dtype),
+    )
+    write_grid(
+        A._replace(array=array, nodata=float(nodata_val)), outfile,
+        gdal_array.NumericTypeCodeToGDALTypeCode(array.dtype), encoding=INTERMEDIATE
+    )
 
     return outfile
 
@@ -102,14 +118,15 @@ def lakefix_set_cells_to_nodata(file_after_fill, file_before_fill, swe_nodata_fi
             ds.RasterYSize,
             1,
             ds.GetRasterBand(1).DataType,
-            options=['COMPRESS=LZW']
+            options=creation_options(INTERMEDIATE)
         )
         dsout.SetGeoTransform(ds.GetGeoTransform())
         dsout.SetProjection(ds.GetProjection())
         dsout.GetRasterBand(1).SetNoDataValue(_nodata)
         dsout.GetRasterBand(1).WriteArray(arr)
+        # Statistics from the array in hand rather than decoding the band again
+        set_band_statistics(dsout.GetRasterBand(1), array_statistics(arr, _nodata))
         dsout.FlushCache()
-        dsout.GetRasterBand(1).GetStatistics(0, 1)
 
         ds = None
         driver = None
@@ -1,37 +1,44 @@
 #!/usr/env python3
 
-import argparse
+from contextlib import ExitStack
 import datetime
+from functools import partial
 import numpy as np
-from osgeo import gdal
-import gzip
+from osgeo import gdal, osr
 import logging
 import os
-import re
-import shutil
-import subprocess
-import sys
 import tarfile
-import tempfile
 
 
 from ...geoprocess.core.base import (
-    create_overviews,
-    scale_raster_values,
-    translate,
-    write_array_to_raster
+    Grid,
+    grid_to_cog,
+    read_grid,
+    scale_array,
+    write_grid,
+    write_quantized_grid,
 )
+from ...geoprocess.core.encoding import encoding_for, precision_for
+from ...geoprocess.core.expressions import Expression
+from ...geoprocess.core.shg import companion_filetype, companion_path, grid_to_shg_cog, is_companion_wanted
+from ...geoprocess.core.tiles import map_tiles
 
-from ...handyutils.core import (
-    gunzip_file,
-    change_file_extension,
-    delete_files_by_extension,
-    mkdir_p
-)
+from ...handyutils.core import mkdir_p
+from ...handyutils.core.scratch import ScratchSpace
 
 # snodas module
+from .binary import read_envi_header, read_snodas_member
 from .helpers import snodas_get_headerfile
 
+# Georeferencing assigned to every SNODAS grid
+SNODAS_SRS = '+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs'
+SNODAS_NODATA = -9999
+
+# Cold content from snowpack average temperature <t> (K) and SWE <swe> (mm); 0 at or above 0 C
+COLDCONTENT = Expression(
+    'where(t_isnodata, NODATA, where(t >= 273.15, 0, where(swe_isnodata, NODATA, swe * 2114 * (t - 273.15) / 333000)))'
+)
+
 
 def snodas_filename_prefix(infile_type):
     
@@ -69,144 +76,185 @@ def computed_filenames(datetime, infile_type):
     }
 
 
-def snodas_write_coldcontent(snowpack_average_temperature, snow_water_equivalent, outfile):
+# Derived grids, keyed by the filetype they are published as:
+# (key in computed_filenames(), SNODAS parameters the grid is computed from)
+SNODAS_DERIVED_PRODUCTS = {
+    'nohrsc_snodas_coldcontent': (
+        'nohrsc_snodas_coldcontent',
+        ('nohrsc_snodas_snowpack_average_temperature', 'nohrsc_snodas_swe'),
+    ),
+    # Snowmelt is published in millimeters; the raw SNODAS snowmelt grid is only an input
+    'nohrsc_snodas_snowmelt': (
+        'nohrsc_snodas_snowmeltmm',
+        ('nohrsc_snodas_snowmelt', ),
+    ),
+}
+
+
+def snodas_parameters_needed(parameters, wanted):
+    """Subset of SNODAS <parameters> that must be decoded to produce the <wanted> filetypes,
+    including the inputs of wanted derived grids. None means everything is wanted.
+    """
 
-    # snowpack_average_temperature dataset
-    snowtemp_ds = gdal.Open(snowpack_average_temperature, gdal.GA_ReadOnly)
-    xsize = snowtemp_ds.RasterXSize
-    ysize = snowtemp_ds.RasterYSize
-    geotransform = snowtemp_ds.GetGeoTransform()
-    projection = snowtemp_ds.GetProjection()
+    if wanted is None:
+        return set(parameters)
 
-    # snowpack_average_temperature as a band
-    snowtemp_band = snowtemp_ds.GetRasterBand(1)
-    nodata_value = snowtemp_band.GetNoDataValue()
+    needed = set()
+    for filetype in wanted:
+        if filetype in SNODAS_DERIVED_PRODUCTS:
+            needed.update(SNODAS_DERIVED_PRODUCTS[filetype][1])
+        elif filetype in parameters:
+            needed.add(filetype)
 
-    # snowpack_average_temperature as an array
-    snowtemp_array = snowtemp_band.ReadAsArray(0, 0, xsize, ysize).astype(np.dtype('float32'))
+    return needed
 
-    # snow_water_equivalent dataset
-    swe_ds = gdal.Open(snow_water_equivalent, gdal.GA_ReadOnly)
 
-    # snow_water_equivalent array
-    # Note: Must have same boundaries and cell size as snowpack_average_temperature
-    swe_array = swe_ds.GetRasterBand(1).ReadAsArray(0, 0, xsize, ysize).astype(np.dtype('float32'))
-    
-    # Convert snowpack_average_temperature to degrees Celsius
-    snowtemp_array_degc = np.where(snowtemp_array == nodata_value, nodata_value, snowtemp_array - 273.15)
+def snodas_coldcontent_block(snowtemp_array, swe_array, nodata_value):
 
-    # computed coldcontent_array
-    coldcontent_array = np.where(
-        snowtemp_array_degc >= 0, 0,
-        np.where((swe_array == nodata_value) | (snowtemp_array_degc == nodata_value), nodata_value, swe_array * 2114 * snowtemp_array_degc / 333000)
+    return COLDCONTENT.evaluate({'t': snowtemp_array, 'swe': swe_array}, nodata=nodata_value)
+
+
+def snodas_coldcontent_array(snowtemp_array, swe_array, nodata_value):
+    """Cold content from snowpack average temperature (Kelvin) and SWE arrays of the same shape
+
+    Cells without snow (SWE 0) or at or above 0 C are 0 and cells without a temperature are
+    nodata; only blocks with some other cell are computed, in parallel (geoprocess.core.tiles).
+    """
+
+    out = np.where(snowtemp_array == nodata_value, np.float32(nodata_value), np.float32(0))
+    active = (snowtemp_array != nodata_value) & (snowtemp_array < 273.15) & (swe_array != 0)
+
+    return map_tiles(
+        lambda t, s: snodas_coldcontent_block(t, s, nodata_value), out, snowtemp_array, swe_array, active=active
     )
 
-    # Write numpy array to TIF
-    coldcontent_raster = write_array_to_raster(coldcontent_array, outfile, xsize, ysize, geotransform, projection, gdal.GDT_Float32, nodata_value)
 
-    # make sure to free-up memory
-    snowtemp_ds = None
-    xsize = None
-    ysize = None
-    geotransform = None
-    projection = None
-    snowtemp_band = None
-    nodata_value = None
-    snowtemp_array = None
-    swe_ds = None
-    swe_array = None
-    snowtemp_array_degc = None
-    coldcontent_array = None
+def snodas_write_coldcontent(snowpack_average_temperature, snow_water_equivalent, outfile):
 
-    return coldcontent_raster
+    # snowpack_average_temperature
+    snowtemp = read_grid(snowpack_average_temperature, 'float32')
 
+    # snow_water_equivalent
+    # Note: Must have same boundaries and cell size as snowpack_average_temperature
+    swe = read_grid(snow_water_equivalent, 'float32')
 
-def snodas_translate_args(dt, infile_type):
+    coldcontent = snowtemp._replace(array=snodas_coldcontent_array(snowtemp.array, swe.array, snowtemp.nodata))
 
-    def get_ullr(dt, infile_type):
-        """UpperLeft/LowerRight of dataset has changed over time 
-        and is a function of when the snodas grids were produced.
+    # Write numpy array to TIF; int16 with scale/offset if quantized output is on
+    precision = precision_for('nohrsc_snodas_coldcontent')
+    if precision is not None and write_quantized_grid(coldcontent, outfile, precision):
+        return outfile
 
-        For unmasked dataset:
+    return write_grid(coldcontent, outfile, gdal.GDT_Float32)
 
-            2009-12-09 (start of dataset) to 2013-09-30 (including 30th) : [-130.517083333332, 58.2329166666655, -62.2504166666677, 24.0995833333335]
-            2013-10-01 - 2017-08-23 (including 23rd) :                     [-130.516666666662, 58.2333333333310, -62.2499999999977, 24.0999999999990]
-            2017-08-24 - 2019-08-20 (present)                              [-130.516666666661, 58.2333333333310, -62.2499999999975, 24.0999999999990]
 
-            Note: The 2017 shift in the "x" by ~ 0.000000000001 will be disregarded because the difference is far enough to the right of the decimal point 
-            and should not make a difference. The ULLR values in use at 2019-08-20 will be applied to all transoformations from 2013-10-01 forward (to present)
+def snodas_ullr(dt, infile_type):
+    """UpperLeft/LowerRight of dataset has changed over time 
+    and is a function of when the snodas grids were produced.
 
-        For masked dataset:
+    For unmasked dataset:
 
-            2003-09-30 - 2006-03-29: [-124.733749999998366, 52.874583333332339, -66.942083333334011, 24.949583333333454]
-            2006-03-30 - 2006-06-18: [-124.733749999998   , 52.8745833333323  , -66.9420833333340  , 24.9495833333335  ]
-            2006-06-19 - 2006-09-10: [-124.733749999999   , 52.8745833333323  , -66.9420833333342  , 24.9495833333335  ]
-            2006-09-11 - 2009-06-25: [-124.733749999999   , 52.8745833333322  , -66.9420833333342  , 24.9495833333334  ]
-            2006-06-26 - 2009-07-02: [-124.733749999998   , 52.8745833333323  , -66.9420833333340  , 24.9495833333334  ]
-            2009-07-03 - 2009-12-31: [-124.733749999999   , 52.8745833333322  , -66.9420833333342  , 24.9495833333334  ]
-            Note: 2009-12-31 is last day checked, because we use the unmasked dataset when it becomes available in December 2009
+        2009-12-09 (start of dataset) to 2013-09-30 (including 30th) : [-130.517083333332, 58.2329166666655, -62.2504166666677, 24.0995833333335]
+        2013-10-01 - 2017-08-23 (including 23rd) :                     [-130.516666666662, 58.2333333333310, -62.2499999999977, 24.0999999999990]
+        2017-08-24 - 2019-08-20 (present)                              [-130.516666666661, 58.2333333333310, -62.2499999999975, 24.0999999999990]
 
-            The minor fluxuations in the ULLR metadata are far enough to the right of the decimal point and the guidance from the NSIDC website will be used
-            to assign ULLR coordinates.  Website content copied below for convenience: https://nsidc.org/support/how/how-do-i-convert-snodas-binary-files-geotiff-or-netcdf
+        Note: The 2017 shift in the "x" by ~ 0.000000000001 will be disregarded because the difference is far enough to the right of the decimal point 
+        and should not make a difference. The ULLR values in use at 2019-08-20 will be applied to all transoformations from 2013-10-01 forward (to present)
 
-            Appendix 2. Spatial bounds to feed into GDAL -ullr flag for pre and post Oct 01 2013.
+    For masked dataset:
 
-            Pre Oct 01 2013: -124.73375000 52.87458333 -66.94208333 24.87458333
+        2003-09-30 - 2006-03-29: [-124.733749999998366, 52.874583333332339, -66.942083333334011, 24.949583333333454]
+        2006-03-30 - 2006-06-18: [-124.733749999998   , 52.8745833333323  , -66.9420833333340  , 24.9495833333335  ]
+        2006-06-19 - 2006-09-10: [-124.733749999999   , 52.8745833333323  , -66.9420833333342  , 24.9495833333335  ]
+        2006-09-11 - 2009-06-25: [-124.733749999999   , 52.8745833333322  , -66.9420833333342  , 24.9495833333334  ]
+        2006-06-26 - 2009-07-02: [-124.733749999998   , 52.8745833333323  , -66.9420833333340  , 24.9495833333334  ]
+        2009-07-03 - 2009-12-31: [-124.733749999999   , 52.8745833333322  , -66.9420833333342  , 24.9495833333334  ]
+        Note: 2009-12-31 is last day checked, because we use the unmasked dataset when it becomes available in December 2009
 
-            Post Oct 01 2013: -124.73333333 52.87500000 -66.94166667 24.95000000
-        """
+        The minor fluxuations in the ULLR metadata are far enough to the right of the decimal point and the guidance from the NSIDC website will be used
+        to assign ULLR coordinates.  Website content copied below for convenience: https://nsidc.org/support/how/how-do-i-convert-snodas-binary-files-geotiff-or-netcdf
 
-        # Unmasked dataset
-        if infile_type.upper() == 'UNMASKED':
-            if dt < datetime.datetime(2013, 10, 1):
-                ullr = [-130.517083333332, 58.2329166666655, -62.2504166666677, 24.0995833333335]
-            else:
-                ullr = [-130.516666666661, 58.2333333333310, -62.2499999999975, 24.0999999999990]
-        
-        elif infile_type.upper() == 'MASKED':
-            if dt < datetime.datetime(2013, 10, 1):
-                ullr = [-124.73375000, 52.87458333, -66.94208333, 24.87458333]
-            else:
-                ullr = [-124.73333333, 52.87500000, -66.94166667, 24.95000000]
+        Appendix 2. Spatial bounds to feed into GDAL -ullr flag for pre and post Oct 01 2013.
+
+        Pre Oct 01 2013: -124.73375000 52.87458333 -66.94208333 24.87458333
+
+        Post Oct 01 2013: -124.73333333 52.87500000 -66.94166667 24.95000000
+    """
+
+    # Unmasked dataset
+    if infile_type.upper() == 'UNMASKED':
+        if dt < datetime.datetime(2013, 10, 1):
+            ullr = [-130.517083333332, 58.2329166666655, -62.2504166666677, 24.0995833333335]
+        else:
+            ullr = [-130.516666666661, 58.2333333333310, -62.2499999999975, 24.0999999999990]
+    
+    elif infile_type.upper() == 'MASKED':
+        if dt < datetime.datetime(2013, 10, 1):
+            ullr = [-124.73375000, 52.87458333, -66.94208333, 24.87458333]
+        else:
+            ullr = [-124.73333333, 52.87500000, -66.94166667, 24.95000000]
+
+
+    return ullr
 
 
-        return [str(v) for v in ullr]
+def snodas_geotransform(dt, infile_type, xsize, ysize):
+    """GDAL geotransform equivalent to gdal_translate -a_ullr snodas_ullr(...)"""
 
+    ulx, uly, lrx, lry = snodas_ullr(dt, infile_type)
+
+    return (ulx, (lrx - ulx) / xsize, 0.0, uly, 0.0, (lry - uly) / ysize)
+
+
+def snodas_projection():
+    """SNODAS_SRS as WKT"""
+
+    srs = osr.SpatialReference()
+    srs.ImportFromProj4(SNODAS_SRS)
+
+    return srs.ExportToWkt()
+
+
+def snodas_translate_args(dt, infile_type):
 
     args = [
-        '-a_srs', '+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs',
-        '-a_nodata', '-9999',
-        '-a_ullr', ] + get_ullr(dt, infile_type)
+        '-a_srs', SNODAS_SRS,
+        '-a_nodata', str(SNODAS_NODATA),
+        '-a_ullr', ] + [str(v) for v in snodas_ullr(dt, infile_type)]
     
     return args
 
 
-def prepared_file_from_tarfile(tar, filename, outdir, infile_type):
-    """Extract a single file from a .tar, transform it into a format GDAL can
-    work with, and return the absolute filepath
+def snodas_grid_from_member(open_member, filename, dt, infile_type):
+    """Decode <filename> into a Grid with SNODAS georeferencing attached
+    <open_member> opens a member of the raw .tar; see binary.read_snodas_member()
+
+    The gzipped member is inflated straight into a NumPy array; no .bil/.hdr is written
     """
-    # Extract .dat.gz file
-    with tarfile.open(tar) as _tar:
-        outfile = _tar.extract(f'{filename}.dat.gz', path=outdir)
-       
-    # Unzip file and rename ".dat" extension to ".bil"
-    gunzip_file(
-        os.path.join(outdir, f'{filename}.dat.gz'),
-        os.path.join(outdir, change_file_extension(f'{filename}.dat', 'bil'))
-    )
-    # Delete .dat.gz file, it is no longer needed
-    os.remove(os.path.join(outdir, f'{filename}.dat.gz'))
 
-    # Write appropriate .hdr file in same directory, same root name as .bil file
-    shutil.copy(
-        snodas_get_headerfile(infile_type),
-        os.path.join(outdir, change_file_extension(f'{filename}.dat', 'hdr'))
+    array = read_snodas_member(open_member, filename, read_envi_header(snodas_get_headerfile(infile_type)))
+    ysize, xsize = array.shape
+
+    return Grid(
+        array,
+        snodas_geotransform(dt, infile_type, xsize, ysize),
+        snodas_projection(),
+        SNODAS_NODATA,
     )
 
-    return os.path.abspath(os.path.join(outdir, f'{filename}.bil'))
 
+def process_snodas_for_date(dt, infile, infile_type, outdir, wanted=None, keep_infile=False, index=None):
+    """Process the SNODAS grids in <infile> (raw .tar) to Cloud Optimized GeoTIFF
 
-def process_snodas_for_date(dt, infile, infile_type, outdir):
+    <wanted> is the set of filetypes to produce. Parameters that are neither wanted nor
+    needed by a wanted derived grid are not extracted or translated. None produces everything.
+    <infile> is deleted once decoded unless <keep_infile> (e.g. when reading from the local archive).
+    <index> is an optional archive.ArchiveIndex; members are then read by offset instead of
+    scanning the tar, and <infile> is indexed first if it is new or changed.
+
+    Each parameter is decoded once. Derived grids are computed from the decoded arrays
+    held in memory rather than by reading the published COGs back from disk.
+    """
 
     def path_factory(directory, file_format, filename_base=None):
         """Generate a unique absolute path for intermediate processing files
@@ -219,100 +267,108 @@ def process_snodas_for_date(dt, infile, infile_type, outdir):
         """
 
         if file_format.upper() == 'TIF':
+            if filename_base is None:
+                return os.path.join(directory, 'tif')
             return os.path.join(directory, 'tif', '{}.tif'.format(filename_base))
         elif file_format.upper() == 'COG':
             return os.path.join(directory, 'cog', '{}_cloud_optimized.tif'.format(filename_base))
-        elif file_format.upper() == 'RAW':
-            return os.path.join(directory, 'raw')
-
-
-    def add_to_outdict_if_exists(infile, keyword, outdict):
-        """Check if a file exists. If so, add it to the provided dictionary
-        """
-        if os.path.isfile(infile):
-            outdict[keyword] = infile
 
 
     # Keep track of files that are processed
     processed_files = {}
 
     # Make temporary directories for processing
-    [mkdir_p('{}/{}'.format(outdir, td)) for td in ('tif', 'cog', 'raw')]
-
-    for parameter, filename in snodas_filenames(dt, infile_type).items():
-        logging.debug(f'working on parameter: {parameter}; filename: {filename}')
-
-        # extract the raw file of interest into something gdal can work with
-        _file = prepared_file_from_tarfile(
-            infile,
-            filename,
-            os.path.join(outdir, "raw"),
-            infile_type
-        )
-
-        # NATIVE COORDINATE SYSTEM
-        # ========================
-        # (1) Save TIF file (translate) (2) Create overviews (pyramids) (3) Save Cloud Optimized Geotiff (translate)
-        outfile = translate(_file, path_factory(outdir, 'tif', filename), extra_args=snodas_translate_args(dt, infile_type))
-        create_overviews(outfile)
-        outfile_cog = translate(outfile, path_factory(outdir, 'cog', filename))
-        # Add tif and cloud optimized geotiff to list of outfiles if they were created
-        add_to_outdict_if_exists(outfile_cog, parameter, processed_files)
-        # Delete tif after cloud optimized geotiff is created
-        os.remove(outfile)
-    
-    # Delete snodas raw .tar file
-    os.remove(infile)
-
-    # -------------------------------------------------------------------
-    # COMPUTE COLD CONTENT GRID FROM SWE AND SNOWPACK AVERAGE TEMPERATURE
-    # -------------------------------------------------------------------
-    coldcontent = snodas_write_coldcontent(
-        path_factory(outdir, 'cog', snodas_filenames(dt, infile_type)['nohrsc_snodas_snowpack_average_temperature']),
-        path_factory(outdir, 'cog', snodas_filenames(dt, infile_type)['nohrsc_snodas_swe']),
-        path_factory(outdir, 'tif', computed_filenames(dt, infile_type)['nohrsc_snodas_coldcontent'])
-    )
-    # Overviews
-    create_overviews(coldcontent)
-    # Cloud Optimized Geotiff
-    coldcontent_cog = translate(
-        coldcontent,
-        path_factory(outdir, 'cog', computed_filenames(dt, infile_type)['nohrsc_snodas_coldcontent']),
-    )
-    # Add tif and cloud optimized geotiff to list of outfiles if they were created
-    add_to_outdict_if_exists(coldcontent_cog, 'nohrsc_snodas_coldcontent', processed_files)
-
-    # Delete tif after cloud optimized geotiff is created
-    os.remove(coldcontent)
-
-    # ----------------------------------------------------------------
-    # COMPUTE SNOWMELT IN MILLIMETERS (UNIT CONVERSION ON SNODAS GRID)
-    # ----------------------------------------------------------------
-    # Snowmelt in Millimeters, Native Projection
-    snowmeltmm = scale_raster_values(
-        0.01,
-        path_factory(outdir, 'cog', snodas_filenames(dt, infile_type)['nohrsc_snodas_snowmelt']),
-        path_factory(outdir, 'tif', computed_filenames(dt, infile_type)['nohrsc_snodas_snowmeltmm'])
-    )
-    # Overviews
-    create_overviews(snowmeltmm)
-    # Cloud Optimized Geotiff
-    snowmeltmm_cog = translate(
-        snowmeltmm,
-        path_factory(outdir, 'cog', computed_filenames(dt, infile_type)['nohrsc_snodas_snowmeltmm']),
-    )
-
-    # Add tif and cloud optimized geotiff to list of outfiles if they were created
-    add_to_outdict_if_exists(snowmeltmm_cog, 'nohrsc_snodas_snowmelt', processed_files)
-
-    # Delete tif after cloud optimized geotiff is created
-    os.remove(snowmeltmm)
-
-    # Format dictionary as list of files
+    [mkdir_p('{}/{}'.format(outdir, td)) for td in ('tif', 'cog')]
+
+    # SNODAS parameters to decode; a superset of the wanted raw parameters
+    needed = snodas_parameters_needed(snodas_filenames(dt, infile_type).keys(), wanted)
+
+    # Decoded grids still needed as inputs to a wanted derived grid
+    inputs = set()
+    for filetype, (_, parameters) in SNODAS_DERIVED_PRODUCTS.items():
+        if wanted is None or filetype in wanted:
+            inputs.update(parameters)
+    grids = {}
+
+    # Intermediate tifs; each is deleted once its COG is written, and any left by a failure on exit
+    with ScratchSpace(path_factory(outdir, 'tif')) as scratch:
+
+        def publish(filetype, grid, cog, datatype):
+            """COG of <grid>, and its SHG companion from the same array if that is wanted"""
+
+            processed_files[filetype] = grid_to_cog(
+                grid, cog, datatype, scratch,
+                encoding=encoding_for(filetype), precision=precision_for(filetype), return_statistics=True
+            )
+            if is_companion_wanted(filetype, wanted):
+                processed_files[companion_filetype(filetype)] = grid_to_shg_cog(grid, companion_path(cog), scratch)
+
+        with ExitStack() as stack:
+            if index is None:
+                open_member = stack.enter_context(tarfile.open(infile)).extractfile
+            else:
+                index.update([infile])
+                open_member = partial(index.open_member, infile)
+
+            for parameter, filename in snodas_filenames(dt, infile_type).items():
+                if parameter not in needed:
+                    logging.debug(f'skipping parameter; not wanted: {parameter}')
+                    continue
+
+                logging.debug(f'working on parameter: {parameter}; filename: {filename}')
+
+                grid = snodas_grid_from_member(open_member, filename, dt, infile_type)
+
+                # Parameters decoded only as inputs to a derived grid are not published
+                # (raw snowmelt is published as the derived snowmelt in millimeters)
+                if parameter not in SNODAS_DERIVED_PRODUCTS and (wanted is None or parameter in wanted):
+                    publish(parameter, grid, path_factory(outdir, 'cog', filename), gdal.GDT_Int16)
+
+                if parameter in inputs:
+                    grids[parameter] = grid
+
+        # Delete snodas raw .tar file
+        if not keep_infile:
+            os.remove(infile)
+
+        # -------------------------------------------------------------------
+        # COMPUTE COLD CONTENT GRID FROM SWE AND SNOWPACK AVERAGE TEMPERATURE
+        # -------------------------------------------------------------------
+        if wanted is None or 'nohrsc_snodas_coldcontent' in wanted:
+            # Inputs are dropped from <grids> as soon as their last consumer has them
+            snowtemp = grids.pop('nohrsc_snodas_snowpack_average_temperature')
+            swe = grids.pop('nohrsc_snodas_swe')
+            filename = computed_filenames(dt, infile_type)['nohrsc_snodas_coldcontent']
+            publish(
+                'nohrsc_snodas_coldcontent',
+                snowtemp._replace(
+                    array=snodas_coldcontent_array(snowtemp.array, swe.array, snowtemp.nodata)
+                ),
+                path_factory(outdir, 'cog', filename),
+                gdal.GDT_Float32,
+            )
+            snowtemp = swe = None
+
+        # ----------------------------------------------------------------
+        # COMPUTE SNOWMELT IN MILLIMETERS (UNIT CONVERSION ON SNODAS GRID)
+        # ----------------------------------------------------------------
+        if wanted is None or 'nohrsc_snodas_snowmelt' in wanted:
+            snowmelt = grids.pop('nohrsc_snodas_snowmelt')
+            filename = computed_filenames(dt, infile_type)['nohrsc_snodas_snowmeltmm']
+            publish(
+                'nohrsc_snodas_snowmelt',
+                snowmelt._replace(array=scale_array(snowmelt.array, 0.01, snowmelt.nodata)),
+                path_factory(outdir, 'cog', filename),
+                gdal.GDT_Float32,
+            )
+
+    grids = None
+
+    # Format dictionary as list of files; statistics were computed from the arrays as they were written
     outfile_list = []
-    for k, v in processed_files.items():
+    for k, (v, stats) in processed_files.items():
         outfile_list.append(
-            {"file": v, "filetype": k, "datetime": dt.isoformat(), "version": None }
+            {"file": v, "filetype": k, "datetime": dt.isoformat(), "version": None, "statistics": stats}
         )
 
     return outfile_list
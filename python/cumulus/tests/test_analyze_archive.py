@@ -0,0 +1,82 @@
+import datetime
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+
+from cumulus.snodas.core import analyze_archive
+
+HEADER = """Number of columns: 8192
+Number of rows: 4096
+No data value: -9999
+Minimum x-axis coordinate: {xmin}
+Maximum x-axis coordinate: -62.25
+Minimum y-axis coordinate: 24.1
+Maximum y-axis coordinate: 58.23
+"""
+
+
+def write_archive(indir, dt, xmin):
+    name = analyze_archive.swe_headerfile_name(dt, 'unmasked')
+    data = gzip.compress(HEADER.format(xmin=xmin).encode())
+    with tarfile.open(os.path.join(indir, f'SNODAS_unmasked_{dt:%Y%m%d}.tar'), 'w') as t:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        t.addfile(info, io.BytesIO(data))
+
+
+class Test_analyze_archive(unittest.TestCase):
+
+    def setUp(self):
+        self.td = tempfile.TemporaryDirectory()
+        self.dates = [datetime.datetime(2013, 9, 28) + datetime.timedelta(days=i) for i in range(5)]
+        for dt in self.dates:
+            if dt.day == 30:
+                continue
+            write_archive(self.td.name, dt, -130.517083 if dt.month == 9 else -130.516667)
+
+        infiles = analyze_archive.get_raw_infile_dict(self.dates[0], self.dates[-1] + datetime.timedelta(days=1), 'unmasked', self.td.name)
+        self.raw_infiles = {(dt, 'unmasked'): f for dt, f in infiles.items()}
+        self.outfile = os.path.join(self.td.name, 'analysis.csv')
+        self.index = os.path.join(self.td.name, 'index.sqlite3')
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_analyze(self):
+        """regime change and missing day are reported; rows are in date order"""
+
+        rows = analyze_archive.analyze(self.raw_infiles, self.outfile, self.index, workers=2)
+        analyze_archive.write_table(rows, self.outfile)
+
+        self.assertEqual([dt.strftime('%Y%m%d') for dt in self.dates], [r['date'] for r in rows])
+        self.assertEqual({'unmasked': [('20130930', 'missing_archive')]}, analyze_archive.missing_days(rows))
+
+        changes = analyze_archive.regime_changes(rows)
+        self.assertEqual(1, len(changes))
+        self.assertEqual(('20130929', '20131001'), (changes[0]['previous_date'], changes[0]['date']))
+        self.assertEqual(['xmin'], list(changes[0]['changed']))
+
+        with open(self.outfile) as f:
+            self.assertEqual(len(self.dates) + 1, len(f.readlines()))
+
+    def test_rerun_uses_checkpoint(self):
+        """finished dates are not analyzed again; a missing archive is checked again"""
+
+        analyze_archive.analyze(self.raw_infiles, self.outfile, self.index, workers=1)
+        for dt in self.dates:
+            path = self.raw_infiles[(dt, 'unmasked')]
+            if os.path.isfile(path):
+                os.remove(path)
+        # The missing day is filled in
+        write_archive(self.td.name, datetime.datetime(2013, 9, 30), -130.517083)
+
+        rows = analyze_archive.analyze(self.raw_infiles, self.outfile, self.index, workers=1)
+
+        self.assertEqual(5, sum(r['status'] == 'ok' for r in rows))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,173 @@
+import unittest
+
+import numpy as np
+
+from cumulus.geoprocess.core import encoding
+from cumulus.geoprocess.core.arrays import (
+    active_blocks,
+    array_statistics,
+    constant_value,
+    dequantize,
+    quantize,
+    sparse_apply,
+    unscale_statistics,
+)
+
+NODATA = -9999
+
+
+def assert_within_step(test, original, quantized, step):
+    """every valid value within step / 2; nodata kept in place"""
+
+    restored = dequantize(quantized, NODATA, dtype='float64')
+    valid = original != NODATA
+
+    test.assertTrue(np.array_equal(valid, quantized.array != quantized.nodata))
+    error = np.abs(restored[valid] - original[valid].astype(np.float64))
+    test.assertLessEqual(error.max(initial=0), step / 2 * (1 + 1e-9))
+
+
+class Test_quantize(unittest.TestCase):
+
+    def test_error_bound(self):
+
+        rng = np.random.RandomState(0)
+        array = (rng.standard_normal((200, 300)) * 500 - 1000).astype('float32')
+        array[::7, ::5] = NODATA
+
+        for dtype in ('int16', 'uint16'):
+            for step in (0.1, 0.5, 1.0):
+                q = quantize(array, NODATA, step, dtype=dtype)
+                self.assertEqual(np.dtype(dtype), q.array.dtype)
+                assert_within_step(self, array, q, step)
+
+    def test_multiples_of_step_are_exact(self):
+        """SNODAS snowmelt is integer * 0.01; quantized at 0.01 it rounds back to the same integers"""
+
+        raw = np.arange(-200, 29800, dtype='int16').reshape(100, 300)
+        raw[0, :10] = NODATA
+        snowmelt = np.where(raw == NODATA, NODATA, raw * np.float32(0.01)).astype('float32')
+
+        q = quantize(snowmelt, NODATA, 0.01)
+
+        restored = dequantize(q, NODATA, dtype='float64')
+        self.assertTrue(np.array_equal(raw, np.where(raw == NODATA, NODATA, np.round(restored / 0.01)).astype('int16')))
+
+    def test_too_wide_returns_none(self):
+
+        array = np.array([[0, 70000]], dtype='float32')
+        self.assertIsNone(quantize(array, NODATA, 1.0))
+        self.assertIsNotNone(quantize(array, NODATA, 2.5))
+
+    def test_all_nodata_and_nan(self):
+
+        array = np.array([[NODATA, np.nan]], dtype='float32')
+        q = quantize(array, NODATA, 0.1)
+        self.assertTrue((q.array == q.nodata).all())
+
+
+class Test_array_statistics(unittest.TestCase):
+
+    def test_ignores_nodata(self):
+        """same numbers as GDAL's GetStatistics (population stddev) over valid cells"""
+
+        array = np.array([[1, 2, NODATA], [3, 4, np.nan]], dtype='float32')
+        stats = array_statistics(array, NODATA, bins=3)
+
+        self.assertEqual(4, stats['count'])
+        self.assertEqual((1.0, 4.0, 2.5), (stats['min'], stats['max'], stats['mean']))
+        self.assertAlmostEqual(np.std([1, 2, 3, 4]), stats['stddev'])
+        self.assertEqual([1, 1, 2], stats['histogram']['counts'])
+
+    def test_no_valid_cells(self):
+
+        stats = array_statistics(np.full((2, 2), NODATA, dtype='int16'), NODATA)
+        self.assertEqual((0, None), (stats['count'], stats['mean']))
+
+    def test_unscale_matches_values(self):
+
+        array = np.array([[-1.5, 0.25, 7.0, NODATA]], dtype='float32')
+        q = quantize(array, NODATA, 0.25)
+        stats = unscale_statistics(array_statistics(q.array, q.nodata), q.scale, q.offset)
+        expected = array_statistics(array, NODATA)
+
+        for k in ('min', 'max', 'mean', 'stddev'):
+            self.assertAlmostEqual(expected[k], stats[k])
+
+
+class Test_sparse(unittest.TestCase):
+
+    def test_constant_value(self):
+
+        self.assertEqual(NODATA, constant_value(np.full((3, 4), NODATA, dtype='int16')))
+        self.assertEqual(0, constant_value(np.zeros((3, 4), dtype='float32')))
+        self.assertTrue(np.isnan(constant_value(np.full((2, 2), np.nan))))
+        self.assertIsNone(constant_value(np.array([[0, 0], [0, 1]])))
+        self.assertIsNone(constant_value(np.array([np.nan, 1.0])))
+
+    def test_active_blocks(self):
+        """blocks at the right and bottom edges may be partial"""
+
+        active = np.zeros((600, 500), dtype=bool)
+        active[10, 10] = active[599, 499] = True
+
+        windows = active_blocks(active, blocksize=256)
+        self.assertEqual([(slice(0, 256), slice(0, 256)), (slice(512, 768), slice(256, 512))], windows)
+        self.assertEqual([], active_blocks(np.zeros((5, 5), dtype=bool)))
+
+    def test_sparse_apply_matches_dense(self):
+        """scale_array() style: 0 and nodata cells prefilled, the rest scaled only where blocks need it"""
+
+        array = np.zeros((1000, 700), dtype='int16')
+        array[:300, :] = NODATA
+        array[700:720, 100:110] = 250
+
+        def scale(a):
+            return np.where(a == NODATA, NODATA, a.astype('float32') * 0.01)
+
+        nodata = array == NODATA
+        out = np.where(nodata, np.float32(NODATA), np.float32(0))
+        calls = []
+
+        def counted(a):
+            calls.append(a.shape)
+            return scale(a)
+
+        result = sparse_apply(counted, out, ~nodata & (array != 0), array, blocksize=256)
+
+        self.assertTrue(np.array_equal(scale(array), result))
+        self.assertEqual(1, len(calls))
+
+
+class Test_product_precision(unittest.TestCase):
+    """Declared precisions hold for the range each product can take"""
+
+    def test_coldcontent(self):
+
+        # Any int16 SWE (mm), including glaciers, over snowpack temperatures (K) down to 200 K
+        swe = np.tile(np.append(np.arange(0, 32700, 100), 32767).astype('int16'), (74, 1))
+        snowtemp = np.tile(np.arange(200, 274, dtype='int16')[:, None], (1, swe.shape[1]))
+        # snodas.core.process.snodas_coldcontent_array(); cold content is <= 0
+        coldcontent = (swe * 2114 * np.minimum(snowtemp - 273.15, 0) / 333000).astype('float32')
+        coldcontent[0, 0] = NODATA
+
+        step = encoding.PRECISION['nohrsc_snodas_coldcontent']
+        q = quantize(coldcontent, NODATA, step)
+        self.assertIsNotNone(q)
+        assert_within_step(self, coldcontent, q, step)
+
+    def test_off_unless_enabled(self):
+
+        self.assertIsNone(encoding.precision_for('nohrsc_snodas_coldcontent'))
+        encoding.set_quantize(True)
+        try:
+            self.assertEqual(0.25, encoding.precision_for('nohrsc_snodas_coldcontent'))
+            self.assertIsNone(encoding.precision_for('nohrsc_snodas_swe'))
+        finally:
+            encoding.set_quantize(False)
+
+        self.assertEqual(2, encoding.integer(encoding.Encoding('DEFLATE', predictor=3)).predictor)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
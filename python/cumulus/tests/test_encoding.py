@@ -0,0 +1,61 @@
+import unittest
+
+from cumulus.geoprocess.core.encoding import (
+    DEFAULT,
+    ENCODINGS,
+    PUBLISHED,
+    Encoding,
+    candidates,
+    creation_args,
+    creation_options,
+    encoding_for,
+)
+
+
+class Test_encoding(unittest.TestCase):
+
+    def test_default_is_unchanged_output(self):
+        """products without settings keep tiled DEFLATE with no predictor, leaving out empty tiles"""
+
+        self.assertEqual(PUBLISHED, encoding_for('not_a_product'))
+        self.assertEqual(PUBLISHED, encoding_for(None))
+        self.assertEqual(['TILED=YES', 'COMPRESS=DEFLATE'], creation_options())
+        self.assertEqual(['TILED=YES', 'COMPRESS=DEFLATE', 'SPARSE_OK=TRUE'], creation_options(PUBLISHED))
+
+    def test_creation_options(self):
+
+        self.assertEqual(
+            ['TILED=YES', 'COMPRESS=ZSTD', 'ZSTD_LEVEL=9', 'PREDICTOR=3', 'BLOCKXSIZE=512', 'BLOCKYSIZE=512'],
+            creation_options(Encoding('ZSTD', level=9, predictor=3, blocksize=512)),
+        )
+        self.assertEqual(
+            ['-co', 'TILED=YES', '-co', 'COMPRESS=LERC_DEFLATE', '-co', 'ZLEVEL=6', '-co', 'MAX_Z_ERROR=0.01'],
+            creation_args(Encoding('LERC_DEFLATE', level=6, max_z_error=0.01)),
+        )
+
+    def test_sparse(self):
+
+        self.assertEqual('SPARSE_OK=TRUE', creation_options(Encoding('DEFLATE', sparse=True))[-1])
+        self.assertTrue(encoding_for('nohrsc_snodas_snowmelt').sparse)
+
+    def test_product_lookup_ignores_case(self):
+        """grib BANDS keys are mixed case"""
+
+        benchmarked = Encoding('ZSTD', level=9, predictor=3, sparse=True)
+        ENCODINGS['ncep_mrms_v12_multisensor_qpe_01h_pass1'] = benchmarked
+        try:
+            self.assertEqual(benchmarked, encoding_for('ncep_mrms_v12_MultiSensor_QPE_01H_Pass1'))
+        finally:
+            del ENCODINGS['ncep_mrms_v12_multisensor_qpe_01h_pass1']
+
+    def test_published_products_keep_deflate(self):
+        """published products only add sparse tiles to DEFAULT; predictors are benchmark candidates"""
+
+        self.assertEqual(DEFAULT._replace(sparse=True), encoding_for('nohrsc_snodas_swe'))
+        # Entries only exist where benchmarks chose something else
+        self.assertNotIn(PUBLISHED, ENCODINGS.values())
+        self.assertTrue(all(e.predictor in (2, None) for e in candidates(2).values()))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
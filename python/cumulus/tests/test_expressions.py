@@ -0,0 +1,99 @@
+import unittest
+
+import numpy as np
+
+from cumulus.geoprocess.core import expressions
+from cumulus.geoprocess.core.expressions import Expression, ExpressionError
+
+NODATA = -9999
+
+# snodas.core.process.COLDCONTENT; process.py imports GDAL
+COLDCONTENT = (
+    'where(t_isnodata, NODATA, where(t >= 273.15, 0, where(swe_isnodata, NODATA, swe * 2114 * (t - 273.15) / 333000)))'
+)
+
+
+class Test_Expression(unittest.TestCase):
+
+    def test_rejects_unsafe_syntax(self):
+
+        for text in ('a.real', '__import__("os")', 'open(a)', '"a"', 'a[0]', 'lambda: a', 'where(a, b, c=1)', 'a +'):
+            with self.assertRaises(ExpressionError, msg=text):
+                Expression(text)
+
+    def test_inputs(self):
+
+        e = Expression('where(a_isnodata, NODATA, a * factor + b)')
+        self.assertEqual(['a', 'b', 'factor'], e.inputs())
+        self.assertEqual(['a', 'b'], e.inputs({'factor': 2}))
+
+        with self.assertRaises(ExpressionError):
+            e.evaluate({'a': np.zeros((2, 2))}, constants={'factor': 2})
+
+    def test_nodata_propagates(self):
+        """without an _isnodata name, nodata in any input is nodata out"""
+
+        a = np.array([[1, NODATA, 3]], dtype='int16')
+        b = np.array([[10, 20, np.nan]], dtype='float32')
+
+        result = Expression('a * factor + b').evaluate({'a': a, 'b': b}, nodata=NODATA, constants={'factor': 2})
+
+        self.assertEqual(np.dtype('float32'), result.dtype)
+        self.assertEqual([12, NODATA, NODATA], result[0].tolist())
+
+    def test_isnodata_handled_by_expression(self):
+
+        a = np.array([[0, NODATA, 5]], dtype='int16')
+        b = np.array([[NODATA, NODATA, NODATA]], dtype='int16')
+
+        result = Expression('where(a_isnodata, 0, a)').evaluate({'a': a}, nodata=NODATA)
+        self.assertEqual([0, 0, 5], result[0].tolist())
+
+        # snodas.core.lakefix.LAKEFIX, where B is a mask with its own nodata
+        lakefix = Expression('where((A == 0) & (B == -9999), -9999, A)')
+        out = lakefix.evaluate(
+            {'A': a, 'B': b}, nodata={'A': NODATA, 'B': -32768}, out_nodata=NODATA,
+            out=np.empty(a.shape, dtype=a.dtype)
+        )
+        self.assertEqual(np.dtype('int16'), out.dtype)
+        self.assertEqual([NODATA, NODATA, 5], out[0].tolist())
+
+    def test_blocks_match_whole_grid(self):
+
+        rng = np.random.RandomState(0)
+        t = rng.randint(240, 280, size=(1000, 300)).astype('int16')
+        swe = rng.randint(0, 3000, size=t.shape).astype('int16')
+        t[::11, ::3] = NODATA
+        swe[::13, ::7] = NODATA
+
+        e = Expression(COLDCONTENT)
+        whole = e.evaluate({'t': t, 'swe': swe}, nodata=NODATA)
+
+        chunk_rows = expressions.CHUNK_ROWS
+        expressions.CHUNK_ROWS = 64
+        try:
+            blocks = e.evaluate({'t': t, 'swe': swe}, nodata=NODATA, max_workers=4)
+        finally:
+            expressions.CHUNK_ROWS = chunk_rows
+
+        self.assertTrue(np.array_equal(whole, blocks))
+
+    def test_coldcontent_matches_formula(self):
+        """same result as the NumPy formula COLDCONTENT replaced"""
+
+        t = np.array([[NODATA, 273, 274, 263, 263, NODATA]], dtype='int16')
+        swe = np.array([[100, NODATA, 100, 1000, NODATA, NODATA]], dtype='int16')
+
+        result = Expression(COLDCONTENT).evaluate({'t': t, 'swe': swe}, nodata=NODATA)
+
+        t, swe = t.astype('float32'), swe.astype('float32')
+        degc = np.where(t == NODATA, NODATA, t - 273.15)
+        expected = np.where(
+            degc >= 0, 0, np.where((swe == NODATA) | (degc == NODATA), NODATA, swe * 2114 * degc / 333000)
+        ).astype('float32')
+
+        self.assertTrue(np.allclose(expected, result))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
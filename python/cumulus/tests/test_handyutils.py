@@ -0,0 +1,61 @@
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+
+from cumulus.handyutils.core import checksum, HashingStream
+
+CONTENT = os.urandom(2500001)
+
+
+class Test_checksum(unittest.TestCase):
+
+    def setUp(self):
+        self.td = tempfile.TemporaryDirectory()
+        self.infile = os.path.join(self.td.name, 'infile.tif')
+        with open(self.infile, 'wb') as f:
+            f.write(CONTENT)
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_checksum_matches_hashlib(self):
+        """readinto-based checksum matches hashlib over the whole file, regardless of algorithm case"""
+
+        self.assertEqual(hashlib.md5(CONTENT).hexdigest(), checksum(self.infile, 'md5'))
+        self.assertEqual(hashlib.sha256(CONTENT).hexdigest(), checksum(self.infile, 'SHA256', size=4096))
+
+    def test_checksum_unsupported_algorithm(self):
+        """unsupported algorithm returns None"""
+
+        self.assertIsNone(checksum(self.infile, 'crc32'))
+
+
+class Test_HashingStream(unittest.TestCase):
+
+    def test_write(self):
+        """digests cover every byte written"""
+
+        with HashingStream(io.BytesIO(), ['MD5', 'sha256']) as f:
+            f.write(CONTENT[:10])
+            f.write(memoryview(CONTENT)[10:])
+            self.assertEqual(len(CONTENT), f.bytes)
+
+        self.assertEqual(hashlib.md5(CONTENT).hexdigest(), f.hexdigest('md5'))
+        self.assertEqual(hashlib.sha256(CONTENT).hexdigest(), f.hexdigests()['SHA256'])
+
+    def test_read_and_readinto(self):
+        """digests cover every byte read"""
+
+        f = HashingStream(io.BytesIO(CONTENT), ['MD5'])
+        f.read(100)
+        buf = bytearray(1000)
+        while f.readinto(buf):
+            pass
+
+        self.assertEqual(hashlib.md5(CONTENT).hexdigest(), f.hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+from cumulus.ingest.core.ledger import coalesce_records, DatabaseLedger, LocalLedger, object_identity
+
+
+def s3_record(key, etag='abc', size=10, sequencer='0A'):
+    return {
+        's3': {
+            'bucket': {'name': 'corpsmap-data-incoming'},
+            'object': {'key': key, 'eTag': etag, 'size': size, 'sequencer': sequencer},
+        }
+    }
+
+
+class Test_coalesce_records(unittest.TestCase):
+
+    def test_duplicate_keys_keep_latest_sequencer(self):
+        """one record per key; the highest sequencer wins; first-seen order is kept"""
+
+        records = [
+            s3_record('cumulus/a/1.grb2', etag='old', sequencer='0A'),
+            s3_record('cumulus/a/2.grb2'),
+            s3_record('cumulus/a/1.grb2', etag='new', sequencer='0B00'),
+            s3_record('cumulus/a/1.grb2', etag='older', sequencer='09'),
+        ]
+        coalesced = coalesce_records(records)
+
+        self.assertEqual(['cumulus/a/1.grb2', 'cumulus/a/2.grb2'], [object_identity(r)[1] for r in coalesced])
+        self.assertEqual('new', object_identity(coalesced[0])[2])
+
+    def test_object_identity_unquotes_key(self):
+        """key is url-decoded and etag quotes are stripped"""
+
+        identity = object_identity(s3_record('cumulus/a/file+name.grb2', etag='"abc"'))
+
+        self.assertEqual(('corpsmap-data-incoming', 'cumulus/a/file name.grb2', 'abc', 10), identity)
+
+
+class Test_LocalLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.td = tempfile.TemporaryDirectory()
+        self.ledger = LocalLedger(os.path.join(self.td.name, 'ledger.sqlite3'))
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_record_and_get(self):
+        """recorded productfiles are returned only for the same etag and size"""
+
+        productfiles = [{'product_id': 'p', 'file': 'cumulus/p/f.tif', 'datetime': '2020-01-01T00:00:00'}]
+        self.ledger.record('b', 'k', 'etag', 10, productfiles)
+
+        self.assertEqual(productfiles, self.ledger.get('b', 'k', 'etag', 10))
+        self.assertIsNone(self.ledger.get('b', 'k', 'other', 10))
+        self.assertIsNone(self.ledger.get('b', 'k', 'etag', 11))
+
+    def test_missing_etag_is_never_known(self):
+        """objects without an etag are always processed"""
+
+        self.ledger.record('b', 'k', None, 10, [])
+
+        self.assertIsNone(self.ledger.get('b', 'k', None, 10))
+
+
+class UndefinedTable(Exception):
+    pgcode = '42P01'
+
+
+class Connection:
+    """DB-API connection whose queries fail as if the ledger table were missing"""
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        raise UndefinedTable('relation "ingest_ledger" does not exist')
+
+    def close(self):
+        pass
+
+
+class Test_DatabaseLedger(unittest.TestCase):
+
+    def test_missing_table(self):
+        """no connection or DDL at construction; queries on a missing table fail with the fix in the message"""
+
+        connections = []
+
+        def connect():
+            connections.append(Connection())
+            return connections[-1]
+
+        ledger = DatabaseLedger(connect)
+        self.assertEqual([], connections)
+
+        with self.assertRaisesRegex(RuntimeError, 'sql/ingest_ledger.sql'):
+            ledger.get('b', 'k', 'etag', 10)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
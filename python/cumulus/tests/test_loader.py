@@ -0,0 +1,110 @@
+import unittest
+
+from cumulus.ingest.core.loader import PRODUCTFILE_COLUMNS, RowStream, load_productfiles
+
+
+def parse_copy_field(field):
+    if field == '\\N':
+        return None
+    out, i = [], 0
+    while i < len(field):
+        if field[i] == '\\':
+            out.append({'\\': '\\', 't': '\t', 'n': '\n', 'r': '\r'}[field[i + 1]])
+            i += 2
+        else:
+            out.append(field[i])
+            i += 1
+    return ''.join(out)
+
+
+class FakePostgres:
+    """Stand-in for a psycopg2 connection: COPY text parsing and a unique (product_id, version, datetime) table"""
+
+    def __init__(self):
+        self.table = {}
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.fail_on_insert = False
+
+    def connect(self):
+        return self
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        if sql.startswith('INSERT'):
+            if self.fail_on_insert:
+                raise RuntimeError('insert failed')
+            self.rowcount = 0
+            for row in self.staging:
+                k = (row['product_id'], row['version'], row['datetime'])
+                if k not in self.table:
+                    self.table[k] = row
+                    self.rowcount += 1
+
+    def copy_expert(self, sql, f, size=8192):
+        self.statements.append(sql)
+        data = ''
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                break
+            data += chunk
+        self.staging = [
+            dict(zip(PRODUCTFILE_COLUMNS, (parse_copy_field(v) for v in line.split('\t'))))
+            for line in data.split('\n') if line
+        ]
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+def entries(n, product_id='p1'):
+    for i in range(n):
+        yield {'datetime': f'2020-01-01T{i % 24:02d}:00:00', 'file': f'cumulus/x/file {i}\tname\\.tif', 'product_id': product_id, 'version': str(i // 24)}
+
+
+class Test_loader(unittest.TestCase):
+
+    def test_row_stream_escapes(self):
+        """tabs, newlines, backslashes and None survive COPY text format"""
+
+        row = {'datetime': 'a', 'file': 'b\tc\nd\\e', 'product_id': None, 'version': 'v'}
+        line = RowStream([row]).read()
+        fields = line.rstrip('\n').split('\t')
+
+        self.assertEqual(list(row.values()), [parse_copy_field(f) for f in fields])
+
+    def test_load_ignores_conflicts(self):
+        """duplicates are loaded once, in one transaction"""
+
+        db = FakePostgres()
+        stats = load_productfiles(db.connect, entries(5000))
+        self.assertEqual((5000, 5000), (stats['rows'], stats['inserted']))
+
+        stats = load_productfiles(db.connect, entries(6000))
+        self.assertEqual((6000, 1000), (stats['rows'], stats['inserted']))
+        self.assertEqual('cumulus/x/file 5\tname\\.tif', db.table[('p1', '0', '2020-01-01T05:00:00')]['file'])
+        self.assertEqual(2, db.commits)
+        self.assertTrue(db.statements[1].startswith('COPY productfile_staging'))
+
+    def test_rollback_on_failure(self):
+
+        db = FakePostgres()
+        db.fail_on_insert = True
+        with self.assertRaises(RuntimeError):
+            load_productfiles(db.connect, entries(10))
+        self.assertEqual((0, 1), (db.commits, db.rollbacks))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
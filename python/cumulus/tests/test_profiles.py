@@ -0,0 +1,65 @@
+import os
+import types
+import unittest
+
+from cumulus.geoprocess.core import profiles
+
+GRIB = types.SimpleNamespace(GDAL_PROFILE='small-hourly-grib')
+
+
+class Test_profiles(unittest.TestCase):
+
+    def tearDown(self):
+        profiles.set_override(None)
+        profiles.set_concurrency(1)
+
+    def test_profile_for(self):
+        """processor attribute, else default; the override wins over both"""
+
+        self.assertEqual('small-hourly-grib', profiles.profile_for(GRIB))
+        self.assertEqual('default', profiles.profile_for(types.SimpleNamespace()))
+
+        profiles.set_override('conus-snodas')
+        self.assertEqual('conus-snodas', profiles.profile_for(GRIB))
+
+        with self.assertRaises(ValueError):
+            profiles.set_override('fast')
+
+    def test_default_changes_nothing(self):
+
+        with profiles.use_profile(None) as name:
+            self.assertEqual('default', name)
+            self.assertEqual([], profiles.creation_args())
+            self.assertEqual([], profiles.warp_args())
+            self.assertEqual(dict(os.environ), profiles.environ())
+
+    def test_environ_follows_current_profile(self):
+        """subprocess environment has the profile's options; the process environment still wins"""
+
+        token = profiles._current.set('small-hourly-grib')
+        os.environ['GDAL_CACHEMAX'] = '64'
+        try:
+            env = profiles.environ()
+            self.assertEqual('ALL_CPUS', env['GDAL_NUM_THREADS'])
+            self.assertEqual('64', env['GDAL_CACHEMAX'])
+            self.assertEqual(['-co', 'NUM_THREADS=ALL_CPUS'], profiles.creation_args())
+            self.assertEqual(['-multi', '-wo', 'NUM_THREADS=ALL_CPUS'], profiles.warp_args())
+        finally:
+            del os.environ['GDAL_CACHEMAX']
+            profiles._current.reset(token)
+
+        self.assertEqual('default', profiles.current())
+
+    def test_threads_shared_between_records(self):
+        """ALL_CPUS is divided between concurrent records, never below one thread"""
+
+        profiles.set_concurrency(2)
+        self.assertEqual(str(max(1, (os.cpu_count() or 1) // 2)), profiles.options('conus-snodas')['GDAL_NUM_THREADS'])
+
+        profiles.set_concurrency(10 * (os.cpu_count() or 1))
+        self.assertEqual('1', profiles.options('small-hourly-grib')['GDAL_NUM_THREADS'])
+        self.assertEqual('ALL_CPUS', profiles.PROFILES['small-hourly-grib']['GDAL_NUM_THREADS'])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
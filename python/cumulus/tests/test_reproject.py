@@ -0,0 +1,148 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from cumulus.geoprocess.core import reproject
+from cumulus.geoprocess.core.reproject import Source, Target, apply, pack, source_cells, target_grid
+
+NODATA = -9999
+
+# 100 x 200 source grid of 1 unit cells, upper left at (0, 100)
+SOURCE_GEOTRANSFORM = (0.0, 1.0, 0.0, 100.0, 0.0, -1.0)
+SOURCE_SHAPE = (100, 200)
+
+
+def index_for(target, resampling='bilinear'):
+    """Index to <target> in the source's own coordinates (no transform needed)"""
+
+    shape, geotransform = target_grid(target)
+    y, x = np.mgrid[0:shape[0], 0:shape[1]]
+    x = geotransform[0] + (x.ravel() + 0.5) * geotransform[1]
+    y = geotransform[3] + (y.ravel() + 0.5) * geotransform[5]
+    scale = (target.resolution / SOURCE_GEOTRANSFORM[1], ) * 2
+
+    return pack(
+        *source_cells(x, y, SOURCE_GEOTRANSFORM, SOURCE_SHAPE, resampling, scale), shape, geotransform, SOURCE_SHAPE
+    )
+
+
+def read(array, index):
+
+    r, c, rows, cols = index.window
+    return array[r:r + rows, c:c + cols]
+
+
+class Test_reproject(unittest.TestCase):
+
+    def setUp(self):
+
+        # value = column + 1000 * row; bilinear is exact on a plane
+        rows, cols = np.mgrid[0:SOURCE_SHAPE[0], 0:SOURCE_SHAPE[1]]
+        self.source = (cols + 1000 * rows).astype('float32')
+
+    def test_bilinear_on_plane(self):
+
+        index = index_for(Target((10.25, 20.25, 50.25, 60.25), 0.5))
+        result = apply(index, read(self.source, index), NODATA)
+
+        # Target cell centers in source coordinates, less half a cell to source pixel centers
+        shape, gt = target_grid(Target((10.25, 20.25, 50.25, 60.25), 0.5))
+        col = gt[0] + (np.arange(shape[1]) + 0.5) * gt[1] - 0.5
+        row = (100 - (gt[3] + (np.arange(shape[0]) + 0.5) * gt[5])) - 0.5
+        expected = col[None, :] + 1000 * row[:, None]
+
+        self.assertEqual((80, 80), result.shape)
+        np.testing.assert_allclose(expected, result, rtol=1e-6)
+
+    def test_window_is_only_what_target_covers(self):
+
+        index = index_for(Target((10, 20, 50, 60), 1))
+
+        self.assertEqual((40, 10, 40, 40), index.window)
+
+    def test_downsampling_widens_kernel(self):
+        """2 unit cells take the 4 x 4 source cells within a target cell of their centers, as gdalwarp does"""
+
+        index = index_for(Target((10, 20, 50, 60), 2))
+        self.assertEqual((4, 4), index.taps)
+        self.assertEqual((39, 9, 42, 42), index.window)
+
+        # Still exact on a plane
+        result = apply(index, read(self.source, index), NODATA)
+        shape, gt = target_grid(Target((10, 20, 50, 60), 2))
+        col = gt[0] + (np.arange(shape[1]) + 0.5) * gt[1] - 0.5
+        row = (100 - (gt[3] + (np.arange(shape[0]) + 0.5) * gt[5])) - 0.5
+        np.testing.assert_allclose(col[None, :] + 1000 * row[:, None], result, rtol=1e-6)
+
+        # A column one and a half source cells from the first target centers (column 10.5) has weight 0.25 of 2
+        source = np.zeros(SOURCE_SHAPE, dtype='float32')
+        source[:, 9] = 1
+        result = apply(index, read(source, index), NODATA)
+        np.testing.assert_allclose(0.125, result[:, 0])
+        self.assertTrue((result[:, 1:] == 0).all())
+
+    def test_outside_source_is_nodata(self):
+
+        index = index_for(Target((190, 90, 210, 110), 1))
+        result = apply(index, read(self.source, index), NODATA)
+
+        self.assertTrue((result[:10, :] == NODATA).all())
+        self.assertTrue((result[:, 10:] == NODATA).all())
+        self.assertTrue((result[10:, :10] != NODATA).all())
+
+    def test_nodata_neighbors_reweighted(self):
+
+        source = np.ones(SOURCE_SHAPE, dtype='float32')
+        source[50:, :] = NODATA
+        source[:, 100:] = NODATA
+
+        index = index_for(Target((90, 40, 110, 60), 1))
+        result = apply(index, read(source, index), NODATA)
+
+        # Cells next to nodata take the value of their valid neighbors only
+        valid = result != NODATA
+        self.assertTrue((result[valid] == 1).all())
+        self.assertTrue(valid[:10, :10].all())
+        self.assertFalse(valid[11:, 11:].any())
+
+    def test_near(self):
+
+        index = index_for(Target((10.25, 20.25, 50.25, 60.25), 0.5), 'near')
+        result = apply(index, read(self.source, index), NODATA)
+
+        self.assertTrue(np.isin(result, self.source).all())
+
+    def test_cached_on_disk(self):
+
+        source = Source(SOURCE_GEOTRANSFORM, SOURCE_SHAPE, 'LOCAL_CS["test"]')
+        target = Target((10, 20, 50, 60), 2)
+        index = index_for(target)
+
+        with tempfile.TemporaryDirectory() as td:
+            reproject.save(index, os.path.join(td, f'{reproject.key(source, target)}.npz'))
+            reproject._INDEXES.clear()
+
+            loaded = reproject.cached_index(source, target, cache_dir=td)
+
+        reproject._INDEXES.clear()
+        self.assertEqual(index.window, loaded.window)
+        self.assertEqual(index.geotransform, loaded.geotransform)
+        self.assertEqual(index.taps, loaded.taps)
+        np.testing.assert_array_equal(index.col, loaded.col)
+        np.testing.assert_array_equal(index.sx, loaded.sx)
+
+    def test_key(self):
+
+        source = Source(SOURCE_GEOTRANSFORM, SOURCE_SHAPE, 'LOCAL_CS["test"]')
+        target = Target((10, 20, 50, 60), 2)
+        nudged = source._replace(geotransform=(1e-12, ) + SOURCE_GEOTRANSFORM[1:])
+
+        self.assertEqual(reproject.key(source, target), reproject.key(nudged, target))
+        self.assertNotEqual(reproject.key(source, target), reproject.key(source, target, 'near'))
+        self.assertNotEqual(reproject.key(source, target), reproject.key(source, target._replace(resolution=1)))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
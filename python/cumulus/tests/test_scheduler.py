@@ -0,0 +1,100 @@
+import os
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+from cumulus.ingest.core.scheduler import Calibration, Scheduler
+
+MB = 1024 ** 2
+
+SMALL = types.SimpleNamespace(FOOTPRINT={'memory': (10 * MB, 0), 'tmp': (1 * MB, 0)})
+LARGE = types.SimpleNamespace(FOOTPRINT={'memory': (80 * MB, 0), 'tmp': (1 * MB, 0)})
+
+
+class Recorder:
+    """Task function that records how many tasks run at once"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.overlaps = []
+
+    def __call__(self, name, seconds, workdir):
+        with self.lock:
+            self.running[name] = True
+            self.overlaps.append(set(self.running))
+        with open(os.path.join(workdir, 'scratch'), 'wb') as f:
+            f.write(b'\0' * 4096)
+        time.sleep(seconds)
+        with self.lock:
+            del self.running[name]
+        return name
+
+
+class Test_Scheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.td = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_large_task_does_not_overlap_over_budget(self):
+        """small tasks run together; the large task never runs beside work that would exceed the budget"""
+
+        fn = Recorder()
+        tasks = [('large', LARGE, 0, fn, ('large', 0.2))] + [
+            ('small', SMALL, 0, fn, (f'small{i}', 0.05)) for i in range(6)
+        ]
+        scheduler = Scheduler(memory=100 * MB, tmp=100 * MB, max_workers=4, tmpdir=self.td.name)
+        futures = scheduler.map(tasks)
+
+        self.assertEqual(['large'] + [f'small{i}' for i in range(6)], [f.result() for f in futures])
+        for running in fn.overlaps:
+            self.assertLessEqual(len(running), 4)
+            if 'large' in running:
+                self.assertLessEqual(len(running), 3)
+        self.assertTrue(any(len(r) > 1 for r in fn.overlaps))
+        self.assertEqual([], os.listdir(self.td.name))
+
+    def test_oversized_task_runs_alone(self):
+
+        fn = Recorder()
+        scheduler = Scheduler(memory=50 * MB, tmp=100 * MB, tmpdir=self.td.name)
+        futures = scheduler.map([('large', LARGE, 0, fn, ('large', 0.01)), ('small', SMALL, 0, fn, ('small', 0.01))])
+
+        self.assertEqual(['large', 'small'], [f.result() for f in futures])
+        self.assertTrue(all(len(r) == 1 for r in fn.overlaps))
+
+    def test_exception_is_returned_in_future(self):
+
+        def fail(workdir):
+            raise ValueError('bad input')
+
+        futures = Scheduler(memory=MB, tmp=MB, tmpdir=self.td.name).map([('x', SMALL, 0, fail, ())])
+
+        with self.assertRaises(ValueError):
+            futures[0].result()
+
+    def test_calibration_is_persisted(self):
+        """observations move the ratio toward observed / modeled and survive a reload"""
+
+        path = os.path.join(self.td.name, 'calibration.json')
+        calibration = Calibration(path)
+        for _ in range(20):
+            calibration.observe('mrms', 'tmp', 100, 50)
+        calibration.save()
+
+        ratio = Calibration(path).ratio('mrms', 'tmp')
+        self.assertAlmostEqual(0.5, ratio, places=2)
+        self.assertEqual(1.0, Calibration(path).ratio('mrms', 'memory'))
+
+        scheduler = Scheduler(memory=MB, tmp=MB, calibration=Calibration(path), tmpdir=self.td.name)
+        modeled, estimate = scheduler.estimate('mrms', SMALL, 0)
+        self.assertEqual(int(modeled.tmp * ratio), estimate.tmp)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from cumulus.handyutils.core import scratch as scratch_module
+from cumulus.handyutils.core.scratch import ScratchSpace, ScratchUsage
+
+
+def write(path, nbytes):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * nbytes)
+
+
+class Test_ScratchSpace(unittest.TestCase):
+
+    def setUp(self):
+        self.td = tempfile.TemporaryDirectory()
+        self.usage = ScratchUsage()
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_deleted_after_last_consumer(self):
+        """file and sidecars are removed on the last release; usage and high-water follow"""
+
+        scratch = ScratchSpace(self.td.name, usage=self.usage)
+        a = scratch.path('.tif', consumers=2)
+        write(a, 1000)
+        write(f'{a}.aux.xml', 10)
+        scratch.written(a)
+
+        b = scratch.path('.tif')
+        write(b, 500)
+        scratch.written(b)
+        self.assertEqual(1510, self.usage.current)
+
+        self.assertFalse(scratch.release(a))
+        self.assertTrue(os.path.isfile(a))
+        self.assertTrue(scratch.release(a))
+        self.assertFalse(os.path.exists(a) or os.path.exists(f'{a}.aux.xml'))
+
+        self.assertEqual(500, self.usage.current)
+        self.assertEqual(1510, self.usage.high_water)
+
+        self.usage.reset()
+        self.assertEqual(500, self.usage.high_water)
+
+    def test_close_removes_remaining(self):
+        """files still held when the context exits are removed, including adopted ones"""
+
+        existing = os.path.join(self.td.name, 'download.grib2')
+        write(existing, 100)
+
+        with ScratchSpace(self.td.name, usage=self.usage) as scratch:
+            scratch.adopt(existing, consumers=3)
+            write(scratch.path(), 10)
+
+        self.assertEqual([], os.listdir(self.td.name))
+        self.assertEqual(0, self.usage.current)
+
+    def test_written_again_counts_growth(self):
+        """measuring a file again (e.g. after adding overviews) adds only the difference"""
+
+        scratch = ScratchSpace(self.td.name, usage=self.usage)
+        a = scratch.path()
+        write(a, 100)
+        scratch.written(a)
+        write(a, 300)
+        scratch.written(a)
+
+        self.assertEqual(300, self.usage.current)
+        scratch.release(a)
+        self.assertEqual(0, self.usage.current)
+
+    def test_memory_mode_falls_back_to_disk_over_budget(self):
+        """in memory mode a path whose estimate does not fit VSIMEM_BUDGET goes to <root>"""
+
+        mode, budget = scratch_module.INTERMEDIATES, scratch_module.VSIMEM_BUDGET
+        scratch_module.set_intermediates('memory', 0)
+        try:
+            scratch = ScratchSpace(self.td.name, usage=self.usage)
+            a = scratch.path('.tif', estimate=1)
+            self.assertEqual(self.td.name, os.path.dirname(a))
+            self.assertEqual(1, self.usage.current)
+            self.assertTrue(scratch.path(estimate=0).startswith('/vsimem/'))
+            self.assertFalse(scratch.path(estimate=0, in_memory=False).startswith('/vsimem/'))
+        finally:
+            scratch_module.set_intermediates(mode, budget)
+
+        with self.assertRaises(ValueError):
+            scratch_module.set_intermediates('tape')
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
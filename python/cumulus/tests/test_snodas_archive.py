@@ -0,0 +1,120 @@
+from functools import partial
+import gzip
+import io
+import os
+import sqlite3
+import tarfile
+import tempfile
+import unittest
+
+import numpy as np
+
+from cumulus.snodas.core.archive import ArchiveIndex, completeness, retry_locked, scan_tar
+from cumulus.snodas.core.binary import read_snodas_member
+
+MEMBERS = {
+    'zz_grid.dat.gz': gzip.compress(os.urandom(100000)),
+    'zz_grid.txt.gz': gzip.compress(b'Number of columns: 8192\nNumber of rows: 4096\n'),
+}
+
+
+def write_tar(path, members):
+    with tarfile.open(path, 'w') as t:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            t.addfile(info, io.BytesIO(data))
+
+
+class Test_ArchiveIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.td = tempfile.TemporaryDirectory()
+        self.tar = os.path.join(self.td.name, 'SNODAS_unmasked_20200101.tar')
+        write_tar(self.tar, MEMBERS)
+        self.index = ArchiveIndex(os.path.join(self.td.name, 'index.sqlite3'))
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_read_member_by_offset(self):
+        """members read through the index match their content"""
+
+        self.assertEqual(1, self.index.update([self.tar]))
+        self.assertEqual(0, self.index.update([self.tar]))
+
+        with self.index.open_member(self.tar, 'zz_grid.dat.gz') as f:
+            self.assertEqual(MEMBERS['zz_grid.dat.gz'], f.read())
+        self.assertIn('Number of rows', self.index.read_text(self.tar, 'zz_grid.txt.gz'))
+
+        offset, size = self.index.member(self.tar, 'zz_grid.dat.gz')
+        self.assertEqual(
+            f'/vsigzip//vsisubfile/{offset}_{size},{self.tar}', self.index.vsi_path(self.tar, 'zz_grid.dat.gz')
+        )
+
+    def test_decode_grid_through_index(self):
+        """the SNODAS grid reader decodes a member opened by offset"""
+
+        array = np.arange(-50, 70, dtype='int16').reshape(10, 12)
+        write_tar(self.tar, {'zz_swe.dat.gz': gzip.compress(array.astype('>i2').tobytes())})
+        self.index.update([self.tar])
+
+        result = read_snodas_member(
+            partial(self.index.open_member, self.tar), 'zz_swe', {'lines': 10, 'samples': 12, 'data type': 2, 'byte order': 1}
+        )
+
+        np.testing.assert_array_equal(array, result)
+
+    def test_changed_archive_is_reindexed(self):
+        """rewriting an archive invalidates its entries"""
+
+        self.index.update([self.tar])
+        write_tar(self.tar, {'other.txt.gz': MEMBERS['zz_grid.txt.gz']})
+        os.utime(self.tar, ns=(0, 0))
+
+        self.assertFalse(self.index.is_current(self.tar))
+        self.index.update([self.tar])
+        self.assertEqual(scan_tar(self.tar), [(n, ) + v for n, v in self.index.members(self.tar).items()])
+
+    def test_completeness(self):
+        """missing archives and members are reported"""
+
+        self.index.update([self.tar])
+        report = completeness(
+            self.index,
+            {'20200101': self.tar, '20200102': os.path.join(self.td.name, 'missing.tar')},
+            lambda key: ['zz_grid.dat.gz', 'zz_other.dat.gz'],
+        )
+
+        self.assertEqual(['zz_other.dat.gz'], report['20200101']['missing'])
+        self.assertFalse(report['20200102']['exists'])
+        self.assertEqual(2, len(report['20200102']['missing']))
+
+
+class Test_retry_locked(unittest.TestCase):
+
+    def test_locked_is_retried(self):
+        """a locked database is retried; other errors are raised at once"""
+
+        calls = []
+
+        def locked_twice():
+            calls.append(1)
+            if len(calls) < 3:
+                raise sqlite3.OperationalError('database is locked')
+            return 'ok'
+
+        def missing_table():
+            calls.append(1)
+            raise sqlite3.OperationalError('no such table: members')
+
+        self.assertEqual('ok', retry_locked(locked_twice, backoff=0))
+        self.assertEqual(3, len(calls))
+
+        with self.assertRaises(sqlite3.OperationalError):
+            retry_locked(missing_table, backoff=0)
+        self.assertEqual(4, len(calls))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
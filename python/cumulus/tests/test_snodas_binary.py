@@ -0,0 +1,58 @@
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+
+import numpy as np
+
+from cumulus.snodas.core.binary import read_envi_header, read_snodas_gzip, read_snodas_member, snodas_dtype
+
+DATADIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'cumulus', 'data'))
+
+
+class Test_snodas_binary(unittest.TestCase):
+
+    def setUp(self):
+        self.td = tempfile.TemporaryDirectory()
+        self.header = read_envi_header(os.path.join(DATADIR, 'masked.hdr'))
+        shape = (self.header['lines'], self.header['samples'])
+        self.array = (np.arange(shape[0] * shape[1]) % 42767 - 9999).astype(np.int16).reshape(shape)
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_header(self):
+        """masked header describes a big-endian int16 grid"""
+
+        self.assertEqual((3351, 6935), (self.header['lines'], self.header['samples']))
+        self.assertEqual(np.dtype('>i2'), snodas_dtype(self.header))
+
+    def test_read_member(self):
+        """member is decoded to native byte order with the original values"""
+
+        tar = os.path.join(self.td.name, 'SNODAS_20200101.tar')
+        payload = gzip.compress(self.array.astype('>i2').tobytes())
+        with tarfile.open(tar, 'w') as t:
+            info = tarfile.TarInfo('us_grid.dat.gz')
+            info.size = len(payload)
+            t.addfile(info, io.BytesIO(payload))
+
+        with tarfile.open(tar) as t:
+            result = read_snodas_member(t.extractfile, 'us_grid', self.header)
+
+        self.assertTrue(result.dtype.isnative)
+        np.testing.assert_array_equal(self.array, result)
+
+    def test_wrong_size(self):
+        """truncated or oversized grids raise"""
+
+        data = self.array.astype('>i2').tobytes()
+        for payload in (data[:-2], data + b'\0\0'):
+            with self.assertRaises(ValueError):
+                read_snodas_gzip(io.BytesIO(gzip.compress(payload)), self.header['lines'], self.header['samples'])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
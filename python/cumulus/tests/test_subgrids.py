@@ -0,0 +1,34 @@
+import unittest
+
+from cumulus.geoprocess.core.helpers import buffered_extent, extent_window, union_window, window_geotransform
+
+# SHG 2000 m grid, 1500 rows x 2400 columns, upper left at (-2400000, 3200000)
+GEOTRANSFORM = (-2400000.0, 2000.0, 0.0, 3200000.0, 0.0, -2000.0)
+SHAPE = (1500, 2400)
+
+
+class Test_windows(unittest.TestCase):
+    """Basin windows clipped from one read of a product (geoprocess.core.subgrids)"""
+
+    def test_extent_window(self):
+
+        extent = buffered_extent((-1393500, 1552100, 509100, 3043900), 2, 2000)
+
+        window = extent_window(extent, GEOTRANSFORM, SHAPE)
+
+        self.assertEqual((-1398000, 1548000, 514000, 3048000), extent)
+        self.assertEqual((76, 501, 750, 956), window)
+        self.assertEqual((-1398000, 2000.0, 0.0, 3048000, 0.0, -2000.0), window_geotransform(GEOTRANSFORM, window))
+
+    def test_clipped_and_outside(self):
+
+        self.assertEqual((0, 2390, 5, 10), extent_window((2380000, 3190000, 2500000, 3300000), GEOTRANSFORM, SHAPE))
+        self.assertIsNone(extent_window((2500000, 0, 2600000, 100000), GEOTRANSFORM, SHAPE))
+
+    def test_union_window(self):
+
+        self.assertEqual((10, 5, 30, 45), union_window([(10, 20, 5, 30), (20, 5, 20, 10)]))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+
+from cumulus.geoprocess.core.tiles import map_tiles, tiles
+
+
+def box_sum(a):
+    """3x3 neighborhood sum; cells past the grid edge count as 0"""
+
+    padded = np.pad(a, 1)
+    rows, cols = a.shape
+    return sum(padded[r:r + rows, c:c + cols] for r in range(3) for c in range(3))
+
+
+class Test_tiles(unittest.TestCase):
+
+    def test_windows_cover_grid_once(self):
+
+        shape = (600, 500)
+        covered = np.zeros(shape, dtype=int)
+        for tile in tiles(shape, blocksize=256, halo=10):
+            covered[tile.window] += 1
+            # The window sits at <inner> within the read window
+            (r, c), (ir, ic) = tile.read, tile.inner
+            self.assertEqual(tile.window[0].start, r.start + ir.start)
+            self.assertEqual(tile.window[1].stop, c.start + ic.stop)
+
+        self.assertTrue((covered == 1).all())
+
+    def test_halo_clipped_at_edges(self):
+
+        first, last = tiles((600, 500), blocksize=256, halo=10)[0], tiles((600, 500), blocksize=256, halo=10)[-1]
+
+        self.assertEqual((slice(0, 266), slice(0, 266)), first.read)
+        self.assertEqual((slice(502, 600), slice(246, 500)), last.read)
+        self.assertEqual((slice(10, 98), slice(10, 254)), last.inner)
+
+    def test_active_blocks_only(self):
+
+        active = np.zeros((600, 500), dtype=bool)
+        active[599, 499] = True
+
+        self.assertEqual([(slice(512, 600), slice(256, 500))], [t.window for t in tiles(active.shape, 256, active=active)])
+
+
+class Test_map_tiles(unittest.TestCase):
+
+    def test_halo_matches_whole_grid(self):
+        """a neighborhood operation over tiles with a halo gives the whole-grid result"""
+
+        array = np.random.RandomState(0).randint(0, 100, size=(700, 530)).astype('int32')
+
+        out = map_tiles(box_sum, np.empty_like(array), array, blocksize=128, halo=1, max_workers=4)
+
+        self.assertTrue(np.array_equal(box_sum(array), out))
+
+    def test_without_halo_differs_at_tile_edges(self):
+
+        array = np.ones((256, 256), dtype='int32')
+
+        out = map_tiles(box_sum, np.empty_like(array), array, blocksize=128, max_workers=2)
+
+        self.assertEqual(4, out[127, 127])
+        self.assertEqual(9, box_sum(array)[127, 127])
+
+    def test_serial_and_parallel_agree(self):
+
+        array = np.random.RandomState(1).standard_normal((1000, 300)).astype('float32')
+        active = array > 2
+
+        def fn(a):
+            return np.sqrt(np.abs(a))
+
+        out = np.zeros_like(array)
+        serial = map_tiles(fn, out.copy(), array, active=active, max_workers=1)
+        parallel = map_tiles(fn, out.copy(), array, active=active, max_workers=8)
+
+        np.testing.assert_array_equal(serial, parallel)
+        self.assertTrue(np.array_equal(np.sqrt(array[active]), parallel[active]))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
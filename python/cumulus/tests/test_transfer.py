@@ -0,0 +1,186 @@
+import email
+import email.policy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cumulus.handyutils.core import transfer
+
+PAYLOAD = os.urandom(3 * 1024 * 1024 + 17)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD with ETag; honors Range and If-Range; the first full request to /flaky is cut short"""
+
+    flaky_served = 0
+    etag = '"v1"'
+    posted = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+
+        Handler.posted = (self.headers, self.rfile.read(int(self.headers['Content-Length'])))
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+
+        if self.path == '/missing':
+            self.send_error(404)
+            return
+
+        start = 0
+        rng = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if rng is not None and self.path != '/norange' and if_range in (None, Handler.etag):
+            start = int(rng.split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}')
+        else:
+            self.send_response(200)
+
+        body = PAYLOAD[start:]
+        self.send_header('ETag', Handler.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if self.path == '/flaky' and Handler.flaky_served == 0:
+            Handler.flaky_served += 1
+            self.wfile.write(body[:len(body) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        self.wfile.write(body)
+
+
+class Test_download(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.td = tempfile.TemporaryDirectory()
+        Handler.flaky_served = 0
+        Handler.etag = '"v1"'
+
+    def tearDown(self):
+        self.td.cleanup()
+
+    def test_download_with_checksum(self):
+        """file content and streamed checksum match the payload"""
+
+        outfile = os.path.join(self.td.name, 'file.tif')
+        result = transfer.download(f'{self.url}/file', outfile, algorithm='md5', chunk_size=65536)
+
+        with open(outfile, 'rb') as f:
+            self.assertEqual(PAYLOAD, f.read())
+        self.assertEqual(hashlib.md5(PAYLOAD).hexdigest(), result['checksum'])
+        self.assertFalse(os.path.exists(f'{outfile}.part'))
+
+    def test_resume_after_truncated_response(self):
+        """truncated transfer is resumed with a Range request and the checksum covers both parts"""
+
+        outfile = os.path.join(self.td.name, 'file.tif')
+        result = transfer.download(f'{self.url}/flaky', outfile, algorithm='sha256', backoff=0)
+
+        self.assertEqual(2, result['attempts'])
+        self.assertEqual(len(PAYLOAD), result['size'])
+        self.assertEqual(hashlib.sha256(PAYLOAD).hexdigest(), result['checksum'])
+
+    def test_restart_when_server_ignores_range(self):
+        """partial file is overwritten when the server answers a Range request with 200"""
+
+        outfile = os.path.join(self.td.name, 'file.tif')
+        with open(f'{outfile}.part', 'wb') as f:
+            f.write(b'garbage')
+
+        transfer.download(f'{self.url}/norange', outfile)
+
+        with open(outfile, 'rb') as f:
+            self.assertEqual(PAYLOAD, f.read())
+
+    def test_partial_without_validator_is_discarded(self):
+        """a .part left by something else is not resumed"""
+
+        outfile = os.path.join(self.td.name, 'file.tif')
+        with open(f'{outfile}.part', 'wb') as f:
+            f.write(b'garbage')
+
+        transfer.download(f'{self.url}/file', outfile)
+
+        with open(outfile, 'rb') as f:
+            self.assertEqual(PAYLOAD, f.read())
+        self.assertFalse(os.path.exists(f'{outfile}.part.json'))
+
+    def test_restart_when_object_changed(self):
+        """If-Range with a stale ETag gets the whole object, which replaces the partial file"""
+
+        outfile = os.path.join(self.td.name, 'file.tif')
+        with open(f'{outfile}.part', 'wb') as f:
+            f.write(b'garbage')
+        with open(f'{outfile}.part.json', 'w') as f:
+            json.dump({'url': f'{self.url}/file', 'if_range': '"v0"'}, f)
+
+        result = transfer.download(f'{self.url}/file', outfile, algorithm='md5')
+
+        self.assertEqual(hashlib.md5(PAYLOAD).hexdigest(), result['checksum'])
+        self.assertEqual(len(PAYLOAD), result['size'])
+
+    def test_client_error_is_not_retried(self):
+        """404 raises immediately"""
+
+        with self.assertRaises(transfer.requests.exceptions.HTTPError):
+            transfer.download(f'{self.url}/missing', os.path.join(self.td.name, 'missing.tif'), backoff=0)
+
+    def test_download_many(self):
+        """concurrent downloads return results in request order"""
+
+        items = [(f'{self.url}/file{i}', os.path.join(self.td.name, f'file{i}.tif')) for i in range(8)]
+        results = transfer.download_many(items, max_workers=4, algorithm='md5')
+
+        self.assertEqual([i[1] for i in items], [r['file'] for r in results])
+        self.assertTrue(all(r['checksum'] == hashlib.md5(PAYLOAD).hexdigest() for r in results))
+
+
+    def test_multipart_upload(self):
+        """file is streamed with a Content-Length and followed by the md5 of the bytes sent"""
+
+        infile = os.path.join(self.td.name, 'file.tif')
+        with open(infile, 'wb') as f:
+            f.write(PAYLOAD)
+
+        body = transfer.MultipartUpload(infile, 'file', {'product': 'swe'}, 'md5', chunk_size=65536)
+        r = transfer.get_session().post(f'{self.url}/upload', data=body, headers={'Content-Type': body.content_type})
+
+        headers, posted = Handler.posted
+        message = email.message_from_bytes(
+            f'Content-Type: {headers["Content-Type"]}\r\n\r\n'.encode('utf-8') + posted, policy=email.policy.HTTP
+        )
+        parts = {p.get_param('name', header='content-disposition'): p.get_payload(decode=True) for p in message.iter_parts()}
+
+        self.assertEqual(201, r.status_code)
+        self.assertEqual(len(body), len(posted))
+        self.assertEqual(['product', 'file', 'md5'], list(parts))
+        self.assertEqual(PAYLOAD, parts['file'])
+        self.assertEqual(hashlib.md5(PAYLOAD).hexdigest(), parts['md5'].decode('utf-8'))
+        self.assertEqual(hashlib.md5(PAYLOAD).hexdigest(), body.hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
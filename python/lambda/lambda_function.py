@@ -10,7 +10,13 @@ import psycopg2
 import psycopg2.extras
 import shutil
 
+from cumulus.geoprocess.core.profiles import profile_for, set_concurrency, use_profile
+from cumulus.geoprocess.core.shg import add_companions, expand_wanted
 from cumulus.geoprocess.core.zstats import zstats_generic
+from cumulus.handyutils.core.scratch import USAGE, ScratchSpace
+from cumulus.ingest.core.ledger import coalesce_records, ledger_from_env, object_identity
+from cumulus.ingest.core.loader import COPY_THRESHOLD, load_productfiles
+from cumulus.ingest.core.scheduler import Calibration, Scheduler
 
 # set up logger
 logger = logging.getLogger()
@@ -36,6 +42,9 @@ if os.getenv('CUMULUS_MOCK_S3_UPLOAD', default="False").upper() == "TRUE":
 else:
     # If CUMULUS_MOCK_S3_UPLOAD environment variable is unset then CUMULUS_MOCK_S3_UPLOAD will equal False
     CUMULUS_MOCK_S3_UPLOAD = False
+# CUMULUS_FORCE_REPROCESS
+# (process objects again even if the ingest ledger has seen them)
+CUMULUS_FORCE_REPROCESS = os.getenv('CUMULUS_FORCE_REPROCESS', default="False").upper() == "TRUE"
 ###################################
 
 def get_infile(bucket, key, filepath):
@@ -127,35 +136,135 @@ def get_products():
 
 
 def write_database(entries):
-    
+    """Insert productfile entries; large batches are streamed with COPY (see ingest.core.loader)
+    Raises if the entries could not be committed
+    """
+
+    if len(entries) >= COPY_THRESHOLD:
+        load_productfiles(db_connection, entries)
+        return len(entries)
+
     def dict_to_tuple(d):
         return tuple([d['datetime'], d['file'], d['product_id'], d['version']])
     
     values = [dict_to_tuple(e) for e in entries]
 
+    conn = db_connection()
     try:
-        conn = db_connection()
         c = conn.cursor()
         psycopg2.extras.execute_values(
             c, "INSERT INTO productfile (datetime, file, product_id, version) VALUES %s ON CONFLICT ON CONSTRAINT unique_product_version_datetime DO NOTHING", values,
         )
         conn.commit()
-    except Exception as e:
-        print(e)
-    finally:
         c.close()
+    finally:
         conn.close()
     
     return len(entries)
 
 
+def mock_upload(file_name, directory):
+    """Stand-in for upload_file() when CUMULUS_MOCK_S3_UPLOAD is set; hardlinks <file_name> into <directory>"""
+
+    dst = os.path.join(directory, os.path.basename(file_name))
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(file_name, dst)
+    except OSError:
+        shutil.copy2(file_name, dst)
+
+    return dst
+
+
+def process_record(record, processor, product_map, workdir=None):
+    """Download, process and upload one S3 object in <workdir> (default: a new temporary directory)
+    Returns (list of productfile entries ready for write_database(), True if every upload succeeded)
+    """
+
+    bucket = record['s3']['bucket']['name']
+    key = unquote_plus(record['s3']['object']['key'])
+    filename = key.split('/')[-1]
+
+    with tempfile.TemporaryDirectory(dir=workdir) as td, ScratchSpace(td) as scratch:
+
+        _file = get_infile(bucket, key, os.path.join(td, filename))
+        if _file is None:
+            return [], False
+        # The download is deleted as soon as the processor is done with it
+        scratch.adopt(_file)
+        # Process the file and return a list of files
+        # Processors skip any output that is not a product in the database, except the
+        # native grid of a wanted SHG companion (<filetype>_shg)
+        # GDAL options come from the processor's GDAL_PROFILE
+        wanted = expand_wanted(product_map.keys())
+        with use_profile(profile_for(processor)):
+            outfiles = processor.process(_file, td, wanted=wanted)
+            # Companions the processor did not write from its decoded grids
+            outfiles += add_companions(outfiles, wanted, scratch)
+        logger.debug(f'outfiles: {outfiles}')
+        scratch.release(_file)
+
+        # Keep track of successes to send as single database query at the end
+        successes = []
+        complete = True
+        for _f in outfiles:
+            # Each output is deleted once it has been uploaded
+            scratch.adopt(_f["file"])
+            # See that we have a valid
+            if _f["filetype"] in product_map.keys():
+                # Write output files to different bucket
+                write_key = 'cumulus/{}/{}'.format(_f["filetype"], _f["file"].split("/")[-1])
+                if CUMULUS_MOCK_S3_UPLOAD:
+                    # Mock good upload to S3
+                    upload_success = True
+                    # Link file into tmp directory on host; copy only if /tmp is another filesystem
+                    # Like shutil.copy2, an existing file is overwritten
+                    mock_upload(_f["file"], "/tmp")
+                else:
+                    upload_success = upload_file(
+                        _f["file"], WRITE_TO_BUCKET, write_key
+                    )
+                # Write Productfile Entry to Database
+                if upload_success:
+                    successes.append({
+                        "product_id": product_map[_f["filetype"]],
+                        "datetime": _f['datetime'],
+                        "file": write_key,
+                        "version": _f['version'] if _f['version'] is not None else '1111-11-11T11:11:11.11Z'
+                    })
+                    # Band statistics from processors that compute them while writing
+                    if _f.get("statistics") is not None:
+                        successes[-1]["statistics"] = _f["statistics"]
+                else:
+                    complete = False
+            scratch.release(_f["file"])
+
+    return successes, complete
+
+
 def lambda_handler(event, context=None):
-    """ Lambda handler """
+    """ Lambda handler
 
-    for record in event['Records']:
+    Records for an object already processed with the same ETag and size are answered from the
+    ingest ledger without downloading anything. Set "force": true in the event, or environment
+    variable CUMULUS_FORCE_REPROCESS=True, to process them again.
+    """
 
-        bucket = record['s3']['bucket']['name']
-        key = unquote_plus(record['s3']['object']['key'])
+    force = CUMULUS_FORCE_REPROCESS or bool(event.get('force', False))
+    # High-water mark of intermediate files for this invocation
+    USAGE.reset()
+    ledger = ledger_from_env(db_connection)
+
+    # Look these up once per batch rather than once per record
+    acquirables = get_acquirables()
+    logger.info(f'valid acquirables in database: {acquirables}')
+    product_map = get_products()
+
+    skipped, tasks = [], []
+    for record in coalesce_records(event['Records']):
+
+        bucket, key, etag, size = object_identity(record)
 
         logger.info(f'Lambda triggered by Bucket {bucket}; Key {key}')
 
@@ -165,57 +274,61 @@ def lambda_handler(event, context=None):
         logger.info(f'Process acquirable_name: {acquirable_name}; file: {filename}')
 
         # Check if acquirable is valid in the database
-        acquirables = get_acquirables()
-        logger.info(f'valid acquirables in database: {acquirables}')
         if acquirable_name not in acquirables:
             logger.error(f'acquirable_name not in database: {acquirable_name}')
-            return []
+            continue
+
+        # Short-circuit objects that have already been ingested
+        if ledger is not None and not force:
+            known = ledger.get(bucket, key, etag, size)
+            if known is not None:
+                logger.info(f'Already processed; skipping Key {key}; ETag {etag}; productfiles: {len(known)}')
+                skipped.extend(known)
+                continue
 
         # Find library to unleash on file
         processor = get_infile_processor(acquirable_name)
         logger.info(f'Using processor: {processor}')
-       
-        with tempfile.TemporaryDirectory() as td:
-            
-            _file = get_infile(bucket, key, os.path.join(td, filename))
-            # Process the file and return a list of files
-            outfiles = processor.process(_file, td)
-            logger.debug(f'outfiles: {outfiles}')
-            
-            # Keep track of successes to send as single database query at the end
-            successes = []
-            # Valid products in the database
-            product_map = get_products()
-            for _f in outfiles:
-                # See that we have a valid 
-                if _f["filetype"] in product_map.keys():
-                    # Write output files to different bucket
-                    write_key = 'cumulus/{}/{}'.format(_f["filetype"], _f["file"].split("/")[-1])
-                    if CUMULUS_MOCK_S3_UPLOAD:
-                        # Mock good upload to S3
-                        upload_success = True
-                        # Copy file to tmp directory on host
-                        # shutil.copy2 will overwrite a file if it already exists.
-                        shutil.copy2(_f["file"], "/tmp")
-                    else:
-                        upload_success = upload_file(
-                            _f["file"], WRITE_TO_BUCKET, write_key
-                        )
-                    # Write Productfile Entry to Database
-                    if upload_success:
-                        successes.append({
-                            "product_id": product_map[_f["filetype"]],
-                            "datetime": _f['datetime'],
-                            "file": write_key,
-                            "version": _f['version'] if _f['version'] is not None else '1111-11-11T11:11:11.11Z'
-                        })
-            
-            count = write_database(successes)
-            
-        return {
-            "count": count,
-            "productfiles": successes
-        }
+
+        tasks.append((acquirable_name, processor, size, process_record, (record, processor, product_map)))
+
+    # Records run concurrently while their estimated memory and /tmp footprints fit
+    scheduler = Scheduler(calibration=Calibration())
+    # GDAL threads are shared between the records that can run at once
+    set_concurrency(min(scheduler.max_workers, len(tasks)) or 1)
+    futures = scheduler.map(tasks)
+
+    successes, ingested, failed = [], [], []
+    for (_, _, _, _, (record, _, _)), future in zip(tasks, futures):
+        try:
+            _successes, complete = future.result()
+        except Exception:
+            # One failed record does not cost the rest of the batch its productfiles
+            logger.exception(f'Processing failed; Key {object_identity(record)[1]}')
+            failed.append(object_identity(record)[1])
+            continue
+        successes.extend(_successes)
+        # Do not let the ledger remember a partially uploaded object, or one that produced
+        # nothing (e.g. its product is not in the database yet)
+        if complete and _successes:
+            ingested.append((object_identity(record), _successes))
+
+    USAGE.log('scratch space')
+
+    # Single database query for the whole batch; raises if nothing was committed
+    count = write_database(successes) if successes else 0
+
+    # Only remember objects once their productfiles are in the database
+    if ledger is not None:
+        for identity, _successes in ingested:
+            ledger.record(*identity, _successes)
+
+    return {
+        "count": count,
+        "productfiles": successes,
+        "skipped": skipped,
+        "failed": failed,
+    }
 
 def statistics(event, context=None):
     """ Lambda handler """
@@ -0,0 +1,12 @@
+-- Ingest ledger used by the Lambda when CUMULUS_INGEST_LEDGER=database
+-- (cumulus.ingest.core.ledger.DatabaseLedger). Apply with the Cumulus API schema;
+-- the Lambda's role only needs SELECT, INSERT and UPDATE on it.
+CREATE TABLE IF NOT EXISTS ingest_ledger (
+    bucket VARCHAR NOT NULL,
+    key VARCHAR NOT NULL,
+    etag VARCHAR NOT NULL,
+    size BIGINT,
+    productfiles TEXT NOT NULL,
+    ingested_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (bucket, key, etag)
+);